@@ -0,0 +1,202 @@
+"""Concurrent JSONL batch runner.
+
+Input rows look like ``{"id": ..., "prompt": ..., "model": ..., "system": ...}``;
+only ``prompt`` is required. Results are written as JSONL in completion order.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, Optional, Set, TextIO
+
+from .gemini import build_command
+
+
+class BadRow(dict):
+    """A line of the input that isn't a usable row: {"id": line number, "error": why}."""
+
+
+def read_rows(path: str) -> Iterator[Dict]:
+    """Rows from a JSONL file ('-' for stdin). Rows without an id get their line number.
+
+    The file is opened right away, so a missing one raises OSError here rather
+    than midway through a run. A line that isn't a JSON object or string comes
+    out as a BadRow, so callers can report it and carry on.
+    """
+    fh = sys.stdin if path == "-" else open(path, encoding="utf-8")
+
+    def rows() -> Iterator[Dict]:
+        try:
+            for lineno, line in enumerate(fh, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield BadRow(id=lineno, error=f"line {lineno}: invalid JSON ({e})")
+                    continue
+                if isinstance(row, str):
+                    row = {"prompt": row}
+                if not isinstance(row, dict):
+                    yield BadRow(id=lineno, error=f"line {lineno}: expected an object or a string, got {type(row).__name__}")
+                    continue
+                row.setdefault("id", lineno)
+                yield row
+        finally:
+            if fh is not sys.stdin:
+                fh.close()
+
+    return rows()
+
+
+def row_error(row: Dict) -> Optional[str]:
+    """Why `row` can't be run (a BadRow, or a field that isn't a string), else None."""
+    if isinstance(row, BadRow):
+        return row["error"]
+    for key in ("prompt", "model", "system"):
+        value = row.get(key)
+        if value is not None and not isinstance(value, str):
+            return f"{key} must be a string, got {type(value).__name__}"
+    return None
+
+
+def completed_ids(path: str) -> Set[str]:
+    """Ids already written successfully to an output file (used by --resume)."""
+    done: Set[str] = set()
+    if path == "-" or not Path(path).exists():
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue  # partial line from an interrupted run
+            if isinstance(rec, dict) and "id" in rec and not rec.get("error"):
+                done.add(str(rec["id"]))
+    return done
+
+
+def trim_torn_line(path: str):
+    """Cut a partial last line left by an interrupted run, so appended records start on a fresh line."""
+    try:
+        with open(path, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            # Walk back to the last newline; a file with none is a single torn line
+            pos = size
+            while pos > 0:
+                step = min(64 * 1024, pos)
+                f.seek(pos - step)
+                block = f.read(step)
+                nl = block.rfind(b"\n")
+                if nl >= 0:
+                    f.truncate(pos - step + nl + 1)
+                    return
+                pos -= step
+            f.truncate(0)
+    except FileNotFoundError:
+        pass
+
+
+async def _deepseek(pool, model: str, messages: list) -> Dict:
+    from .scheduler import default_scheduler, request_tokens, usage_tokens
+    est = request_tokens(messages)
+    # 429s and 5xx back off (or move to another endpoint) instead of failing the row
+    async with pool.lease() as lease:
+        resp = await lease.acall(
+            lambda client: client.chat.completions.create(model=model, messages=messages, stream=False),
+            tokens=est,
+        )
+    usage = resp.usage.model_dump() if getattr(resp, "usage", None) else None
+    default_scheduler(lease.name).settle(est, usage_tokens(usage))
+    return {"content": resp.choices[0].message.content, "usage": usage, "endpoint": lease.name}
+
+
+async def _gemini(gemini_cmd: str, prompt: str, model: Optional[str]) -> Dict:
+    cmd = build_command(gemini_cmd, prompt, model)
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+    )
+    out, err = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"gemini exited {proc.returncode}: {err.decode(errors='replace').strip()}")
+    return {"content": out.decode(errors="replace"), "usage": None}
+
+
+async def run_row(
+    row: Dict,
+    client,
+    route: Callable[[str, Optional[str]], str],
+    system: Optional[str] = None,
+    gemini_cmd: str = "gemini",
+) -> Dict:
+    """Run one row and return its result record; errors are captured, never raised."""
+    error = row_error(row)
+    if error:
+        return {"id": row.get("id"), "error": error, "latency_ms": 0.0}
+    prompt = row.get("prompt") or ""
+    model = row.get("model")
+    # Rows without a model go through the same router as `deepgem ask`
+    engine = model or route(prompt, None)
+    rec: Dict = {
+        "id": row["id"],
+        "engine": "gemini" if engine.startswith("gemini") else "deepseek",
+        "model": engine,
+    }
+    t0 = time.perf_counter()
+    try:
+        if engine.startswith("gemini"):
+            from .config import get_config
+            gem_model = get_config().default_gemini_model if engine == "gemini" else engine
+            rec.update(await _gemini(gemini_cmd, prompt, gem_model))
+        else:
+            messages = []
+            if row.get("system") or system:
+                messages.append({"role": "system", "content": row.get("system") or system})
+            messages.append({"role": "user", "content": prompt})
+            rec.update(await _deepseek(client, engine, messages))
+    except Exception as e:
+        rec["error"] = str(e) or type(e).__name__
+    rec["latency_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    return rec
+
+
+async def run_batch(
+    rows: Iterable[Dict],
+    out: TextIO,
+    client,
+    route: Callable[[str, Optional[str]], str],
+    concurrency: int = 8,
+    system: Optional[str] = None,
+    gemini_cmd: str = "gemini",
+    on_result: Optional[Callable[[Dict], None]] = None,
+) -> Dict[str, int]:
+    """Run rows with at most `concurrency` calls in flight, writing each result as it finishes.
+
+    Rows are pulled lazily, so arbitrarily large input files use constant memory.
+    `client` is an endpoints.Pool or a single AsyncOpenAI client.
+    """
+    from .endpoints import as_pool
+    client = as_pool(client, async_client=True)
+    it = iter(rows)
+    counts = {"ok": 0, "error": 0}
+
+    async def worker():
+        for row in it:  # next() never awaits, so sharing the iterator is safe
+            rec = await run_row(row, client, route, system, gemini_cmd)
+            out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            out.flush()
+            counts["error" if rec.get("error") else "ok"] += 1
+            if on_result:
+                on_result(rec)
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return counts
@@ -0,0 +1,292 @@
+"""Benchmarks for deepgem itself (`deepgem bench ...`)."""
+import json
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """Parse `python -X importtime` output into (module, self_us, cumulative_us) rows."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # header line
+        rows.append((parts[2].strip(), int(parts[0]), int(parts[1])))
+    return rows
+
+
+def _timed_run(cmd: List[str]) -> Tuple[float, str]:
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    return (time.perf_counter() - t0) * 1000, proc.stderr
+
+
+def startup_profile(target: str = "deepgem.cli", runs: int = 5) -> Dict:
+    """Cold-start profile of importing `target` in fresh interpreters (medians over `runs`).
+
+    Returns wall-clock times plus a per-package breakdown of import self time,
+    the same numbers `python -X importtime` prints, aggregated.
+    """
+    baseline, wall, help_wall = [], [], []
+    self_us: Dict[str, List[int]] = defaultdict(list)
+    cum_us: Dict[str, List[int]] = defaultdict(list)
+    for _ in range(max(1, runs)):
+        baseline.append(_timed_run([sys.executable, "-c", "pass"])[0])
+        ms, stderr = _timed_run([sys.executable, "-X", "importtime", "-c", f"import {target}"])
+        wall.append(ms)
+        for module, self_time, cumulative in parse_importtime(stderr):
+            self_us[module].append(self_time)
+            cum_us[module].append(cumulative)
+        help_wall.append(_timed_run([sys.executable, "-m", "deepgem", "--help"])[0])
+
+    med = {m: statistics.median(v) for m, v in self_us.items()}
+    packages: Dict[str, float] = defaultdict(float)
+    for module, us in med.items():
+        packages[module.split(".")[0]] += us
+    return {
+        "target": target,
+        "runs": runs,
+        "interpreter_ms": round(statistics.median(baseline), 1),
+        "wall_ms": round(statistics.median(wall), 1),
+        "help_ms": round(statistics.median(help_wall), 1),
+        "import_ms": round(statistics.median(cum_us.get(target, [0])) / 1000, 1),
+        "packages": sorted(((p, round(us / 1000, 2)) for p, us in packages.items()), key=lambda x: -x[1]),
+        "modules": sorted(
+            ((m, round(statistics.median(v) / 1000, 2)) for m, v in cum_us.items()),
+            key=lambda x: -x[1],
+        ),
+    }
+
+
+_FILLER = (
+    "the quarterly report shows revenue growth across classic product lines and "
+    "our team would like a short summary with three bullet points for the board "
+    "please keep the tone neutral and mention risks as well as opportunities "
+).split()
+
+
+def synthetic_prompts(n: int, seed: int = 0) -> List[str]:
+    """Deterministic mix of short/long prompts, some containing routing keywords."""
+    from .router import CODE_HINTS, REASONING_HINTS
+
+    rng = random.Random(seed)
+    hints = list(CODE_HINTS) + list(REASONING_HINTS)
+    prompts = []
+    for _ in range(n):
+        words = rng.choices(_FILLER, k=rng.choice((8, 20, 60, 300)))
+        if rng.random() < 0.4:
+            words.insert(rng.randrange(len(words)), rng.choice(hints))
+        prompts.append(" ".join(words))
+    return prompts
+
+
+def _timed(fn, items) -> Dict:
+    t0 = time.perf_counter()
+    out = [fn(x) for x in items]
+    secs = time.perf_counter() - t0
+    return {"seconds": round(secs, 4), "us_per_prompt": round(secs / max(len(items), 1) * 1e6, 3), "out": out}
+
+
+def router_benchmark(n: int = 100_000, extra_rules: int = 0) -> Dict:
+    """Time the compiled router against the legacy substring scan on `n` prompts.
+
+    With `extra_rules`, also compares both approaches on a larger synthetic rule
+    set, where the substring scan has to test every hint to compute scores.
+    """
+    from .router import DEFAULT_RULES, Router, legacy_pick_engine
+
+    prompts = synthetic_prompts(n)
+    t0 = time.perf_counter()
+    router = Router()
+    compile_s = time.perf_counter() - t0
+
+    legacy = _timed(legacy_pick_engine, prompts)
+    compiled = _timed(lambda p: router.route(p).engine, prompts)
+    res = {
+        "n": n,
+        "mean_chars": statistics.mean(len(p) for p in prompts) if prompts else 0,
+        "rules": len(DEFAULT_RULES),
+        "compile_ms": round(compile_s * 1000, 3),
+        "legacy": {k: v for k, v in legacy.items() if k != "out"},
+        "compiled": {k: v for k, v in compiled.items() if k != "out"},
+        "agreement": sum(a == b for a, b in zip(legacy["out"], compiled["out"])) / max(n, 1),
+    }
+
+    if extra_rules:
+        rng = random.Random(1)
+        words = [
+            "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 10)))
+            for _ in range(extra_rules)
+        ]
+        rules = list(DEFAULT_RULES) + [(w, "gemini", 1.0) for w in words]
+        hints = [r[0] for r in rules]
+        big = Router(rules)
+        scan = _timed(lambda p: [k for k in hints if k in p.lower()], prompts)
+        comp = _timed(big.route, prompts)
+        res["scaled"] = {
+            "rules": len(rules),
+            "legacy_scan": {k: v for k, v in scan.items() if k != "out"},
+            "compiled": {k: v for k, v in comp.items() if k != "out"},
+        }
+    return res
+
+
+# ---------------- Offline suite ----------------
+# Each scenario is one CLI invocation, run end to end against the local stubs
+SCENARIOS = {
+    "chat": ["chat", "--no-cache", "summarise the trade-offs of caching in three bullets"],
+    "ask": ["ask", "--no-cache", "summarise the trade-offs of caching in three bullets"],
+    "ask_gemini": ["ask", "--no-cache", "refactor this python function"],
+    "gem": ["gem", "-p", "list the files in this project"],
+}
+# Metrics where a bigger number is an improvement; everything else is a latency
+HIGHER_IS_BETTER = ("_per_s", ".ok")
+
+
+def _pct(values: List[float], q: float) -> Optional[float]:
+    from .metrics import percentile
+    v = percentile(values, q)
+    return round(v, 1) if v is not None else None
+
+
+def _scenario(name: str, args: List[str], env: Dict[str, str], workdir: Path, runs: int) -> Dict:
+    """Run `deepgem <args>` `runs` times; wall time per run plus TTFT/total from its metrics log."""
+    from .metrics import load
+    log = workdir / f"{name}.jsonl"
+    env = dict(env, DEEPGEM_METRICS_LOG=str(log))
+    wall, failed = [], 0
+    for _ in range(max(1, runs)):
+        t0 = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-m", "deepgem", *args], capture_output=True, text=True, env=env,
+            stdin=subprocess.DEVNULL, timeout=120,
+        )
+        wall.append((time.perf_counter() - t0) * 1000)
+        failed += proc.returncode != 0
+    recs = [r for r in load(log) if not r.get("exit_code")]
+    ttft = [r["ttft_ms"] for r in recs if r.get("ttft_ms") is not None]
+    total = [r["total_ms"] for r in recs if r.get("total_ms") is not None]
+    return {
+        f"{name}.wall_p50_ms": _pct(wall, 50),
+        f"{name}.wall_p95_ms": _pct(wall, 95),
+        f"{name}.ttft_p50_ms": _pct(ttft, 50),
+        f"{name}.total_p50_ms": _pct(total, 50),
+        f"{name}.failed": failed,
+    }
+
+
+def _throughput(env: Dict[str, str], workdir: Path, rows: int, concurrency: int) -> Dict:
+    """`deepgem batch` over `rows` DeepSeek prompts at `concurrency`: rows/s and failures."""
+    src = workdir / "rows.jsonl"
+    with open(src, "w", encoding="utf-8") as f:
+        for i in range(rows):
+            f.write(json.dumps({"id": i, "prompt": f"summarise item {i}", "model": "deepseek-chat"}) + "\n")
+    out = workdir / "results.jsonl"
+    t0 = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "deepgem", "batch", str(src), "-o", str(out), "-c", str(concurrency)],
+        capture_output=True, text=True, env=dict(env, DEEPGEM_METRICS_LOG=str(workdir / "batch.jsonl")),
+        stdin=subprocess.DEVNULL, timeout=600,
+    )
+    secs = time.perf_counter() - t0
+    results = [json.loads(line) for line in out.read_text().splitlines() if line.strip()] if out.exists() else []
+    ok = sum(1 for r in results if not r.get("error"))
+    return {
+        "batch.wall_ms": round(secs * 1000, 1),
+        "batch.rows_per_s": round(ok / secs, 1) if secs else None,
+        "batch.ok": ok,
+        "batch.failed": rows - ok,
+    }
+
+
+def suite(
+    runs: int = 5,
+    rows: int = 200,
+    concurrency: int = 16,
+    ttft: float = 0.05,
+    tokens_per_s: float = 200.0,
+    error_rate: float = 0.0,
+    router_n: int = 20_000,
+    only: Optional[List[str]] = None,
+) -> Dict:
+    """End-to-end benchmarks against a local DeepSeek stub and a fake `gemini`, no network.
+
+    Returns ``{"meta", "config", "metrics"}`` where metrics is a flat
+    ``{"<scenario>.<metric>": number}`` map, so two runs can be diffed with `compare`.
+    """
+    import os
+    import platform
+    import tempfile
+    from . import __version__
+    from .stubs import StubServer, write_fake_gemini
+
+    config = {"runs": runs, "rows": rows, "concurrency": concurrency, "ttft": ttft,
+              "tokens_per_s": tokens_per_s, "error_rate": error_rate, "router_n": router_n}
+    wanted = set(only or list(SCENARIOS) + ["batch", "startup", "router"])
+    metrics: Dict[str, Optional[float]] = {}
+    with tempfile.TemporaryDirectory(prefix="deepgem-bench-") as tmp, \
+            StubServer(ttft=ttft, tokens_per_s=tokens_per_s, error_rate=error_rate, seed=0) as stub:
+        workdir = Path(tmp)
+        env = {
+            k: v for k, v in os.environ.items()
+            if not k.startswith(("DEEPGEM_", "DEEPSEEK_", "GEMINI_"))
+        }
+        env.update(
+            DEEPSEEK_API_KEY="bench", DEEPSEEK_BASE_URL=stub.url,
+            GEMINI_BIN=str(write_fake_gemini(workdir / "gemini", ttft, tokens_per_s)), GEMINI_API_KEY="bench",
+            DEEPGEM_CACHE_DIR=str(workdir / "cache"), DEEPGEM_NO_DAEMON="1", DEEPGEM_NO_BANNER="1",
+            HOME=str(workdir),  # keeps ~/.deepgem.endpoints.json and friends out of the run
+        )
+        for name, args in SCENARIOS.items():
+            if name in wanted:
+                metrics.update(_scenario(name, args, env, workdir, runs))
+        if "batch" in wanted:
+            metrics.update(_throughput(env, workdir, rows, concurrency))
+    if "startup" in wanted:
+        prof = startup_profile(runs=max(1, runs))
+        metrics.update({"startup.import_ms": prof["import_ms"], "startup.help_ms": prof["help_ms"]})
+    if "router" in wanted:
+        res = router_benchmark(router_n)
+        metrics["router.us_per_prompt"] = res["compiled"]["us_per_prompt"]
+    return {
+        "meta": {
+            "deepgem": __version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "config": config,
+        "metrics": metrics,
+    }
+
+
+def compare(old: Dict, new: Dict, threshold: float = 0.1) -> List[Dict]:
+    """Per-metric change from `old` to `new` suite results.
+
+    ``regressed`` is set when a metric got worse by more than `threshold`
+    (a fraction) in its own direction: slower latencies, lower rates.
+    """
+    a, b = old.get("metrics", {}), new.get("metrics", {})
+    rows = []
+    for key in sorted(set(a) | set(b)):
+        before, after = a.get(key), b.get(key)
+        change = None
+        if before not in (None, 0) and after is not None:
+            change = (after - before) / abs(before)
+        higher = key.endswith(HIGHER_IS_BETTER)
+        if key.endswith(".failed"):
+            regressed = (after or 0) > (before or 0)
+        elif change is None:
+            regressed = False
+        else:
+            regressed = -change > threshold if higher else change > threshold
+        rows.append({"metric": key, "old": before, "new": after, "change": change, "regressed": regressed})
+    return rows
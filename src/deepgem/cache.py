@@ -0,0 +1,260 @@
+"""Persistent, content-addressed response cache (SQLite under ~/.cache/deepgem).
+
+Entries are keyed on a hash of the model and the full message list, expire
+after a TTL, and are evicted least-recently-used once the cache grows past
+its size limit. Triggers keep a running byte total in the counters table, so
+a put checks the limit without scanning; hit/miss counters are batched in
+memory and written once per process. Each entry can also carry a SimHash of its prompt (see
+similar.py) so `--similar` can serve it for a near-duplicate request.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import weakref
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_TTL = 24 * 3600            # seconds; DEEPGEM_CACHE_TTL overrides
+DEFAULT_MAX_BYTES = 100 * 2**20    # DEEPGEM_CACHE_MAX_MB overrides
+ACCESS_RESOLUTION = 60.0           # seconds; a hit refreshes `accessed` at most this often
+
+
+def cache_dir() -> Path:
+    """Directory for deepgem's on-disk state (DEEPGEM_CACHE_DIR > XDG_CACHE_HOME > ~/.cache)."""
+    if os.environ.get("DEEPGEM_CACHE_DIR"):
+        return Path(os.environ["DEEPGEM_CACHE_DIR"])
+    base = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return Path(base) / "deepgem"
+
+
+def cache_key(model: str, messages: List[Dict]) -> str:
+    """Stable hash of everything that determines the response."""
+    blob = json.dumps(
+        {"model": model, "messages": messages},
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        from .config import env_number
+        self.path = Path(path) if path else cache_dir() / "responses.sqlite3"
+        self.ttl = ttl if ttl is not None else env_number("DEEPGEM_CACHE_TTL", DEFAULT_TTL, lo=0)
+        if max_bytes is None:
+            mb = env_number("DEEPGEM_CACHE_MAX_MB", None, lo=0)
+            max_bytes = int(mb * 2**20) if mb is not None else DEFAULT_MAX_BYTES
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # isolation_level=None: autocommit; WAL lets parallel CLI runs read while one writes.
+        # check_same_thread=False: the pending counters are flushed at exit from the main thread.
+        self.db = sqlite3.connect(str(self.path), timeout=5, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                content TEXT NOT NULL,
+                usage TEXT,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed);
+            CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            -- Running total of responses.size, so eviction never has to SUM the table
+            CREATE TRIGGER IF NOT EXISTS responses_add AFTER INSERT ON responses BEGIN
+                UPDATE counters SET value = value + new.size WHERE name = 'bytes';
+            END;
+            CREATE TRIGGER IF NOT EXISTS responses_drop AFTER DELETE ON responses BEGIN
+                UPDATE counters SET value = value - old.size WHERE name = 'bytes';
+            END;
+            CREATE TRIGGER IF NOT EXISTS responses_resize AFTER UPDATE OF size ON responses BEGIN
+                UPDATE counters SET value = value + new.size - old.size WHERE name = 'bytes';
+            END;
+            INSERT OR IGNORE INTO counters SELECT 'bytes', COALESCE(SUM(size), 0) FROM responses;
+            -- One covering index per 16-bit band: a lookup never touches the table itself
+            CREATE TABLE IF NOT EXISTS near (
+                key TEXT PRIMARY KEY,
+                scope TEXT NOT NULL,
+                fp INTEGER NOT NULL,
+                b0 INTEGER NOT NULL, b1 INTEGER NOT NULL, b2 INTEGER NOT NULL, b3 INTEGER NOT NULL,
+                text TEXT
+            );
+            CREATE INDEX IF NOT EXISTS near_b0 ON near(b0, scope, fp, key);
+            CREATE INDEX IF NOT EXISTS near_b1 ON near(b1, scope, fp, key);
+            CREATE INDEX IF NOT EXISTS near_b2 ON near(b2, scope, fp, key);
+            CREATE INDEX IF NOT EXISTS near_b3 ON near(b3, scope, fp, key);
+            """
+        )
+        if "text" not in {row[1] for row in self.db.execute("PRAGMA table_info(near)")}:
+            # Older caches: their fingerprints can't be confirmed, so they never match
+            self.db.execute("ALTER TABLE near ADD COLUMN text TEXT")
+        self.pending: Counter = Counter()
+        self._flush = weakref.finalize(self, _flush_counters, self.db, self.pending)
+
+    def close(self):
+        self._flush()
+        self.db.close()
+
+    def _bump(self, name: str):
+        self.pending[name] += 1
+
+    def _live(self, key: str) -> Optional[Dict]:
+        row = self.db.execute(
+            "SELECT model, content, usage, created, accessed FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        now = time.time()
+        if row is None or (self.ttl > 0 and now - row[3] > self.ttl):
+            if row is not None:
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        # LRU order only needs to be coarse: a hit on a recently used entry writes nothing
+        if now - row[4] > ACCESS_RESOLUTION:
+            self.db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return {
+            "model": row[0],
+            "content": row[1],
+            "usage": json.loads(row[2]) if row[2] else None,
+            "created": row[3],
+        }
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return {"content", "usage", "model", "created"} for a live entry, else None."""
+        entry = self._live(key)
+        self._bump("hits" if entry else "misses")
+        return entry
+
+    def put(self, key: str, model: str, content: str, usage: Optional[Dict] = None):
+        usage_json = json.dumps(usage) if usage else None
+        size = len(content.encode("utf-8")) + len(usage_json or "") + len(key)
+        now = time.time()
+        self.db.execute(
+            "INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+            "model = excluded.model, content = excluded.content, usage = excluded.usage, "
+            "size = excluded.size, created = excluded.created, accessed = excluded.accessed",
+            (key, model, content, usage_json, size, now, now),
+        )
+        _flush_counters(self.db, self.pending)
+        self._evict()
+
+    # ---------------- Near-duplicates ----------------
+    def put_similar(self, key: str, scope: str, fp: int, text: str):
+        """Fingerprint the entry stored under `key` (`scope` must match exactly on lookup).
+
+        `text` is the normalized prompt, kept to confirm a fingerprint match.
+        """
+        from .similar import bands, to_signed
+        self.db.execute(
+            "INSERT OR REPLACE INTO near VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, scope, to_signed(fp), *bands(fp), text),
+        )
+
+    def find_similar(self, scope: str, fp: int, text: str, threshold: float) -> Optional[Tuple[Dict, float]]:
+        """Best live entry in `scope` at least `threshold` similar to the normalized prompt `text`.
+
+        Fingerprints within `threshold` are candidates; each must also reach it
+        by Jaccard similarity of the texts, which is what's returned.
+        """
+        from .similar import bands, from_signed, jaccard, similarity
+        b = bands(fp)
+        rows = self.db.execute(
+            " UNION ".join(f"SELECT key, fp FROM near WHERE b{i} = ? AND scope = ?" for i in range(len(b))),
+            [v for band in b for v in (band, scope)],
+        ).fetchall()
+        candidates = sorted(
+            ((similarity(fp, from_signed(v)), key) for key, v in rows), reverse=True
+        )
+        for sim, key in candidates:
+            if sim < threshold:
+                break
+            stored = self.db.execute("SELECT text FROM near WHERE key = ?", (key,)).fetchone()
+            if not stored or stored[0] is None:
+                continue
+            sim = jaccard(text, stored[0])
+            if sim < threshold:
+                continue
+            entry = self._live(key)
+            if entry is not None:
+                self._bump("similar_hits")
+                return entry, sim
+            self.db.execute("DELETE FROM near WHERE key = ?", (key,))
+        return None
+
+    def _evict(self):
+        total = self.db.execute("SELECT value FROM counters WHERE name = 'bytes'").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Free down to 90% so we don't evict on every subsequent put
+        excess = total - int(self.max_bytes * 0.9)
+        victims = []
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self.db.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self.db.executemany("DELETE FROM near WHERE key = ?", victims)
+
+    def prune(self, everything: bool = False) -> int:
+        """Drop expired entries (or all of them) and enforce the size bound. Returns rows removed."""
+        before = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if everything:
+            self.db.execute("DELETE FROM responses")
+        elif self.ttl > 0:
+            self.db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        self._evict()
+        self.db.execute("DELETE FROM near WHERE key NOT IN (SELECT key FROM responses)")
+        after = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        self.db.execute("VACUUM")
+        return before - after
+
+    def stats(self) -> Dict:
+        _flush_counters(self.db, self.pending)
+        entries, size = self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        counters = dict(self.db.execute("SELECT name, value FROM counters"))
+        return {
+            "path": str(self.path),
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "similar_hits": counters.get("similar_hits", 0),
+            "fingerprints": self.db.execute("SELECT COUNT(*) FROM near").fetchone()[0],
+        }
+
+
+def _flush_counters(db: sqlite3.Connection, pending: Counter):
+    """Write batched hit/miss counts; best effort, they are only statistics."""
+    if not pending:
+        return
+    try:
+        db.executemany(
+            "INSERT INTO counters VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            list(pending.items()),
+        )
+    except sqlite3.Error:
+        pass
+    pending.clear()
+
+
+def open_cache() -> Optional[ResponseCache]:
+    """Open the default cache, or None if it is unusable (read-only home, locked DB, ...)."""
+    try:
+        return ResponseCache()
+    except (sqlite3.Error, OSError):
+        return None
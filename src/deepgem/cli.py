@@ -1,8 +1,7 @@
 \
 import os, sys, subprocess, time
-from typing import Optional, List
+from typing import Callable, Optional, List, TYPE_CHECKING
 import typer
-from rich.console import Console
 from pathlib import Path
 
 # Fix Windows console encoding for Unicode characters
@@ -13,32 +12,13 @@ if sys.platform == "win32":
     # Also set console code page to UTF-8
     os.system("chcp 65001 >nul 2>&1")
 
-# Load .env file from home directory (global) and current directory (local)
-home_env = Path.home() / ".deepgem.env"
-local_env = Path.cwd() / ".env"
-
-# Load global env first
-if home_env.exists():
-    with open(home_env) as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith('#') and '=' in line:
-                key, value = line.split('=', 1)
-                if key not in os.environ:  # Don't override existing env vars
-                    os.environ[key] = value.strip('"').strip("'")
-
-# Load local env (can override global)
-if local_env.exists():
-    with open(local_env) as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith('#') and '=' in line:
-                key, value = line.split('=', 1)
-                if key not in os.environ:  # Don't override existing env vars
-                    os.environ[key] = value.strip('"').strip("'")
-
-# OpenAI SDK works with DeepSeek via base_url
-from openai import OpenAI
+# Heavy SDKs (openai, rich) are imported where they are used; env files load on
+# first get_config() call. See `deepgem bench startup`.
+from .config import get_config, reload_config
+from .router import CODE_HINTS  # noqa: F401  (re-exported for existing importers)
+
+if TYPE_CHECKING:
+    from rich.console import Console
 
 # ---------------- Banner ----------------
 BANNER = r"""
@@ -52,79 +32,373 @@ BANNER = r"""
                       deepgem by eeko systems
 """
 
-def maybe_print_banner(con: Console):
-    if os.environ.get("DEEPGEM_NO_BANNER"):
+def maybe_print_banner(con: "Console"):
+    if get_config().no_banner:
         return
     con.print(BANNER, style="bold")
 
 # ---------------- Typer app ----------------
 typer_app = typer.Typer(help="DeepSeek ↔ Gemini CLI agent")
 
-con = Console()
+class LazyConsole:
+    """rich.Console stand-in that imports rich on first use."""
+
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._console = None
+
+    def load(self) -> "Console":
+        """The real Console (for APIs that need one, e.g. rich.live.Live)."""
+        if self._console is None:
+            from rich.console import Console
+            self._console = Console(**self._kwargs)
+        return self._console
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+    def to_stderr(self):
+        """Send everything printed from now on to stderr (stdout carries --output events)."""
+        self._kwargs["stderr"] = True
+        self._console = None
+
+con = LazyConsole()
 
 # ---------------- DeepSeek plumbing ----------------
-def deepseek_client() -> OpenAI:
-    api_key = os.environ.get("DEEPSEEK_API_KEY")
-    if not api_key:
-        con.print("[red]DEEPSEEK_API_KEY not set[/red]")
+def deepseek_pool():
+    """The configured DeepSeek endpoint pool (DEEPGEM_ENDPOINTS, or just DEEPSEEK_API_KEY)."""
+    from .endpoints import Pool, load_endpoints
+    cfg = get_config()
+    try:
+        conf = load_endpoints(cfg.deepseek_endpoints, cfg.deepseek_api_key, cfg.deepseek_base_url)
+    except (OSError, ValueError) as e:
+        con.print(f"[red]{e}[/red]")
         raise typer.Exit(code=2)
-    # DeepSeek is OpenAI-compatible; V3.1 models:
-    #   - deepseek-chat        (non-thinking)
-    #   - deepseek-reasoner    (thinking)
-    return OpenAI(api_key=api_key, base_url="https://api.deepseek.com")
+    pool = Pool(conf["endpoints"], conf["strategy"])
+    if len(pool.endpoints) > 1:
+        from .metrics import RECENT_BYTES, load
+        pool.seed(load(tail_bytes=RECENT_BYTES))
+    return pool
 
 def deepseek_chat(
     prompt: str,
     model: str = "deepseek-chat",
     system: Optional[str] = None,
     stream: bool = True,
+    cache: bool = True,
+    refresh: bool = False,
+    metrics: bool = False,
+    markdown: bool = False,
+    messages: Optional[List[dict]] = None,
+    on_reply: Optional[Callable[[str, Optional[dict]], None]] = None,
+    hedge_after: Optional[float] = None,
+    fallback: Optional[str] = None,
+    truncate: bool = False,
+    similar: Optional[float] = None,
 ) -> int:
-    client = deepseek_client()
-    messages = []
-    if system:
-        messages.append({"role": "system", "content": system})
-    messages.append({"role": "user", "content": prompt})
+    """Send one prompt (or a prebuilt `messages` list) and print the reply.
 
-    try:
-        if stream:
-            resp = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                stream=True,
-            )
-            for chunk in resp:
-                delta = chunk.choices[0].delta if chunk.choices else None
-                if delta and getattr(delta, "content", None):
-                    sys.stdout.write(delta.content)
-                    sys.stdout.flush()
-            sys.stdout.write("\n")
-            return 0
+    `on_reply(content, usage)` is called once a reply has been received in full.
+    With `hedge_after` (seconds) the call is hedged; see hedge.py. A request
+    whose estimated size exceeds the model's context is refused before sending,
+    or with `truncate` has the middle of its longest message cut. With
+    `similar` (or DEEPGEM_SIMILAR) an exact cache miss may be served a reply
+    cached for a near-duplicate prompt at least that similar; see similar.py.
+    """
+    from .metrics import CallTimer
+    timer = CallTimer("deepseek", model)
+    if messages is None:
+        messages = []
+        if system:
+            messages.append({"role": "system", "content": system})
+        messages.append({"role": "user", "content": prompt})
+
+    from .tokens import fit_messages
+    messages, fit = fit_messages(messages, model, truncate)
+    if fit["status"] != "ok":
+        err = LazyConsole(stderr=True)
+        size = f"~{fit['tokens']:,} prompt tokens"
+        if fit["status"] in ("over", "still_over"):
+            from .events import emit
+            emit("error", message=f"{size} won't fit {model}; not sent", tokens=fit["tokens"], limit=fit["limit"])
+            hint = ("even after --truncate cut every message" if fit["status"] == "still_over"
+                    else "(--truncate cuts the middle of the longest message)")
+            err.print(f"[red]{size} won't fit {model}'s ~{fit['limit']:,}; not sent {hint}[/red]")
+            return 2
+        if fit["status"] == "truncated":
+            err.print(f"[yellow]truncated the request to {size} to fit {model}[/yellow]")
         else:
-            resp = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                stream=False,
-            )
-            con.print(resp.choices[0].message.content)
-            return 0
+            err.print(f"[yellow]{size} is close to {model}'s ~{fit['limit']:,} limit[/yellow]")
+
+    # Response cache: --no-cache skips it entirely, --refresh skips the lookup but stores
+    store = key = near = None
+    if cache and not get_config().no_cache:
+        from .cache import open_cache, cache_key
+        store = open_cache()
+        key = cache_key(model, messages)
+    if similar is None:
+        similar = get_config().similar
+    if store and similar is not None:
+        # Only replies cached while --similar is on are fingerprinted (and so findable)
+        from .similar import MAX_TEXT, normalize, simhash, split_request
+        scope, text = split_request(model, messages)
+        norm = normalize(text)
+        if len(norm) <= MAX_TEXT:
+            near = (scope, simhash(norm), norm)
+    if store and not refresh:
+        try:
+            hit = store.get(key)
+            if hit is None and near is not None:
+                found = store.find_similar(*near, similar)
+                if found:
+                    hit = found[0]
+                    timer.extra["similarity"] = round(found[1], 3)
+                    LazyConsole(stderr=True).print(
+                        f"[dim]cached reply to a similar prompt (similarity {found[1]:.2f})[/dim]",
+                        highlight=False,
+                    )
+        except Exception:
+            hit = None
+        if hit:
+            timer.via = "cache"
+            timer.chunk(hit["content"])
+            if stream:
+                from .render import make_renderer
+                replay = make_renderer(markdown, con.load() if markdown else None)
+                replay.write(hit["content"])
+                replay.close()
+            else:
+                _print_response(hit["content"], markdown)
+            if on_reply:
+                on_reply(hit["content"], hit.get("usage"))
+            return _record_metrics(timer, 0, metrics)
+
+    # Deltas are coalesced: immediate on a terminal, block-buffered when piped
+    from .render import make_renderer
+    renderer = make_renderer(markdown, con.load() if markdown else None) if stream else None
+    def on_delta(text: str):
+        timer.chunk(text)
+        if renderer:
+            renderer.write(text)
+
+    if hedge_after is not None:
+        return _hedged_chat(
+            model, messages, hedge_after, fallback, timer, renderer, on_delta,
+            stream, markdown, metrics, store, key, on_reply, near,
+        )
+
+    # Hand off to a warm `deepgem serve` daemon when one is running
+    from .daemon import daemon_chat
+    served = daemon_chat(model, messages, on_delta)
+    if served is not None:
+        timer.via = "daemon"
+        timer.usage = served["usage"]
+        timer.extra["endpoint"] = served.get("endpoint")
+        if renderer:
+            renderer.close(newline=renderer.wrote_any)
+        if served["error"]:
+            con.print(f"[red]DeepSeek error:[/red] {served['error']}")
+            return _record_metrics(timer, 1, metrics, served["error"])
+        if not stream:
+            _print_response(served["content"], markdown)
+        _cache_store(store, key, model, served["content"], served["usage"], near)
+        if on_reply:
+            on_reply(served["content"], served["usage"])
+        return _record_metrics(timer, 0, metrics)
+
+    from .scheduler import default_scheduler, request_tokens, usage_tokens
+    pool = deepseek_pool()
+    lease = pool.lease()
+    est = request_tokens(messages)
+    # Rate limits, backoff and the circuit breaker apply until the response starts
+    def on_retry(attempt: int, delay: float, exc: BaseException):
+        LazyConsole(stderr=True).print(
+            f"[dim]retry {attempt} in {delay:.1f}s: {exc}[/dim]", highlight=False,
+        )
+    try:
+        with lease:
+            if stream:
+                resp = lease.call(lambda client: client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                ), tokens=est, on_retry=on_retry)
+                parts = []
+                for chunk in resp:
+                    if getattr(chunk, "usage", None):
+                        timer.usage = chunk.usage.model_dump()
+                    delta = chunk.choices[0].delta if chunk.choices else None
+                    if delta and getattr(delta, "content", None):
+                        parts.append(delta.content)
+                        on_delta(delta.content)
+                renderer.close()
+                content = "".join(parts)
+            else:
+                resp = lease.call(lambda client: client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    stream=False,
+                ), tokens=est, on_retry=on_retry)
+                content = resp.choices[0].message.content
+                timer.chunk(content)
+                _print_response(content, markdown)
+                timer.usage = resp.usage.model_dump() if getattr(resp, "usage", None) else None
+        default_scheduler(lease.name).settle(est, usage_tokens(timer.usage))
     except Exception as e:
+        timer.extra["endpoint"] = lease.name
+        if renderer:
+            renderer.close(newline=renderer.wrote_any)
         con.print(f"[red]DeepSeek error:[/red] {e}")
-        return 1
+        return _record_metrics(timer, 1, metrics, str(e))
+    timer.extra["endpoint"] = lease.name
+    _cache_store(store, key, model, content, timer.usage, near)
+    if on_reply:
+        on_reply(content, timer.usage)
+    return _record_metrics(timer, 0, metrics)
+
+def _hedged_chat(
+    model, messages, hedge_after, fallback, timer, renderer, on_delta,
+    stream, markdown, metrics, store, key, on_reply, near=None,
+) -> int:
+    """deepseek_chat's hedged path: race the primary against the fallback chain."""
+    from .hedge import HedgeError, chat_attempts, hedged_call
+    # Each DeepSeek attempt leases its own endpoint, so a duplicate lands on the least busy one
+    attempts = chat_attempts(deepseek_pool(), model, messages, fallback, gemini_command())
+    try:
+        res = hedged_call(attempts, hedge_after, on_delta)
+    except HedgeError as e:
+        if renderer:
+            renderer.close(newline=renderer.wrote_any)
+        con.print(f"[red]DeepSeek error:[/red] {e}")
+        return _record_metrics(timer, 1, metrics, str(e))
+    timer.via = "hedged" if len(res.started) > 1 else "direct"
+    timer.usage = res.usage
+    timer.extra = {"winner": res.label, "attempts": res.started}
+    if renderer:
+        renderer.close()
+    else:
+        _print_response(res.content, markdown)
+    if len(res.started) > 1:
+        LazyConsole(stderr=True).print(
+            f"[dim]hedge: {res.label} answered first ({len(res.started)} attempts)[/dim]",
+            highlight=False,
+        )
+    if res.label == model:  # a fallback engine's answer is not cached under this model
+        _cache_store(store, key, model, res.content, res.usage, near)
+    if on_reply:
+        on_reply(res.content, res.usage)
+    return _record_metrics(timer, 0, metrics)
+
+def _print_response(content: str, markdown: bool = False):
+    """Print a complete (non-streamed or cached) response."""
+    from .events import current
+    if current() is not None:
+        current().delta(content)
+        return
+    if markdown and sys.stdout.isatty():
+        from rich.markdown import Markdown
+        con.print(Markdown(content))
+    else:
+        con.print(content)
+
+def _record_metrics(timer, exit_code: int, show: bool, error: Optional[str] = None) -> int:
+    """Append the call's metrics to the local log (and print them with --metrics)."""
+    from .metrics import append, summary_line
+    rec = timer.finish(exit_code, error)
+    append(rec)
+    from .events import current
+    if current() is not None:
+        _emit_call(rec)
+    if show:
+        LazyConsole(stderr=True).print(f"[dim]{summary_line(rec)}[/dim]", highlight=False)
+    return exit_code
+
+def _emit_call(rec: dict):
+    """usage/timing/error events for one finished call (see events.py)."""
+    from .events import emit
+    call = {"engine": rec["engine"], "model": rec["model"]}
+    if rec.get("prompt_tokens") is not None or rec.get("completion_tokens") is not None:
+        emit(
+            "usage", **call, prompt_tokens=rec.get("prompt_tokens"),
+            completion_tokens=rec.get("completion_tokens"), cached_tokens=rec.get("cached_tokens"),
+            cost_usd=rec.get("cost_usd"),
+        )
+    emit(
+        "timing", **call, via=rec.get("via"), ttft_ms=rec.get("ttft_ms"), total_ms=rec.get("total_ms"),
+        tokens_per_s=rec.get("tokens_per_s"), similarity=rec.get("similarity"),
+    )
+    if rec.get("error"):
+        emit("error", **call, message=rec["error"])
+
+def _with_output(output: Optional[str], command: str, run: Callable[[], int], **start) -> int:
+    """Run `run()` with stdout as an --output event stream (or plainly when `output` is None)."""
+    if output is None:
+        return run()
+    from .events import MODES, close_sink, emit, open_sink
+    if output not in MODES:
+        LazyConsole(stderr=True).print(f"[red]--output must be one of: {', '.join(MODES)}[/red]")
+        return 2
+    con.to_stderr()
+    open_sink(output)
+    emit("start", command=command, **start)
+    code = 1
+    try:
+        code = run()
+    except typer.Exit as e:
+        code = e.exit_code
+    finally:
+        emit("end", exit_code=code)
+        close_sink()
+    return code
+
+def _cache_store(store, key: Optional[str], model: str, content: str, usage, near=None) -> None:
+    # A cache write failure (locked DB, full disk) must never fail the call itself
+    if store is None or not content:
+        return
+    try:
+        store.put(key, model, content, usage)
+        if near:
+            store.put_similar(key, *near)
+    except Exception:
+        pass
 
 # ---------------- Gemini CLI plumbing ----------------
+def gemini_command() -> str:
+    """Resolve the Gemini CLI executable (GEMINI_BIN, PATH, or npm dirs on Windows)."""
+    import shutil
+    import platform
+
+    # Try to find gemini more aggressively on Windows
+    gemini_cmd = get_config().gemini_bin
+    if platform.system() == "Windows" and not shutil.which(gemini_cmd):
+        # Check common npm locations on Windows
+        possible_paths = [
+            os.path.join(os.environ.get("APPDATA", ""), "npm", "gemini.cmd"),
+            os.path.join(os.environ.get("USERPROFILE", ""), "AppData", "Roaming", "npm", "gemini.cmd"),
+            "gemini.cmd"
+        ]
+        for path in possible_paths:
+            if os.path.exists(path):
+                gemini_cmd = path
+                break
+    return gemini_cmd
+
 def run_gemini_cli(
     prompt: Optional[str],
     model: Optional[str] = None,
     include_dirs: Optional[str] = None,
     extra: Optional[List[str]] = None,
+    timeout: Optional[float] = None,
+    idle_timeout: Optional[float] = None,
+    metrics: bool = False,
 ) -> int:
     # Requires `gemini` in PATH. Non-interactive uses -p/--prompt.
-    import shutil
     import platform
     import json
     
     # Check if Gemini is configured
-    if not os.environ.get("GEMINI_API_KEY"):
+    if not get_config().gemini_api_key:
         settings_path = Path.home() / ".gemini" / "settings.json"
         if not settings_path.exists() or not settings_path.read_text().strip():
             con.print("\n[yellow]Gemini CLI needs authentication.[/yellow]")
@@ -139,6 +413,7 @@ def run_gemini_cli(
                 api_key = typer.prompt("\nPaste your Gemini API key", hide_input=True)
                 if api_key:
                     os.environ["GEMINI_API_KEY"] = api_key
+                    reload_config()
                     # Save to global .deepgem.env file for persistence
                     global_env_file = Path.home() / ".deepgem.env"
                     with open(global_env_file, "a") as f:
@@ -155,63 +430,77 @@ def run_gemini_cli(
                 con.print("  Then try your command again.")
                 return 0
     
-    # Try to find gemini more aggressively on Windows
-    gemini_cmd = os.environ.get("GEMINI_BIN", "gemini")
-    if platform.system() == "Windows" and not shutil.which(gemini_cmd):
-        # Check common npm locations on Windows
-        possible_paths = [
-            os.path.join(os.environ.get("APPDATA", ""), "npm", "gemini.cmd"),
-            os.path.join(os.environ.get("USERPROFILE", ""), "AppData", "Roaming", "npm", "gemini.cmd"),
-            "gemini.cmd"
-        ]
-        for path in possible_paths:
-            if os.path.exists(path):
-                gemini_cmd = path
-                break
-    
-    cmd: List[str] = [gemini_cmd]
-    if prompt:
-        cmd += ["-p", prompt]
-    if model:
-        cmd += ["-m", model]
-    elif (default := os.environ.get("DEEPGEM_DEFAULT_GEMINI_MODEL")):
-        cmd += ["-m", default]
-    if include_dirs:
-        cmd += ["--include-directories", include_dirs]
-    if extra:
-        cmd += extra
+    from .gemini import build_command
+    from .metrics import CallTimer
+    model = model or get_config().default_gemini_model
+    cmd = build_command(gemini_command(), prompt, model, include_dirs, extra)
+    timer = CallTimer("gemini", model)
 
+    cfg = get_config()
+    timeout = timeout if timeout is not None else cfg.gemini_timeout
+    idle_timeout = idle_timeout if idle_timeout is not None else cfg.gemini_idle_timeout
     try:
-        proc = subprocess.run(cmd, text=True, shell=(platform.system() == "Windows"))
-        return proc.returncode
+        if not prompt:
+            # Interactive session: the child needs our terminal
+            proc = subprocess.run(cmd, text=True, shell=(platform.system() == "Windows"))
+            timer.via = "interactive"
+            return _record_metrics(timer, proc.returncode, metrics)
+        from .gemini import run_streaming
+
+        from .render import make_renderer
+        renderer = make_renderer()
+
+        def echo(stream: str, line: str):
+            if stream == "stdout":
+                timer.chunk(line)
+                renderer.write(line + "\n")
+            else:
+                sys.stderr.write(line + "\n")
+                sys.stderr.flush()
+
+        try:
+            res = run_streaming(cmd, on_line=echo, timeout=timeout, idle_timeout=idle_timeout)
+        finally:
+            renderer.close(newline=False)
+        timer.extra = {"bytes": res.stdout_bytes + res.stderr_bytes, "timed_out": res.timed_out}
+        if res.timed_out:
+            limit = timeout if res.timed_out == "wall" else idle_timeout
+            con.print(
+                f"[red]Gemini CLI {'produced no output for' if res.timed_out == 'idle' else 'ran longer than'} "
+                f"{limit:g}s; stopped it after {res.duration:.1f}s[/red]"
+            )
+        return _record_metrics(timer, res.returncode, metrics)
     except (FileNotFoundError, OSError) as e:
+        from .events import emit
+        emit("error", engine="gemini", message=f"Gemini CLI not found or error: {e}")
         con.print(
             f"[red]Gemini CLI not found or error:[/red] {e}\n"
             "Install with [bold]npm i -g @google/gemini-cli[/bold] or [bold]brew install gemini-cli[/bold]."
         )
         return 127
 
-# ---------------- Simple heuristic router ----------------
-CODE_HINTS = (
-    "code", "bug", "test", "compile", "stack trace", "build", "function",
-    "class", "typescript", "python", "node", "react", "docker", "sql",
-    "write a script", "refactor", "fix", "unit test", "terminal", "shell",
-)
-
+# ---------------- Router ----------------
 def pick_engine(prompt: str, force: Optional[str]) -> str:
     if force in {"gemini", "deepseek-chat", "deepseek-reasoner"}:
         return force
-    p = prompt.lower()
-    if any(k in p for k in CODE_HINTS):
-        return "gemini"                 # let Gemini CLI use tools/MCP/web
-    if len(p) > 1200 or "think step by step" in p or "chain-of-thought" in p:
-        return "deepseek-reasoner"      # heavier reasoning
-    return "deepseek-chat"
+    # Compiled keyword rules (see router.py; user rules in ~/.deepgem.rules.json)
+    from .router import default_router
+    return default_router().route(prompt).engine
 
 # ---------------- Root callback (prints banner) ----------------
+# Commands whose stdout is machine-readable; the banner would corrupt it
+_QUIET_COMMANDS = {"batch", "bench", "fanout", "route", "tokens"}
+
+def _wants_events() -> bool:
+    # The root callback runs before the subcommand parses --output, so look at argv
+    return any(a in ("--output", "-o") or a.startswith("--output=") for a in sys.argv[2:])
+
 @typer_app.callback(invoke_without_command=True)
 def _root(ctx: typer.Context):
-    maybe_print_banner(con)
+    if ctx.invoked_subcommand != "bench":
+        get_config()  # load ~/.deepgem.env and ./.env before the command runs; bench needs neither
+    if ctx.invoked_subcommand not in _QUIET_COMMANDS and not _wants_events():
+        maybe_print_banner(con)
     if ctx.invoked_subcommand is None:
         con.print("[dim]Use 'deepgem --help' to see commands.[/dim]")
 
@@ -222,9 +511,243 @@ def chat(
     model: str = typer.Option("deepseek-chat", "--model", "-m", help="deepseek-chat or deepseek-reasoner"),
     system: Optional[str] = typer.Option(None, "--system", "-s", help="System prompt"),
     no_stream: bool = typer.Option(False, "--no-stream", help="Disable token streaming"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Bypass the on-disk response cache"),
+    refresh: bool = typer.Option(False, "--refresh", help="Ignore cached responses but store the new one"),
+    metrics: bool = typer.Option(False, "--metrics", help="Print latency/token metrics to stderr"),
+    markdown: bool = typer.Option(False, "--markdown", help="Render markdown live (terminal only)"),
+    session: Optional[str] = typer.Option(None, "--session", "-S", help="Continue (or start) a named multi-turn session"),
+    max_context: Optional[int] = typer.Option(None, "--max-context", help="Session history budget in tokens (default 48000)"),
+    hedge: bool = typer.Option(False, "--hedge", help="Hedge slow starts (deadline: learned p95 TTFT, else 4s)"),
+    hedge_after: Optional[float] = typer.Option(None, "--hedge-after", help="Hedge when no first token after this many seconds"),
+    fallback: Optional[str] = typer.Option(None, "--fallback", help="Comma-separated hedge chain, e.g. 'deepseek-chat,gemini' or 'same'"),
+    include: Optional[str] = typer.Option(None, "--include-directories", help="Dirs to index; the most relevant excerpts are sent along (comma-separated)"),
+    context_tokens: Optional[int] = typer.Option(None, "--context-tokens", help="Token budget for --include-directories excerpts (default 6000)"),
+    inputs: List[str] = typer.Option(None, "--input", "-i", help="File to process ('-' for stdin; repeatable); large inputs are map-reduced"),
+    chunk_tokens: int = typer.Option(12_000, "--chunk-tokens", help="Map chunk size for --input"),
+    overlap_tokens: int = typer.Option(200, "--overlap-tokens", help="Overlap between consecutive --input chunks"),
+    concurrency: int = typer.Option(4, "--concurrency", "-j", help="Map calls in flight for --input"),
+    show_partials: bool = typer.Option(False, "--show-partials", help="Print each map result to stderr as it finishes"),
+    truncate: bool = typer.Option(False, "--truncate", help="Cut the middle of a prompt too large for the model instead of refusing it"),
+    similar: Optional[float] = typer.Option(None, "--similar", min=0.5, max=1.0, help="Serve a cached reply to a near-duplicate prompt at least this similar, e.g. 0.98 (or DEEPGEM_SIMILAR)"),
+    output: Optional[str] = typer.Option(None, "--output", "-o", help="Write JSON events to stdout instead of text: 'jsonl' or 'ndjson-stream'"),
 ):
     """Talk to DeepSeek (OpenAI-compatible)."""
-    raise typer.Exit(code=deepseek_chat(prompt, model, system, stream=not no_stream))
+    deadline = _hedge_deadline(model, hedge, hedge_after, fallback)
+    if session and (include or inputs):
+        con.print("[red]--include-directories/--input can't be combined with --session[/red]")
+        raise typer.Exit(code=2)
+    if session and (refresh or similar is not None):
+        con.print("[red]--refresh/--similar can't be combined with --session (sessions never use the response cache)[/red]")
+        raise typer.Exit(code=2)
+
+    def run() -> int:
+        if inputs:
+            return map_reduce_chat(
+                prompt, inputs, model, system, chunk_tokens, overlap_tokens, concurrency,
+                show_partials=show_partials, stream=not no_stream, cache=not no_cache,
+                metrics=metrics, markdown=markdown,
+            )
+        if session:
+            return session_chat(
+                session, prompt, model, system, stream=not no_stream, metrics=metrics,
+                markdown=markdown, budget=max_context, hedge_after=deadline, fallback=fallback,
+                truncate=truncate,
+            )
+        return deepseek_chat(
+            prompt, model, system, stream=not no_stream, cache=not no_cache, refresh=refresh,
+            metrics=metrics, markdown=markdown, hedge_after=deadline, fallback=fallback,
+            messages=_file_context_messages(prompt, system, include, context_tokens), truncate=truncate,
+            similar=similar,
+        )
+    raise typer.Exit(code=_with_output(output, "chat", run, model=model))
+
+def map_reduce_chat(
+    task: str,
+    inputs: List[str],
+    model: str = "deepseek-chat",
+    system: Optional[str] = None,
+    chunk_tokens: int = 12_000,
+    overlap_tokens: int = 200,
+    concurrency: int = 4,
+    show_partials: bool = False,
+    stream: bool = True,
+    cache: bool = True,
+    metrics: bool = False,
+    markdown: bool = False,
+) -> int:
+    """Answer `task` over `inputs`: one call if they fit a chunk, else map, reduce, final reduce."""
+    import itertools
+    from .mapreduce import chunk_text, read_lines, reduce_levels, reduce_prompt, run_map
+
+    def wrap(text: str) -> List[dict]:
+        return ([{"role": "system", "content": system}] if system else []) + [{"role": "user", "content": text}]
+
+    try:
+        # Check every input now: later ones are only opened once the map step is under way
+        for path in inputs:
+            if path != "-":
+                open(path, "rb").close()
+        chunks = chunk_text(read_lines(inputs), chunk_tokens, overlap_tokens)
+        first, second = next(chunks, None), next(chunks, None)
+    except OSError as e:
+        con.print(f"[red]Can't read input:[/red] {e}")
+        return 2
+    if first is None:
+        con.print("[red]--input is empty[/red]")
+        return 2
+    if second is None:  # fits in one call: no map step
+        return deepseek_chat(
+            task, model, stream=stream, cache=cache, metrics=metrics, markdown=markdown,
+            messages=wrap(f"{task}\n\n<input>\n{first}\n</input>"),
+        )
+
+    import threading
+    pool = deepseek_pool()
+    use_cache = cache and not get_config().no_cache
+    local = threading.local()  # SQLite connections can't cross threads
+    err = LazyConsole(stderr=True)
+
+    def complete(text: str) -> str:
+        """One non-streamed call; map results are cached, so re-running over the same input is cheap."""
+        from .cache import cache_key, open_cache
+        from .metrics import CallTimer, append
+        from .scheduler import request_tokens
+        if use_cache and not hasattr(local, "store"):
+            local.store = open_cache()
+        store = getattr(local, "store", None)
+        messages = wrap(text)
+        key = cache_key(model, messages)
+        hit = store.get(key) if store else None
+        if hit:
+            return hit["content"]
+        timer = CallTimer("deepseek", model)
+        timer.via = "map"
+        try:
+            with pool.lease() as lease:
+                resp = lease.call(lambda client: client.chat.completions.create(
+                    model=model, messages=messages, stream=False,
+                ), tokens=request_tokens(messages))
+        except Exception as e:
+            append(timer.finish(1, str(e)))
+            raise
+        content = resp.choices[0].message.content or ""
+        timer.chunk(content)
+        timer.usage = resp.usage.model_dump() if getattr(resp, "usage", None) else None
+        timer.extra["endpoint"] = lease.name
+        append(timer.finish(0))
+        _cache_store(store, key, model, content, timer.usage)
+        return content
+
+    def on_partial(part):
+        status = f"[red]failed: {part.error}[/red]" if part.error else f"{len(part.text)} chars"
+        err.print(
+            f"[dim]map: part {part.index + 1} ({part.chars // 1024} KiB) done in {part.seconds:.1f}s,[/dim] {status}",
+            highlight=False,
+        )
+        if show_partials and part.text:
+            err.print(part.text, markup=False, highlight=False)
+
+    partials = run_map(itertools.chain([first, second], chunks), task, complete, concurrency, on_partial)
+    failed = [p for p in partials if p.error]
+    if len(failed) == len(partials):
+        con.print(f"[red]All {len(partials)} map calls failed[/red]")
+        return 1
+    if failed:
+        err.print(f"[yellow]{len(failed)} of {len(partials)} parts failed; reducing the rest[/yellow]")
+    texts = reduce_levels(
+        task, [p.text for p in partials if not p.error], complete, chunk_tokens, concurrency,
+        on_level=lambda level, groups: err.print(f"[dim]reduce: level {level}, {groups} groups[/dim]"),
+        on_error=lambda level, group, error: err.print(
+            f"[yellow]reduce: level {level}, group {group + 1} failed ({error}); keeping its parts unreduced[/yellow]",
+            highlight=False,
+        ),
+    )
+    err.print(f"[dim]reduce: combining {len(texts)} partial result(s)[/dim]")
+    return deepseek_chat(
+        task, model, stream=stream, cache=cache, metrics=metrics, markdown=markdown,
+        messages=wrap(reduce_prompt(task, texts)),
+    )
+
+def _file_context_messages(
+    prompt: str, system: Optional[str], include: Optional[str], budget: Optional[int] = None,
+) -> Optional[List[dict]]:
+    """Messages with the best-matching excerpts of `include` inlined ahead of the prompt.
+
+    None (deepseek_chat builds the plain messages) when there is nothing to include.
+    """
+    if not include:
+        return None
+    from .index import build_context
+    context, st = build_context(prompt, include, budget)
+    LazyConsole(stderr=True).print(
+        f"[dim]context: {st['chunks']} excerpt(s) from {st['files']} file(s); "
+        f"{st['scanned']} scanned, {st['reindexed']} reindexed[/dim]",
+        highlight=False,
+    )
+    if not context:
+        return None
+    messages = [{"role": "system", "content": system}] if system else []
+    # Context first, question last: a repeated question over unchanged files reuses the cached prefix
+    messages.append({"role": "user", "content": f"{context}\n\n---\n\n{prompt}"})
+    return messages
+
+def _hedge_deadline(model: str, hedge: bool, hedge_after: Optional[float], fallback: Optional[str]) -> Optional[float]:
+    """Seconds before hedging, or None when hedging is off (--hedge-after/--fallback imply --hedge)."""
+    if not (hedge or hedge_after is not None or fallback):
+        return None
+    from .hedge import hedge_deadline
+    return hedge_deadline(model, hedge_after)
+
+def session_chat(
+    name: str,
+    prompt: str,
+    model: str = "deepseek-chat",
+    system: Optional[str] = None,
+    stream: bool = True,
+    metrics: bool = False,
+    markdown: bool = False,
+    budget: Optional[int] = None,
+    hedge_after: Optional[float] = None,
+    fallback: Optional[str] = None,
+    truncate: bool = False,
+) -> int:
+    """One turn of a named session: send the trimmed history, append the exchange."""
+    sess = _open_session(name)
+    if system:
+        if sess.system is None and not sess.messages:
+            sess.set_system(system)
+        elif system != sess.system:
+            con.print(f"[yellow]Session {name!r} keeps its original system prompt[/yellow]")
+    messages = sess.context(prompt, budget)
+    err = LazyConsole(stderr=True)
+
+    def on_reply(content: str, usage: Optional[dict]):
+        from .metrics import cached_prompt_tokens
+        sess.record(prompt, content, usage)
+        line = f"session {name}: {len(messages)} messages sent"
+        if usage and usage.get("prompt_tokens") is not None:
+            cached = cached_prompt_tokens(usage) or 0
+            line += (
+                f" · {usage['prompt_tokens']} prompt tokens, {cached} cached"
+                f" ({cached / max(usage['prompt_tokens'], 1):.0%})"
+            )
+        err.print(f"[dim]{line}[/dim]", highlight=False)
+
+    # The response cache is skipped: asking again within a session should get a fresh reply
+    return deepseek_chat(
+        prompt, model, stream=stream, cache=False, metrics=metrics, markdown=markdown,
+        messages=messages, on_reply=on_reply, hedge_after=hedge_after, fallback=fallback,
+        truncate=truncate,
+    )
+
+def _open_session(name: str):
+    """sessions.Session(name), with an invalid name reported as a usage error."""
+    from .sessions import Session
+    try:
+        return Session(name)
+    except ValueError as e:
+        con.print(f"[red]{e}[/red]")
+        raise typer.Exit(code=2)
 
 @typer_app.command()
 def gem(
@@ -232,9 +755,19 @@ def gem(
     model: Optional[str] = typer.Option(None, "--model", "-m", help="Gemini model, e.g. gemini-2.5-pro"),
     include: Optional[str] = typer.Option(None, "--include-directories", help="Comma-separated dirs to include as context"),
     extra: List[str] = typer.Argument(None, help="Pass-through args to `gemini`"),
+    timeout: Optional[float] = typer.Option(None, "--timeout", help="Stop Gemini after this many seconds (with --prompt)"),
+    idle_timeout: Optional[float] = typer.Option(None, "--idle-timeout", help="Stop Gemini after this many seconds without output"),
+    metrics: bool = typer.Option(False, "--metrics", help="Print latency metrics to stderr"),
+    output: Optional[str] = typer.Option(None, "--output", "-o", help="Write JSON events to stdout instead of text: 'jsonl' or 'ndjson-stream'"),
 ):
     """Delegate to Gemini CLI (great for coding, shell tools, MCP, web)."""
-    raise typer.Exit(code=run_gemini_cli(prompt, model, include, extra))
+    if output and not prompt:
+        con.print("[red]--output needs --prompt (an interactive session has no event stream)[/red]")
+        raise typer.Exit(code=2)
+    raise typer.Exit(code=_with_output(
+        output, "gem", lambda: run_gemini_cli(prompt, model, include, extra, timeout, idle_timeout, metrics),
+        model=model or get_config().default_gemini_model,
+    ))
 
 @typer_app.command()
 def ask(
@@ -242,17 +775,633 @@ def ask(
     force: Optional[str] = typer.Option(None, "--force", "-f", help="'gemini' | 'deepseek-chat' | 'deepseek-reasoner'"),
     system: Optional[str] = typer.Option(None, "--system", "-s"),
     gem_model: Optional[str] = typer.Option(None, "--gem-model", help="Override Gemini model"),
-    include: Optional[str] = typer.Option(None, "--include-directories", help="Dirs gemini should scan (comma-separated)"),
+    include: Optional[str] = typer.Option(None, "--include-directories", help="Dirs gemini should scan, or DeepSeek gets excerpts from (comma-separated)"),
+    context_tokens: Optional[int] = typer.Option(None, "--context-tokens", help="Token budget for excerpts sent to DeepSeek (default 6000)"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Bypass the on-disk response cache"),
+    refresh: bool = typer.Option(False, "--refresh", help="Ignore cached responses but store the new one"),
+    metrics: bool = typer.Option(False, "--metrics", help="Print latency/token metrics to stderr"),
+    markdown: bool = typer.Option(False, "--markdown", help="Render DeepSeek markdown live (terminal only)"),
+    hedge: bool = typer.Option(False, "--hedge", help="Hedge slow DeepSeek starts (deadline: learned p95 TTFT, else 4s)"),
+    hedge_after: Optional[float] = typer.Option(None, "--hedge-after", help="Hedge when no first token after this many seconds"),
+    fallback: Optional[str] = typer.Option(None, "--fallback", help="Comma-separated hedge chain, e.g. 'deepseek-chat,gemini'"),
+    learned: bool = typer.Option(False, "--learned", help="Route with the model trained by `deepgem router train` (or DEEPGEM_ROUTER=learned)"),
+    explain: bool = typer.Option(False, "--explain", help="Show why the engine was picked"),
+    truncate: bool = typer.Option(False, "--truncate", help="Cut the middle of a prompt too large for DeepSeek instead of refusing it"),
+    similar: Optional[float] = typer.Option(None, "--similar", min=0.5, max=1.0, help="Serve a cached DeepSeek reply to a near-duplicate prompt at least this similar (or DEEPGEM_SIMILAR)"),
+    output: Optional[str] = typer.Option(None, "--output", "-o", help="Write JSON events to stdout instead of text: 'jsonl' or 'ndjson-stream'"),
 ):
     """Smart router: Gemini CLI for code/tool tasks; DeepSeek for chat/reasoning."""
+    def run() -> int:
+        from .events import emit
+        from .router import default_router
+        rule = default_router().route(prompt)
+        decision = rule
+        if learned or get_config().router == "learned":
+            from .learned import LearnedRouter
+            model = LearnedRouter.load()
+            if model is None:
+                con.print("[yellow]No learned router yet (run `deepgem router train`); using keyword rules[/yellow]")
+            else:
+                decision = model.route(prompt, rule)
+        engine = force if force in {"gemini", "deepseek-chat", "deepseek-reasoner"} else decision.engine
+        con.print(f"[dim]engine:[/dim] {engine}")
+        emit("route", engine=engine, reason="--force" if engine != decision.engine else decision.reason,
+             matches=list(decision.matches) or None)
+        if explain:
+            _explain_route(prompt, engine, decision, forced=engine != decision.engine)
+
+        t0 = time.perf_counter()
+        usage: dict = {}
+        if engine == "gemini":
+            code = run_gemini_cli(prompt, gem_model, include, extra=None, metrics=metrics)
+        else:
+            code = deepseek_chat(
+                prompt, engine, system, stream=True, cache=not no_cache, refresh=refresh,
+                metrics=metrics, markdown=markdown,
+                hedge_after=_hedge_deadline(engine, hedge, hedge_after, fallback), fallback=fallback,
+                messages=_file_context_messages(prompt, system, include, context_tokens),
+                on_reply=lambda content, u: usage.update(u or {}), truncate=truncate, similar=similar,
+            )
+        from .learned import record
+        record(
+            prompt, engine, code, (time.perf_counter() - t0) * 1000, usage.get("total_tokens"),
+            predicted=decision.engine, forced=engine != decision.engine,
+        )
+        return code
+    raise typer.Exit(code=_with_output(output, "ask", run))
+
+def _explain_route(prompt: str, engine: str, decision, forced: bool):
+    err = LazyConsole(stderr=True)
+    why = "--force" if forced else decision.reason
+    err.print(f"[dim]route:[/dim] {engine} [dim]({why})[/dim]")
+    if decision.matches:
+        err.print(f"[dim]  keywords:[/dim] {', '.join(decision.matches)}")
+    for e, score in sorted(decision.scores.items(), key=lambda kv: -kv[1]):
+        err.print(f"[dim]  {e:<18}[/dim] {score:.3f}")
+    if decision.reason.startswith("learned"):
+        from .learned import LearnedRouter
+        model = LearnedRouter.load()
+        for e, feats in model.explain(prompt).top.items():
+            if feats:
+                err.print(f"[dim]  {e} features:[/dim] " + ", ".join(f"{n} {w:+.2f}" for n, w in feats))
+
+@typer_app.command()
+def watch(
+    prompt: str = typer.Argument(..., help="Prompt to re-run on every change, e.g. 'Review these changes'"),
+    include: str = typer.Option(..., "--include-directories", help="Dirs to watch and send as context (comma-separated)"),
+    force: Optional[str] = typer.Option(None, "--force", "-f", help="'gemini' | 'deepseek-chat' | 'deepseek-reasoner' (default: routed once, like ask)"),
+    gem_model: Optional[str] = typer.Option(None, "--gem-model", help="Override Gemini model"),
+    interval: float = typer.Option(0.5, "--interval", help="Seconds between scans for changes"),
+    debounce: float = typer.Option(0.3, "--debounce", help="Wait until files have been quiet this long before running"),
+    full: bool = typer.Option(False, "--full", help="Send the full directory context every run instead of diffs"),
+):
+    """Re-run a prompt whenever files under --include-directories change."""
+    from .index import split_dirs
+    from .watch import Watcher, run_loop
+    roots = [d for d in split_dirs(include) if Path(d).expanduser().is_dir()]
+    if not roots:
+        con.print("[red]--include-directories names no existing directory[/red]")
+        raise typer.Exit(code=2)
     engine = pick_engine(prompt, force)
-    con.print(f"[dim]engine:[/dim] {engine}")
-    if engine == "gemini":
-        raise typer.Exit(code=run_gemini_cli(prompt, gem_model, include, extra=None))
-    elif engine == "deepseek-reasoner":
-        raise typer.Exit(code=deepseek_chat(prompt, "deepseek-reasoner", system, stream=True))
+    err = LazyConsole(stderr=True)
+
+    def build_cmd(text: str, with_context: bool) -> List[str]:
+        cmd = [sys.executable, "-m", "deepgem", "ask", text, "--force", engine]
+        if with_context:
+            cmd += ["--include-directories", ",".join(roots)]
+        if gem_model:
+            cmd += ["--gem-model", gem_model]
+        return cmd
+
+    def notify(message: str):
+        err.print(f"[dim]watch: {message}[/dim]", highlight=False)
+
+    def echo(stream: str, line: str):
+        out = sys.stdout if stream == "stdout" else sys.stderr
+        out.write(line + "\n")
+        out.flush()
+
+    # Children stream through a pipe: flush their output periodically and skip the banner
+    os.environ.setdefault("DEEPGEM_FLUSH_INTERVAL", "0.05")
+    os.environ["DEEPGEM_NO_BANNER"] = "1"
+    watcher = Watcher(roots, interval, debounce)
+    notify(f"{len(watcher.tree.digests)} file(s) under {', '.join(roots)}; engine {engine}; Ctrl-C to stop")
+    try:
+        run_loop(watcher, prompt, build_cmd, notify, echo, full=full)
+    except KeyboardInterrupt:
+        notify("stopped")
+
+def _read_rows(path: str):
+    """batch.read_rows, with an unreadable input file reported as a usage error."""
+    from .batch import read_rows
+    try:
+        return read_rows(path)
+    except OSError as e:
+        con.print(f"[red]Can't read {path}:[/red] {e}")
+        raise typer.Exit(code=2)
+
+@typer_app.command()
+def batch(
+    input: str = typer.Argument(..., help="JSONL file of {id, prompt, model, system} rows ('-' for stdin)"),
+    output: str = typer.Option("-", "--output", "-o", help="Where to write JSONL results ('-' for stdout)"),
+    concurrency: int = typer.Option(8, "--concurrency", "-c", help="Max requests in flight"),
+    system: Optional[str] = typer.Option(None, "--system", "-s", help="Default system prompt for rows without one"),
+    resume: bool = typer.Option(False, "--resume", help="Skip ids already written successfully to --output"),
+):
+    """Run many prompts concurrently; results stream out as JSONL as they finish."""
+    import asyncio
+    from .batch import completed_ids, run_batch, trim_torn_line
+
+    if resume and output == "-":
+        con.print("[red]--resume needs an --output file[/red]")
+        raise typer.Exit(code=2)
+    done = completed_ids(output) if resume else set()
+    rows = (r for r in _read_rows(input) if str(r["id"]) not in done)
+    err = LazyConsole(stderr=True)
+    if done:
+        err.print(f"[dim]resume: skipping {len(done)} completed id(s)[/dim]")
+
+    pool = deepseek_pool()
+    if output != "-":
+        trim_torn_line(output)   # an interrupted run may have left half a record
+    out = sys.stdout if output == "-" else open(output, "a", encoding="utf-8")
+    t0 = time.perf_counter()
+    try:
+        counts = asyncio.run(run_batch(
+            rows, out, pool, pick_engine,
+            concurrency=concurrency, system=system, gemini_cmd=gemini_command(),
+        ))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    err.print(
+        f"[dim]batch: {counts['ok']} ok, {counts['error']} failed "
+        f"in {time.perf_counter() - t0:.1f}s[/dim]"
+    )
+    raise typer.Exit(code=1 if counts["error"] else 0)
+
+@typer_app.command()
+def serve(
+    keepalive: float = typer.Option(55.0, "--keepalive", help="Seconds between idle pings that keep the connection warm (0 = off)"),
+):
+    """Run a warm daemon; chat/ask route through it while it is up."""
+    from .daemon import Daemon, supported
+    if not supported():
+        con.print("[red]deepgem serve needs Unix domain sockets, which this platform lacks[/red]")
+        raise typer.Exit(code=2)
+    daemon = Daemon(deepseek_pool(), log=lambda msg: con.print(f"[dim]serve:[/dim] {msg}"))
+    try:
+        daemon.serve_forever(keepalive=keepalive)
+    except RuntimeError as e:
+        con.print(f"[red]{e}[/red]")
+        raise typer.Exit(code=1)
+    except KeyboardInterrupt:
+        pass
+
+@typer_app.command()
+def fanout(
+    prompts: List[str] = typer.Option(None, "--prompt", "-p", help="Prompt to run (repeatable)"),
+    prompts_file: Optional[str] = typer.Option(None, "--prompts-file", help="One prompt per line, or JSONL rows with a 'prompt' field"),
+    include: List[str] = typer.Option(None, "--include-directories", help="Target dirs; each one becomes its own task (repeatable)"),
+    model: Optional[str] = typer.Option(None, "--model", "-m", help="Gemini model, e.g. gemini-2.5-pro"),
+    max_workers: int = typer.Option(4, "--max-workers", "-j", help="Gemini processes to run at once"),
+    timeout: Optional[float] = typer.Option(None, "--timeout", help="Per-task timeout in seconds"),
+    idle_timeout: Optional[float] = typer.Option(None, "--idle-timeout", help="Kill a task after this many seconds without output"),
+    as_completed: bool = typer.Option(False, "--as-completed", help="Print results as they finish instead of in order"),
+    as_json: bool = typer.Option(False, "--json", help="Emit one JSON record per task"),
+):
+    """Run many `gemini -p` tasks concurrently (prompts x include-directories)."""
+    import json
+    from .gemini import GeminiTask, fan_out
+
+    all_prompts = list(prompts or [])
+    if prompts_file:
+        if prompts_file.endswith(".jsonl"):
+            from .batch import BadRow
+            for r in _read_rows(prompts_file):
+                if isinstance(r, BadRow) or not r.get("prompt"):
+                    con.print(f"[red]{prompts_file}:[/red] {r.get('error') or 'row ' + str(r['id']) + ' has no prompt'}")
+                    raise typer.Exit(code=2)
+                all_prompts.append(r["prompt"])
+        else:
+            with open(prompts_file, encoding="utf-8") as f:
+                all_prompts += [line.strip() for line in f if line.strip()]
+    if not all_prompts:
+        con.print("[red]Give at least one --prompt or a --prompts-file[/red]")
+        raise typer.Exit(code=2)
+    tasks = [GeminiTask(p, d) for p in all_prompts for d in (include or [None])]
+
+    failed = 0
+    for res in fan_out(
+        tasks, gemini_command(), model or get_config().default_gemini_model,
+        max_workers=max_workers, timeout=timeout, idle_timeout=idle_timeout, ordered=not as_completed,
+    ):
+        failed += res.returncode != 0
+        if as_json:
+            sys.stdout.write(json.dumps(res.to_dict(), ensure_ascii=False) + "\n")
+            sys.stdout.flush()
+            continue
+        status = f"[red]timed out ({res.timed_out})[/red]" if res.timed_out else (
+            "[green]ok[/green]" if res.returncode == 0 else f"[red]exit {res.returncode}[/red]")
+        target = f" [dim]({res.include_dirs})[/dim]" if res.include_dirs else ""
+        con.rule(f"[{res.index + 1}/{len(tasks)}] {res.prompt[:60]}{target} · {status} · {res.duration:.1f}s")
+        if res.stdout:
+            con.print(res.stdout.rstrip(), markup=False, highlight=False)
+        if res.returncode != 0 and res.stderr:
+            con.print(res.stderr.rstrip(), style="red", markup=False, highlight=False)
+    raise typer.Exit(code=1 if failed else 0)
+
+@typer_app.command()
+def route(
+    input: str = typer.Argument(..., help="JSONL file of {id, prompt} rows ('-' for stdin)"),
+    output: str = typer.Option("-", "--output", "-o", help="Where to write JSONL decisions ('-' for stdout)"),
+):
+    """Classify every prompt in a JSONL file with the ask router, in one pass."""
+    import json
+    from .router import route_rows
+
+    rows = _read_rows(input)
+    out = sys.stdout if output == "-" else open(output, "w", encoding="utf-8")
+    try:
+        for rec in route_rows(rows):
+            out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+@typer_app.command()
+def tokens(
+    text: Optional[str] = typer.Argument(None, help="Text to count (omit to read --file or stdin)"),
+    files: List[str] = typer.Option(None, "--file", "-f", help="File to count ('-' for stdin; repeatable)"),
+    jsonl: bool = typer.Option(False, "--jsonl", help="Input is batch JSONL; write {id, tokens, cost_usd} per row"),
+    model: str = typer.Option("deepseek-chat", "--model", "-m", help="Model for the context limit and prices"),
+    output_tokens: int = typer.Option(0, "--output-tokens", help="Expected reply tokens to include in the cost"),
+):
+    """Estimate tokens and cost locally, before sending anything."""
+    import json
+    from .tokens import MESSAGE_OVERHEAD, context_limit, cost, estimate, estimate_many
+    err = LazyConsole(stderr=True)
+    sources = list(files or []) or ["-"]
+    t0 = time.perf_counter()
+    if jsonl:
+        from .batch import BadRow
+        total = rows = 0
+        for src in sources:
+            batch = []
+            for row in _read_rows(src):
+                if isinstance(row, BadRow):
+                    sys.stdout.write(json.dumps(row) + "\n")
+                else:
+                    batch.append(row)
+            counts = estimate_many(
+                "\n".join(filter(None, (r.get("system"), r.get("prompt")))) for r in batch
+            )
+            for row, n in zip(batch, counts):
+                n += MESSAGE_OVERHEAD * (2 if row.get("system") else 1)
+                usd = cost(row.get("model") or model, n, output_tokens)
+                sys.stdout.write(json.dumps({"id": row["id"], "tokens": n, "cost_usd": usd}) + "\n")
+                total += n
+                rows += 1
+        usd = cost(model, total, output_tokens * rows)
+        err.print(
+            f"[dim]{rows} row(s), ~{total:,} prompt tokens"
+            + (f", ~${usd:.4f}" if usd is not None else "")
+            + f" in {(time.perf_counter() - t0) * 1000:.0f} ms[/dim]"
+        )
+        return
+    if text is None:
+        from .mapreduce import read_lines
+        text = "".join(read_lines(sources))
+    n = estimate(text)
+    usd = cost(model, n, output_tokens)
+    limit = context_limit(model)
+    sys.stdout.write(f"{n}\n")
+    err.print(
+        f"[dim]~{n:,} tokens ({len(text):,} chars), {100 * n / limit:.1f}% of {model}'s ~{limit:,}"
+        + (f", ~${usd:.5f}" if usd is not None else "") + "[/dim]"
+    )
+
+@typer_app.command()
+def stats(
+    since: Optional[float] = typer.Option(None, "--since", help="Only calls from the last N hours"),
+    by: str = typer.Option("engine,model", "--by", help="Comma-separated grouping fields, e.g. engine,model,via or endpoint"),
+    include_cache: bool = typer.Option(False, "--include-cache", help="Count response-cache hits too"),
+    as_json: bool = typer.Option(False, "--json", help="Print the aggregate as JSON"),
+):
+    """Latency percentiles per engine/model from the local metrics log."""
+    from .metrics import aggregate, load, metrics_path
+    cutoff = time.time() - since * 3600 if since else None
+    keys = tuple(f.strip() for f in by.split(",") if f.strip())
+    records = (r for r in load(since=cutoff) if include_cache or r.get("via") != "cache")
+    rows = aggregate(records, keys)
+    if as_json:
+        import json
+        sys.stdout.write(json.dumps(rows, indent=2) + "\n")
+        return
+    if not rows:
+        con.print(f"[dim]No calls recorded yet in {metrics_path()}[/dim]")
+        return
+    from rich.table import Table
+
+    def fmt(v):
+        return "-" if v is None else f"{v:,.0f}"
+
+    table = Table(title=f"deepgem stats ({metrics_path()})", title_justify="left")
+    for k in keys:
+        table.add_column(k)
+    for col in ("calls", "err %", "ttft p50", "p95", "p99", "total p50", "p95", "p99", "tok/s"):
+        table.add_column(col, justify="right")
+    for r in rows:
+        table.add_row(
+            *["-" if r[k] is None else str(r[k]) for k in keys],
+            str(r["calls"]), f"{100 * r['errors'] / r['calls']:.0f}",
+            fmt(r["ttft_p50"]), fmt(r["ttft_p95"]), fmt(r["ttft_p99"]),
+            fmt(r["total_p50"]), fmt(r["total_p95"]), fmt(r["total_p99"]),
+            fmt(r["tokens_per_s_p50"]),
+        )
+    con.print(table)
+    con.print("[dim]latencies in ms[/dim]")
+
+# ---------------- Benchmarks ----------------
+bench_app = typer.Typer(help="Measure deepgem's own performance")
+typer_app.add_typer(bench_app, name="bench")
+
+@bench_app.command("startup")
+def bench_startup(
+    runs: int = typer.Option(5, "--runs", "-n", help="Fresh interpreters to sample (medians are reported)"),
+    top: int = typer.Option(12, "--top", help="Rows to show per table"),
+    as_json: bool = typer.Option(False, "--json", help="Print the raw profile as JSON"),
+):
+    """Cold-start time with a -X importtime breakdown by package and module."""
+    from .bench import startup_profile
+    prof = startup_profile(runs=runs)
+    if as_json:
+        import json
+        sys.stdout.write(json.dumps(prof, indent=2) + "\n")
+        return
+    from rich.table import Table
+    con.print(f"interpreter startup:     {prof['interpreter_ms']:.1f} ms")
+    con.print(f"import {prof['target']}:      {prof['import_ms']:.1f} ms (wall {prof['wall_ms']:.1f} ms)")
+    con.print(f"deepgem --help:          {prof['help_ms']:.1f} ms")
+    for title, rows, label in (
+        ("Self time by package", prof["packages"], "package"),
+        ("Cumulative time by module", prof["modules"], "module"),
+    ):
+        table = Table(title=title, title_justify="left")
+        table.add_column(label)
+        table.add_column("ms", justify="right")
+        for name, ms in rows[:top]:
+            table.add_row(name, f"{ms:.2f}")
+        con.print(table)
+
+@bench_app.command("router")
+def bench_router(
+    n: int = typer.Option(100_000, "--n", help="Number of synthetic prompts"),
+    extra_rules: int = typer.Option(500, "--extra-rules", help="Synthetic rules for the scaling comparison (0 = skip)"),
+    as_json: bool = typer.Option(False, "--json", help="Print the raw results as JSON"),
+):
+    """Compare the compiled router with the original substring heuristic."""
+    from .bench import router_benchmark
+    res = router_benchmark(n, extra_rules)
+    if as_json:
+        import json
+        sys.stdout.write(json.dumps(res, indent=2) + "\n")
+        return
+    con.print(f"{res['n']:,} prompts, mean length {res['mean_chars']:.0f} chars, {res['rules']} rules")
+    for name in ("legacy", "compiled"):
+        r = res[name]
+        con.print(f"  {name:<12} {r['seconds']:.3f} s   {r['us_per_prompt']:.2f} µs/prompt")
+    con.print(f"  compile      {res['compile_ms']:.2f} ms (once per process)")
+    con.print(
+        f"  decisions agree on {res['agreement']:.1%} of prompts "
+        "[dim](the rest are mostly substring false positives such as 'class' in 'classic')[/dim]"
+    )
+    if "scaled" in res:
+        sc = res["scaled"]
+        con.print(f"\nscoring against {sc['rules']} rules:")
+        for name, label in (("legacy_scan", "substring"), ("compiled", "compiled")):
+            r = sc[name]
+            con.print(f"  {label:<12} {r['seconds']:.3f} s   {r['us_per_prompt']:.2f} µs/prompt")
+
+@bench_app.command("suite")
+def bench_suite(
+    output: Optional[str] = typer.Option(None, "--output", "-o", help="Write the results JSON here (for `bench compare`)"),
+    runs: int = typer.Option(5, "--runs", "-n", help="Invocations per scenario"),
+    rows: int = typer.Option(200, "--rows", help="Prompts in the batch throughput run"),
+    concurrency: int = typer.Option(16, "--concurrency", "-c", help="Batch concurrency"),
+    ttft: float = typer.Option(0.05, "--ttft", help="Stub seconds to first token"),
+    tokens_per_s: float = typer.Option(200.0, "--tokens-per-s", help="Stub token rate (0 = unpaced)"),
+    error_rate: float = typer.Option(0.0, "--error-rate", help="Share of stub requests that fail with 503"),
+    only: List[str] = typer.Option(None, "--only", help="Run just these parts (chat, ask, ask_gemini, gem, batch, startup, router)"),
+):
+    """Offline end-to-end benchmarks against a local DeepSeek stub and a fake gemini."""
+    import json
+    from .bench import suite
+    res = suite(runs, rows, concurrency, ttft, tokens_per_s, error_rate, only=only or None)
+    if output:
+        Path(output).write_text(json.dumps(res, indent=2) + "\n")
+    else:
+        sys.stdout.write(json.dumps(res, indent=2) + "\n")
+    from rich.table import Table
+    table = Table(title="deepgem bench suite", title_justify="left")
+    table.add_column("metric")
+    table.add_column("value", justify="right")
+    for key, value in res["metrics"].items():
+        table.add_row(key, "-" if value is None else f"{value:g}")
+    LazyConsole(stderr=True).print(table)
+
+@bench_app.command("compare")
+def bench_compare(
+    old: str = typer.Argument(..., help="Baseline results from `bench suite -o`"),
+    new: str = typer.Argument(..., help="Results to check against the baseline"),
+    threshold: float = typer.Option(0.1, "--threshold", help="Relative change that counts as a regression"),
+):
+    """Diff two `bench suite` results; exits 1 if any metric regressed."""
+    import json
+    from rich.table import Table
+    from .bench import compare
+    a, b = (json.loads(Path(p).read_text()) for p in (old, new))
+    rows = compare(a, b, threshold)
+    table = Table(title_justify="left")
+    for col in ("metric", "old", "new", "change"):
+        table.add_column(col, justify="left" if col == "metric" else "right")
+    for r in rows:
+        change = "-" if r["change"] is None else f"{r['change']:+.1%}"
+        if r["regressed"]:
+            change = f"[red]{change}[/red]"
+        table.add_row(
+            r["metric"], *("-" if r[k] is None else f"{r[k]:g}" for k in ("old", "new")), change,
+        )
+    con.print(f"[dim]{a['meta'].get('deepgem')} ({a['meta'].get('created')}) → "
+              f"{b['meta'].get('deepgem')} ({b['meta'].get('created')})[/dim]")
+    con.print(table)
+    regressed = [r["metric"] for r in rows if r["regressed"]]
+    if regressed:
+        con.print(f"[red]{len(regressed)} regression(s) beyond {threshold:.0%}[/red]")
+        raise typer.Exit(code=1)
+
+@bench_app.command("stub")
+def bench_stub(
+    port: int = typer.Option(8765, "--port", help="Port for the DeepSeek stub"),
+    ttft: float = typer.Option(0.05, "--ttft", help="Seconds to first token"),
+    tokens_per_s: float = typer.Option(200.0, "--tokens-per-s", help="Token rate (0 = unpaced)"),
+    error_rate: float = typer.Option(0.0, "--error-rate", help="Share of requests that fail with 503"),
+):
+    """Run the DeepSeek stub and a fake gemini in the foreground, for manual runs."""
+    import tempfile
+    import threading
+    from .stubs import StubServer, write_fake_gemini
+    tmp = tempfile.mkdtemp(prefix="deepgem-stub-")
+    fake = write_fake_gemini(Path(tmp) / "gemini", ttft, tokens_per_s)
+    with StubServer(ttft=ttft, tokens_per_s=tokens_per_s, error_rate=error_rate, port=port) as stub:
+        con.print("[dim]point deepgem at the stubs with:[/dim]")
+        con.print(f"  export DEEPSEEK_BASE_URL={stub.url} DEEPSEEK_API_KEY=stub", markup=False)
+        con.print(f"  export GEMINI_BIN={fake} GEMINI_API_KEY=stub", markup=False)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+# ---------------- Learned router ----------------
+router_app = typer.Typer(help="Train or inspect the learned router (`ask --learned`)")
+typer_app.add_typer(router_app, name="router")
+
+@router_app.command("train")
+def router_train(
+    epochs: int = typer.Option(5, "--epochs", help="Passes over the outcome log"),
+):
+    """Fit the learned router on recorded `ask` outcomes and save it locally."""
+    from .learned import load_outcomes, log_path, model_path, train
+    if not any(True for _ in load_outcomes()):
+        con.print(f"[yellow]No outcomes recorded yet in {log_path()}; run some `deepgem ask` first[/yellow]")
+        raise typer.Exit(code=1)
+    t0 = time.perf_counter()
+    model = train(epochs=epochs)
+    con.print(
+        f"trained on {model.trained_on} outcome(s) in {time.perf_counter() - t0:.2f}s → {model_path()}"
+    )
+
+@router_app.command("show")
+def router_show():
+    """Summarise recorded outcomes per engine and the saved model."""
+    from collections import Counter
+    from rich.table import Table
+    from .learned import LearnedRouter, load_outcomes, log_path, model_path
+    from .metrics import percentile
+    outcomes = list(load_outcomes())
+    if not outcomes:
+        con.print(f"[dim]No outcomes in {log_path()}[/dim]")
+        return
+    overrides = Counter(o["override"] for o in outcomes if o.get("override"))
+    table = Table(title_justify="left")
+    for col in ("engine", "calls", "err %", "p50 ms", "tokens p50", "overridden"):
+        table.add_column(col, justify="left" if col == "engine" else "right")
+    by_engine: dict = {}
+    for o in outcomes:
+        by_engine.setdefault(o["engine"], []).append(o)
+    for engine in sorted(set(by_engine) | set(overrides)):
+        rows = by_engine.get(engine, [])
+        lat = percentile([r["latency_ms"] for r in rows], 50)
+        tok = percentile([r["tokens"] for r in rows if r.get("tokens")], 50)
+        errors = sum(1 for r in rows if r.get("exit_code"))
+        table.add_row(
+            engine, str(len(rows)), f"{100 * errors / len(rows):.0f}" if rows else "-",
+            "-" if lat is None else f"{lat:.0f}", "-" if tok is None else f"{tok:.0f}",
+            str(overrides.get(engine, 0)),
+        )
+    con.print(table)
+    model = LearnedRouter.load()
+    if model is None:
+        con.print("[dim]no model yet: run `deepgem router train`[/dim]")
     else:
-        raise typer.Exit(code=deepseek_chat(prompt, "deepseek-chat", system, stream=True))
+        con.print(f"[dim]model: {model_path()} (trained on {model.trained_on} outcome(s))[/dim]")
+
+# ---------------- Sessions ----------------
+session_app = typer.Typer(help="List, inspect or delete chat sessions")
+typer_app.add_typer(session_app, name="session")
+
+@session_app.command("list")
+def session_list():
+    """Show saved sessions with turn counts and prefix-cache savings."""
+    from rich.table import Table
+    from .sessions import list_sessions, sessions_dir, usage_totals
+    sessions = list(list_sessions())
+    if not sessions:
+        con.print(f"[dim]No sessions in {sessions_dir()}[/dim]")
+        return
+    table = Table(title_justify="left")
+    for col in ("session", "turns", "prompt tokens", "cached", "size"):
+        table.add_column(col, justify="left" if col == "session" else "right")
+    for sess in sessions:
+        tot = usage_totals(sess)
+        share = tot["cached_tokens"] / tot["prompt_tokens"] if tot["prompt_tokens"] else 0
+        table.add_row(
+            sess.name, str(len(sess.messages) // 2), str(tot["prompt_tokens"]),
+            f"{tot['cached_tokens']} ({share:.0%})", f"{sess.path.stat().st_size / 1024:.1f} KiB",
+        )
+    con.print(table)
+
+@session_app.command("show")
+def session_show(
+    name: str = typer.Argument(..., help="Session name"),
+):
+    """Print a session's history."""
+    from .metrics import cached_prompt_tokens
+    sess = _open_session(name)
+    if not sess.exists:
+        con.print(f"[red]No session named {name!r}[/red]")
+        raise typer.Exit(code=1)
+    turns = ([{"role": "system", "content": sess.system}] if sess.system else []) + sess.messages
+    for m in turns:
+        con.print(f"[bold]{m['role']}[/bold]:", highlight=False)
+        con.print(m["content"], highlight=False, markup=False)
+        usage = m.get("usage")
+        if usage and usage.get("prompt_tokens") is not None:
+            con.print(
+                f"[dim]{usage['prompt_tokens']} prompt tokens, "
+                f"{cached_prompt_tokens(usage) or 0} cached[/dim]"
+            )
+
+@session_app.command("rm")
+def session_rm(
+    names: List[str] = typer.Argument(..., help="Session name(s)"),
+):
+    """Delete sessions."""
+    for name in names:
+        sess = _open_session(name)
+        if not sess.exists:
+            con.print(f"[yellow]No session named {name!r}[/yellow]")
+            continue
+        sess.remove()
+        con.print(f"[green]Removed session {name}[/green]")
+
+# ---------------- Cache management ----------------
+cache_app = typer.Typer(help="Inspect or prune the on-disk response cache")
+typer_app.add_typer(cache_app, name="cache")
+
+@cache_app.command("stats")
+def cache_stats():
+    """Show cache location, size and hit rate."""
+    from .cache import ResponseCache
+    st = ResponseCache().stats()
+    lookups = st["hits"] + st["misses"]
+    con.print(f"path:     {st['path']}")
+    con.print(f"entries:  {st['entries']}")
+    con.print(f"size:     {st['bytes'] / 2**20:.2f} MiB of {st['max_bytes'] / 2**20:.0f} MiB")
+    con.print(f"ttl:      {st['ttl'] / 3600:g} h")
+    if lookups:
+        con.print(f"hit rate: {st['hits'] / lookups:.0%} ({st['hits']}/{lookups})")
+    if st["similar_hits"]:
+        con.print(f"similar:  {st['similar_hits']} near-duplicate hit(s), {st['fingerprints']} fingerprints")
+
+@cache_app.command("prune")
+def cache_prune(
+    all_: bool = typer.Option(False, "--all", help="Remove every entry, not just expired ones"),
+):
+    """Remove expired entries and enforce the size limit."""
+    from .cache import ResponseCache
+    removed = ResponseCache().prune(everything=all_)
+    con.print(f"[green]Removed {removed} cache entr{'y' if removed == 1 else 'ies'}[/green]")
 
 @typer_app.command()
 def setup():
@@ -277,7 +1426,7 @@ def setup():
         raise typer.Exit(1)
     
     # 2. Check/Install Gemini CLI
-    gemini_path = shutil.which(os.environ.get("GEMINI_BIN", "gemini"))
+    gemini_path = shutil.which(get_config().gemini_bin)
     if not gemini_path:
         con.print("\n❌ Gemini CLI not found")
         
@@ -330,7 +1479,7 @@ def setup():
     
     # 3. Setup DeepSeek API key
     con.print("\n[bold]DeepSeek API Configuration[/bold]")
-    deepseek_key = os.environ.get("DEEPSEEK_API_KEY")
+    deepseek_key = get_config().deepseek_api_key
     
     if deepseek_key:
         con.print(f"✅ DeepSeek API key: [green]already configured[/green]")
@@ -349,7 +1498,8 @@ def setup():
             # Test the key
             con.print("[dim]Testing API key...[/dim]")
             try:
-                test_client = OpenAI(api_key=key_input, base_url="https://api.deepseek.com")
+                from openai import OpenAI
+                test_client = OpenAI(api_key=key_input, base_url=get_config().deepseek_base_url)
                 test_client.models.list()
                 con.print("✅ API key validated successfully!")
                 
@@ -367,7 +1517,7 @@ def setup():
     
     # 4. Setup Gemini API key (optional)
     con.print("\n[bold]Gemini API Configuration (Optional)[/bold]")
-    gemini_key = os.environ.get("GEMINI_API_KEY")
+    gemini_key = get_config().gemini_api_key
     
     if gemini_key:
         con.print(f"✅ Gemini API key: [green]already configured[/green]")
@@ -395,7 +1545,8 @@ def setup():
     # Run doctor to show final status
     con.print("\n[bold]Running system check...[/bold]")
     con.print("─" * 60)
-    return doctor()
+    reload_config()  # pick up keys entered above
+    return _doctor()
 
 def save_key_to_env(key_name: str, key_value: str):
     """Save API key to global .deepgem.env file and appropriate shell config."""
@@ -461,8 +1612,15 @@ def save_key_to_env(key_name: str, key_value: str):
                 pass
 
 @typer_app.command()
-def doctor():
+def doctor(
+    bench: bool = typer.Option(False, "--bench", help="Also time DNS/TCP/TLS/RTT, per-model TTFT and gemini spawn"),
+    timeout: float = typer.Option(10.0, "--timeout", help="Seconds each network check may take"),
+):
     """Check your deepgem setup and diagnose common issues."""
+    return _doctor(bench, timeout)
+
+def _doctor(bench: bool = False, timeout: float = 10.0) -> int:
+    """doctor's body; plain defaults so `setup` can call it too."""
     import shutil
     import platform
     
@@ -480,7 +1638,8 @@ def doctor():
         issues.append("Python 3.10+ required. Upgrade Python.")
     
     # Check DeepSeek API key
-    deepseek_key = os.environ.get("DEEPSEEK_API_KEY")
+    cfg = get_config()
+    deepseek_key = cfg.deepseek_api_key
     if deepseek_key:
         if deepseek_key.startswith("sk-"):
             con.print("✅ DeepSeek API key: [green]configured[/green]")
@@ -492,12 +1651,12 @@ def doctor():
         issues.append("Set DEEPSEEK_API_KEY environment variable")
     
     # Check Gemini CLI
-    gemini_path = shutil.which(os.environ.get("GEMINI_BIN", "gemini"))
+    gemini_path = shutil.which(cfg.gemini_bin)
     if gemini_path:
         con.print(f"✅ Gemini CLI: [green]found[/green] at {gemini_path}")
         
         # Check Gemini API key
-        gemini_key = os.environ.get("GEMINI_API_KEY")
+        gemini_key = cfg.gemini_api_key
         if gemini_key:
             con.print("✅ Gemini API key: [green]configured[/green]")
         else:
@@ -508,23 +1667,68 @@ def doctor():
         issues.append("Install with: npm install -g @google/gemini-cli")
     
     # Check OpenAI package
+    # (version from package metadata: importing openai itself costs most of a second)
+    from importlib.metadata import version, PackageNotFoundError
     try:
-        import openai
-        con.print(f"✅ OpenAI SDK: [green]installed[/green] (v{openai.__version__})")
-    except ImportError:
+        con.print(f"✅ OpenAI SDK: [green]installed[/green] (v{version('openai')})")
+    except PackageNotFoundError:
         con.print("❌ OpenAI SDK: [red]not installed[/red]")
         issues.append("Install deepgem dependencies: pip install deepgem")
     
-    # Test DeepSeek connection (optional)
+    # Network checks (and --bench probes) run concurrently, each bounded by --timeout
+    from . import probes
+    checks = {}
+    endpoints = []
+    # Only probe DeepSeek once the local setup is sound, so a missing piece isn't reported as a network error
     if deepseek_key and not issues:
-        con.print("\n[dim]Testing DeepSeek connection...[/dim]")
+        from .endpoints import Pool, load_endpoints
         try:
-            client = OpenAI(api_key=deepseek_key, base_url="https://api.deepseek.com")
-            response = client.models.list()
-            con.print("✅ DeepSeek API: [green]connected successfully[/green]")
-        except Exception as e:
-            con.print(f"⚠️  DeepSeek API: [yellow]connection failed[/yellow]")
-            warnings.append(f"DeepSeek connection error: {str(e)[:100]}")
+            endpoints = load_endpoints(cfg.deepseek_endpoints, deepseek_key, cfg.deepseek_base_url)["endpoints"]
+        except (OSError, ValueError) as e:
+            warnings.append(f"Endpoint config: {e}")
+        pool = Pool(endpoints) if endpoints else None
+        for ep in endpoints:
+            checks[f"deepseek:{ep.name}"] = probes.models_check(pool.client(ep), timeout)
+            if bench:
+                checks[f"net:{ep.name}"] = probes.connection_timings(ep.base_url, timeout)
+        if bench and endpoints:
+            for model in probes.PROBE_MODELS:
+                checks[f"ttft:{model}"] = probes.ttft_check(pool.client(endpoints[0]), model, timeout)
+    if gemini_path and bench:
+        checks["gemini:spawn"] = probes.spawn_check(gemini_path, timeout)
+    if checks:
+        con.print(f"\n[dim]Running {len(checks)} network check(s) (timeout {timeout:g}s)...[/dim]")
+    results = probes.run_checks(checks, timeout)
+    for ep in endpoints:
+        res = results[f"deepseek:{ep.name}"]
+        label = "DeepSeek API" if len(endpoints) == 1 else f"DeepSeek API ({ep.name})"
+        if res.ok:
+            con.print(f"✅ {label}: [green]connected successfully[/green] [dim]({res.ms:.0f} ms)[/dim]")
+        else:
+            con.print(f"⚠️  {label}: [yellow]connection failed[/yellow]")
+            warnings.append(f"DeepSeek connection error ({ep.name}): {res.error[:100]}")
+    if bench and results:
+        from rich.table import Table
+        table = Table(title="Latency", title_justify="left")
+        table.add_column("check", no_wrap=True)
+        for col in ("dns", "tcp", "tls", "rtt", "ttft", "spawn", "total"):
+            table.add_column(col, justify="right")
+        table.add_column("detail")
+        for name, res in results.items():
+            if name.startswith("deepseek:"):
+                continue
+            cells = [
+                "-" if res.timings.get(f"{k}_ms") is None else f"{res.timings[f'{k}_ms']:.0f}"
+                for k in ("dns", "tcp", "tls", "rtt", "ttft", "spawn")
+            ]
+            detail = res.detail if res.ok else f"[yellow]{res.error}[/yellow]"
+            table.add_row(name, *cells, "-" if res.ms is None else f"{res.ms:.0f}", detail)
+            if not res.ok:
+                warnings.append(f"{name}: {res.error}")
+        con.print(table)
+        proxy = os.environ.get("HTTPS_PROXY") or os.environ.get("https_proxy")
+        note = f"; API calls go through {proxy}, net: rows do not" if proxy else ""
+        con.print(f"[dim]latencies in ms{note}[/dim]")
     
     # Summary
     con.print("\n" + "─" * 50)
@@ -0,0 +1,113 @@
+"""Settings from the environment and deepgem's env files, parsed once per process.
+
+``~/.deepgem.env`` (global) and ``./.env`` (local) are read the first time
+`get_config()` is called rather than at import, so ``deepgem --help`` and
+``bench`` don't pay for it. Every other command calls it from the root
+callback before it runs, since a few settings (cache dir, rules file, ...)
+are still read straight from os.environ and must see the files too. Values
+already present in the environment always win.
+"""
+import functools
+import os
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+DEFAULT_DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+
+
+def parse_env_file(path: Path) -> Dict[str, str]:
+    values: Dict[str, str] = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                key, value = line.split('=', 1)
+                values[key] = value.strip('"').strip("'")
+    return values
+
+
+def load_env_files() -> Tuple[Path, ...]:
+    """Merge the env files into os.environ without overriding existing variables."""
+    loaded = []
+    # Load global env first, then local
+    for path in (Path.home() / ".deepgem.env", Path.cwd() / ".env"):
+        if not path.exists():
+            continue
+        for key, value in parse_env_file(path).items():
+            if key not in os.environ:  # Don't override existing env vars
+                os.environ[key] = value
+        loaded.append(path)
+    return tuple(loaded)
+
+
+_warned = set()
+
+
+def env_number(name: str, default, cast=float, lo=None, hi=None):
+    """`name` from the environment as a number in [lo, hi], else `default`.
+
+    A value that doesn't parse or is out of range is reported on stderr (once
+    per process) rather than raised, so a typo in an env file never stops a command.
+    """
+    raw = os.environ.get(name)
+    if not raw:
+        return default
+    try:
+        value = cast(float(raw))
+        if value != value or (lo is not None and value < lo) or (hi is not None and value > hi):
+            raise ValueError
+    except (ValueError, OverflowError):
+        if name not in _warned:
+            _warned.add(name)
+            bounds = f" (expected {lo}..{hi})" if lo is not None and hi is not None else (
+                f" (expected >= {lo})" if lo is not None else "")
+            sys.stderr.write(f"deepgem: ignoring {name}={raw!r}{bounds}\n")
+        return default
+    return value
+
+
+@dataclass(frozen=True)
+class Config:
+    env_files: Tuple[Path, ...]
+    deepseek_api_key: Optional[str]
+    deepseek_base_url: str
+    deepseek_endpoints: Optional[str]
+    gemini_api_key: Optional[str]
+    gemini_bin: str
+    default_gemini_model: Optional[str]
+    gemini_timeout: Optional[float]
+    gemini_idle_timeout: Optional[float]
+    no_banner: bool
+    no_cache: bool
+    similar: Optional[float]
+    router: Optional[str]
+
+
+@functools.lru_cache(maxsize=None)
+def get_config() -> Config:
+    """Load env files (first call only) and snapshot the settings deepgem uses."""
+    env_files = load_env_files()
+    env = os.environ
+    return Config(
+        env_files=env_files,
+        deepseek_api_key=env.get("DEEPSEEK_API_KEY"),
+        deepseek_base_url=env.get("DEEPSEEK_BASE_URL", DEFAULT_DEEPSEEK_BASE_URL),
+        deepseek_endpoints=env.get("DEEPGEM_ENDPOINTS"),
+        gemini_api_key=env.get("GEMINI_API_KEY"),
+        gemini_bin=env.get("GEMINI_BIN", "gemini"),
+        default_gemini_model=env.get("DEEPGEM_DEFAULT_GEMINI_MODEL"),
+        gemini_timeout=env_number("DEEPGEM_GEMINI_TIMEOUT", None, lo=0),
+        gemini_idle_timeout=env_number("DEEPGEM_GEMINI_IDLE_TIMEOUT", None, lo=0),
+        no_banner=bool(env.get("DEEPGEM_NO_BANNER")),
+        no_cache=bool(env.get("DEEPGEM_NO_CACHE")),
+        similar=env_number("DEEPGEM_SIMILAR", None, lo=0.5, hi=1.0),
+        router=env.get("DEEPGEM_ROUTER") or None,
+    )
+
+
+def reload_config() -> Config:
+    """Re-snapshot after os.environ was changed in-process (e.g. by `deepgem setup`)."""
+    get_config.cache_clear()
+    return get_config()
@@ -0,0 +1,280 @@
+"""Warm `deepgem serve` daemon on a Unix socket.
+
+The daemon keeps one OpenAI client (and its keep-alive connection pool) open so
+CLI calls skip client construction and the TLS handshake. Identical requests
+that arrive while one is already in flight share a single upstream call.
+
+Wire protocol: the client sends one JSON line ``{"model", "messages",
+"config"}``; the daemon answers with ``{"delta": str}`` lines followed by a
+final ``{"done": true, "usage": {...}}`` or ``{"error": str}`` line. While
+nothing new has arrived upstream it sends ``{"wait": true}`` every
+`HEARTBEAT` seconds, so a client that hears nothing for `READ_TIMEOUT` knows
+the daemon is stuck.
+
+The daemon calls DeepSeek with the endpoints and API key of the environment
+it was started in. ``config`` is a hash of the caller's; on a mismatch the
+daemon declines (``"direct": true``) and the caller makes the call itself,
+so nobody is ever served with someone else's key or endpoint.
+"""
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .cache import cache_dir, cache_key
+
+HEARTBEAT = 5.0        # seconds between {"wait": true} lines while upstream is quiet
+READ_TIMEOUT = 30.0    # client: seconds without any line before the daemon is given up on
+
+
+def socket_path() -> Path:
+    if os.environ.get("DEEPGEM_SOCKET"):
+        return Path(os.environ["DEEPGEM_SOCKET"])
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    return Path(runtime) / "deepgem.sock" if runtime else cache_dir() / "deepgem.sock"
+
+
+def supported() -> bool:
+    return hasattr(socket, "AF_UNIX")
+
+
+def config_id() -> str:
+    """Hash of the settings that decide where and as whom DeepSeek is called."""
+    from .config import get_config
+    cfg = get_config()
+    blob = json.dumps([cfg.deepseek_endpoints, cfg.deepseek_api_key, cfg.deepseek_base_url])
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
+
+
+# ---------------- Client side ----------------
+def daemon_chat(
+    model: str,
+    messages: List[Dict],
+    on_delta: Optional[Callable[[str], None]] = None,
+    connect_timeout: float = 0.2,
+    read_timeout: float = READ_TIMEOUT,
+) -> Optional[Dict]:
+    """Run a chat call through the daemon.
+
+    Returns None when no daemon is reachable, it runs with other credentials,
+    or it goes silent before the reply starts (the caller falls back to an
+    in-process call), otherwise ``{"content", "usage", "error"}``.
+    """
+    if os.environ.get("DEEPGEM_NO_DAEMON") or not supported():
+        return None
+    path = socket_path()
+    if not path.exists():
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(connect_timeout)
+        sock.connect(str(path))
+        sock.settimeout(read_timeout)
+        req = {"model": model, "messages": messages, "config": config_id()}
+        sock.sendall((json.dumps(req) + "\n").encode("utf-8"))
+    except OSError:
+        sock.close()
+        return None
+
+    parts: List[str] = []
+    result: Dict = {"content": "", "usage": None, "error": None, "endpoint": None}
+    with sock, sock.makefile("r", encoding="utf-8") as rfile:
+        while True:
+            try:
+                line = rfile.readline()
+                msg = json.loads(line) if line else None
+            except (OSError, ValueError) as e:   # socket.timeout is an OSError
+                if not parts:
+                    return None   # nothing shown yet: the caller can still go direct
+                result["error"] = f"daemon stopped responding mid-response ({e or type(e).__name__})"
+                break
+            if msg is None:
+                result["error"] = "daemon closed the connection mid-response"
+                break
+            if msg.get("direct") and not parts:
+                return None
+            if "delta" in msg:
+                parts.append(msg["delta"])
+                if on_delta:
+                    on_delta(msg["delta"])
+            elif "error" in msg:
+                result["error"] = msg["error"]
+                break
+            elif msg.get("done"):
+                result["usage"] = msg.get("usage")
+                result["endpoint"] = msg.get("endpoint")
+                break
+    result["content"] = "".join(parts)
+    return result
+
+
+# ---------------- Server side ----------------
+class _Flight:
+    """One upstream call; any number of connections can follow its chunks."""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[str] = None
+        self.usage: Optional[Dict] = None
+        self.endpoint: Optional[str] = None
+        self.followers = 0
+        self.cond = threading.Condition()
+
+
+class Daemon:
+    def __init__(self, client, path: Optional[Path] = None, log: Callable[[str], None] = print,
+                 config: Optional[str] = None):
+        """`client` is an endpoints.Pool or a single OpenAI client; `config` its config_id()."""
+        from .endpoints import as_pool
+        self.pool = as_pool(client)
+        self.config = config or config_id()
+        self.path = Path(path) if path else socket_path()
+        self.log = log
+        self.inflight: Dict[str, _Flight] = {}
+        self.lock = threading.Lock()
+        self.last_upstream = time.monotonic()
+
+    def _upstream(self, key: str, flight: _Flight, req: Dict):
+        from .scheduler import request_tokens
+        lease = self.pool.lease()
+        try:
+            with lease:
+                resp = lease.call(lambda client: client.chat.completions.create(
+                    model=req["model"],
+                    messages=req["messages"],
+                    stream=True,
+                    stream_options={"include_usage": True},
+                ), tokens=request_tokens(req["messages"]))
+                for chunk in resp:
+                    if getattr(chunk, "usage", None):
+                        flight.usage = chunk.usage.model_dump()
+                    delta = chunk.choices[0].delta if chunk.choices else None
+                    if delta and getattr(delta, "content", None):
+                        with flight.cond:
+                            flight.chunks.append(delta.content)
+                            flight.cond.notify_all()
+        except Exception as e:
+            flight.error = str(e) or type(e).__name__
+        finally:
+            flight.endpoint = lease.name
+            self.last_upstream = time.monotonic()
+            with self.lock:
+                self.inflight.pop(key, None)
+            with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
+
+    def _reply(self, wfile, msg: Dict):
+        wfile.write((json.dumps(msg) + "\n").encode("utf-8"))
+        wfile.flush()
+
+    def handle(self, rfile, wfile):
+        line = rfile.readline()
+        if not line.strip():
+            return   # connected and hung up without asking anything
+        try:
+            req = json.loads(line)
+            if not (isinstance(req, dict) and isinstance(req.get("model"), str)
+                    and isinstance(req.get("messages"), list)):
+                raise ValueError("expected {\"model\": str, \"messages\": list}")
+        except ValueError as e:
+            self._reply(wfile, {"error": f"bad request: {e}"})
+            return
+        if req.get("config") not in (None, self.config):
+            self._reply(wfile, {"error": "daemon runs with different DeepSeek settings", "direct": True})
+            return
+        key = cache_key(req["model"], req["messages"])
+        with self.lock:
+            flight = self.inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.inflight[key] = _Flight()
+            flight.followers += 1
+        if leader:
+            # Upstream runs on its own thread so followers survive the leader disconnecting
+            threading.Thread(target=self._upstream, args=(key, flight, req), daemon=True).start()
+        else:
+            self.log(f"joined in-flight request ({flight.followers} waiting) model={req['model']}")
+
+        sent = 0
+        while True:
+            with flight.cond:
+                if sent == len(flight.chunks) and not flight.done:
+                    flight.cond.wait(HEARTBEAT)
+                new, done = flight.chunks[sent:], flight.done
+            sent += len(new)
+            lines = [json.dumps({"delta": c}) + "\n" for c in new]
+            if done:
+                final = ({"error": flight.error} if flight.error
+                         else {"done": True, "usage": flight.usage, "endpoint": flight.endpoint})
+                lines.append(json.dumps(final) + "\n")
+            elif not lines:
+                lines.append(json.dumps({"wait": True}) + "\n")   # still waiting upstream: say so
+            wfile.write("".join(lines).encode("utf-8"))
+            wfile.flush()
+            if done:
+                return
+
+    def _keepalive(self, interval: float):
+        # Idle keep-alive connections get closed server-side; a cheap request keeps one open
+        while True:
+            time.sleep(interval)
+            if time.monotonic() - self.last_upstream >= interval:
+                self._ping()
+                self.last_upstream = time.monotonic()
+
+    def _ping(self) -> List[str]:
+        """List models on every endpoint (warms/keeps its connection); returns failures."""
+        failed = []
+        for ep in self.pool.endpoints:
+            try:
+                self.pool.client(ep).models.list()
+            except Exception as e:
+                failed.append(f"{ep.name}: {e}")
+        return failed
+
+    def serve_forever(self, keepalive: float = 55.0):
+        import socketserver
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                try:
+                    daemon.handle(self.rfile, self.wfile)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # client went away; the upstream call still completes for others
+
+        if self.path.exists():
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(str(self.path))
+                raise RuntimeError(f"a daemon is already listening on {self.path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                self.path.unlink()  # stale socket from a crashed daemon
+            finally:
+                probe.close()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        server = socketserver.ThreadingUnixStreamServer(str(self.path), Handler)
+        server.daemon_threads = True
+        os.chmod(self.path, 0o600)  # the daemon spends the owner's API key
+        # Open the TLS connections before the first request
+        for failure in self._ping():
+            self.log(f"warm-up request failed: {failure}")
+        if keepalive > 0:
+            threading.Thread(target=self._keepalive, args=(keepalive,), daemon=True).start()
+        self.log(f"listening on {self.path}")
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
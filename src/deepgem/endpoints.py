@@ -0,0 +1,281 @@
+"""A weighted pool of OpenAI-compatible DeepSeek endpoints.
+
+Configure several keys and/or mirrors in DEEPGEM_ENDPOINTS (inline JSON or a
+path) or ``~/.deepgem.endpoints.json``; without one the pool is just
+DEEPSEEK_API_KEY at DEEPSEEK_BASE_URL::
+
+    {
+      "strategy": "ewma",
+      "endpoints": [
+        {"name": "main", "api_key_env": "DEEPSEEK_API_KEY", "weight": 2},
+        {"name": "team", "api_key": "sk-...", "weight": 1},
+        {"name": "mirror", "base_url": "https://llm.internal/v1", "api_key_env": "MIRROR_KEY"}
+      ]
+    }
+
+Each call leases an endpoint: ``least`` picks the fewest in-flight requests
+per unit of weight, ``ewma`` also multiplies by the endpoint's smoothed
+time to first byte. An endpoint that fails repeatedly is ejected for a
+while, and a call that fails on one endpoint before streaming moves on to
+the next. Every endpoint has its own host-wide scheduler (rate limits,
+backoff, breaker).
+"""
+import json
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from .config import DEFAULT_DEEPSEEK_BASE_URL
+
+STRATEGIES = ("ewma", "least")
+EWMA_ALPHA = 0.3            # weight of the newest latency sample
+EWMA_DEFAULT_MS = 800.0     # assumed latency before an endpoint has been measured
+EJECT_AFTER = 3             # consecutive failures before an endpoint is ejected
+EJECT_BASE = 30.0           # seconds; doubles on each consecutive ejection
+EJECT_MAX = 300.0
+
+
+class EndpointError(ValueError):
+    pass
+
+
+@dataclass
+class Endpoint:
+    name: str
+    api_key: Optional[str] = None
+    base_url: str = DEFAULT_DEEPSEEK_BASE_URL
+    weight: float = 1.0
+    client: Any = None                  # prebuilt client (tests, `Pool.wrap`)
+    # Live state
+    outstanding: int = 0
+    ewma_ms: Optional[float] = None
+    failures: int = 0
+    ejections: int = 0
+    ejected_until: float = 0.0
+    stats: Dict[str, int] = field(default_factory=lambda: {"calls": 0, "errors": 0})
+
+    def observe(self, ms: float):
+        self.ewma_ms = ms if self.ewma_ms is None else EWMA_ALPHA * ms + (1 - EWMA_ALPHA) * self.ewma_ms
+
+
+def parse_endpoints(data: Any) -> Dict[str, Any]:
+    """Normalise a config document (a list, or {"strategy", "endpoints"}) into Endpoints."""
+    if isinstance(data, list):
+        data = {"endpoints": data}
+    strategy = data.get("strategy", "ewma")
+    if strategy not in STRATEGIES:
+        raise EndpointError(f"unknown endpoint strategy {strategy!r} (use {' or '.join(STRATEGIES)})")
+    endpoints = []
+    for i, item in enumerate(data.get("endpoints") or []):
+        key = item.get("api_key") or os.environ.get(item.get("api_key_env") or "DEEPSEEK_API_KEY")
+        if not key:
+            raise EndpointError(f"endpoint {item.get('name') or i} has no api_key (or its api_key_env is unset)")
+        weight = float(item.get("weight", 1.0))
+        if weight <= 0:
+            raise EndpointError(f"endpoint {item.get('name') or i} needs a positive weight")
+        endpoints.append(Endpoint(
+            name=item.get("name") or f"ep{i}",
+            api_key=key,
+            base_url=item.get("base_url") or DEFAULT_DEEPSEEK_BASE_URL,
+            weight=weight,
+        ))
+    if not endpoints:
+        raise EndpointError("endpoint config lists no endpoints")
+    return {"strategy": strategy, "endpoints": endpoints}
+
+
+def endpoints_path() -> Path:
+    return Path.home() / ".deepgem.endpoints.json"
+
+
+def load_endpoints(raw: Optional[str], api_key: Optional[str], base_url: str) -> Dict[str, Any]:
+    """Endpoints from DEEPGEM_ENDPOINTS (JSON or a file path), the endpoints file, or the single key."""
+    if raw:
+        text = raw if raw.lstrip().startswith(("[", "{")) else Path(raw).expanduser().read_text()
+        return parse_endpoints(json.loads(text))
+    if endpoints_path().exists():
+        return parse_endpoints(json.loads(endpoints_path().read_text()))
+    if not api_key:
+        raise EndpointError("DEEPSEEK_API_KEY not set")
+    return {"strategy": "ewma", "endpoints": [Endpoint("default", api_key, base_url)]}
+
+
+class Pool:
+    def __init__(self, endpoints: List[Endpoint], strategy: str = "ewma"):
+        if not endpoints:
+            raise EndpointError("an endpoint pool needs at least one endpoint")
+        self.endpoints = endpoints
+        self.strategy = strategy
+        self.lock = threading.Lock()
+        self.async_clients: Dict[str, Any] = {}
+
+    @classmethod
+    def wrap(cls, client, async_client: bool = False) -> "Pool":
+        """A one-endpoint pool around an existing client."""
+        pool = cls([Endpoint("default", client=None if async_client else client)])
+        if async_client:
+            pool.async_clients["default"] = client
+        return pool
+
+    # ---------------- Selection ----------------
+    def _score(self, ep: Endpoint) -> float:
+        load = (ep.outstanding + 1) / ep.weight
+        if self.strategy == "least":
+            return load
+        return load * (ep.ewma_ms if ep.ewma_ms is not None else EWMA_DEFAULT_MS)
+
+    def pick(self, exclude: Optional[set] = None) -> Optional[Endpoint]:
+        """Best healthy endpoint not in `exclude`; if all are ejected, the one back soonest."""
+        now = time.monotonic()
+        candidates = [ep for ep in self.endpoints if ep.name not in (exclude or ())]
+        if not candidates:
+            return None
+        healthy = [ep for ep in candidates if ep.ejected_until <= now]
+        if not healthy:
+            return min(candidates, key=lambda ep: ep.ejected_until)
+        best = min(self._score(ep) for ep in healthy)
+        # Ties (e.g. nothing measured yet) are broken by weight
+        tied = [ep for ep in healthy if self._score(ep) <= best * 1.0001]
+        return random.choices(tied, weights=[ep.weight for ep in tied])[0]
+
+    def _failed(self, ep: Endpoint):
+        ep.failures += 1
+        ep.stats["errors"] += 1
+        if ep.failures >= EJECT_AFTER:
+            ep.ejected_until = time.monotonic() + min(EJECT_MAX, EJECT_BASE * 2 ** ep.ejections)
+            ep.ejections += 1
+            ep.failures = 0
+
+    def _succeeded(self, ep: Endpoint, ms: float):
+        ep.observe(ms)
+        ep.failures = 0
+        ep.ejections = 0
+
+    # ---------------- Clients ----------------
+    def client(self, ep: Endpoint):
+        if ep.client is None:
+            from openai import OpenAI
+            # Retries are left to scheduler.py, which coordinates them across processes
+            ep.client = OpenAI(api_key=ep.api_key, base_url=ep.base_url, max_retries=0)
+        return ep.client
+
+    def async_client(self, ep: Endpoint):
+        if ep.name not in self.async_clients:
+            from openai import AsyncOpenAI
+            self.async_clients[ep.name] = AsyncOpenAI(api_key=ep.api_key, base_url=ep.base_url, max_retries=0)
+        return self.async_clients[ep.name]
+
+    def lease(self) -> "Lease":
+        return Lease(self)
+
+    def seed(self, records):
+        """Prime each endpoint's EWMA from logged TTFTs, so a fresh process starts informed."""
+        by_name = {ep.name: ep for ep in self.endpoints}
+        for rec in records:
+            ep = by_name.get(rec.get("endpoint"))
+            if ep and rec.get("ttft_ms") is not None and not rec.get("exit_code"):
+                ep.observe(rec["ttft_ms"])
+
+
+def as_pool(client_or_pool, async_client: bool = False) -> Pool:
+    return client_or_pool if isinstance(client_or_pool, Pool) else Pool.wrap(client_or_pool, async_client)
+
+
+class Lease:
+    """Holds one endpoint for the duration of a call (including its stream).
+
+    ``call``/``acall`` run the request through the endpoint's scheduler and, if
+    it fails before a response arrives, fail over to the next endpoint.
+    """
+
+    def __init__(self, pool: Pool):
+        self.pool = pool
+        self.endpoint: Optional[Endpoint] = None
+        self.name: Optional[str] = None     # the endpoint that served (or last tried) the call
+        self.tried: set = set()
+        self.ms: Optional[float] = None
+
+    def _take(self) -> Endpoint:
+        with self.pool.lock:
+            ep = self.pool.pick(self.tried)
+            if ep is None:
+                raise EndpointError("no endpoints left to try")
+            ep.outstanding += 1
+            ep.stats["calls"] += 1
+        self.tried.add(ep.name)
+        self.endpoint = ep
+        self.name = ep.name
+        return ep
+
+    def _release(self, failed: bool = False, ms: Optional[float] = None):
+        ep = self.endpoint
+        if ep is None:
+            return
+        with self.pool.lock:
+            ep.outstanding -= 1
+            if failed:
+                self.pool._failed(ep)
+            elif ms is not None:
+                self.pool._succeeded(ep, ms)
+        self.endpoint = None
+
+    def _failover(self, exc: BaseException) -> bool:
+        """Whether another endpoint might succeed where this one failed."""
+        from .scheduler import CircuitOpen, classify
+        status = getattr(exc, "status_code", None)
+        return isinstance(exc, CircuitOpen) or classify(exc) is not None or status in (401, 403)
+
+    def call(self, make: Callable[[Any], Any], tokens: int = 0, on_retry=None, attempts: Optional[int] = None):
+        """Run ``make(client)`` on the best endpoint, failing over on retriable errors."""
+        from .scheduler import default_scheduler
+        while True:
+            ep = self._take()
+            client = self.pool.client(ep)
+            t0 = time.perf_counter()
+            try:
+                result = default_scheduler(ep.name).call(
+                    lambda: make(client), tokens=tokens, on_retry=on_retry, attempts=attempts,
+                )
+            except Exception as e:
+                self._release(failed=True)
+                if not self._failover(e) or len(self.tried) >= len(self.pool.endpoints):
+                    raise
+                continue
+            self.ms = (time.perf_counter() - t0) * 1000
+            return result
+
+    async def acall(self, make: Callable[[Any], Any], tokens: int = 0, on_retry=None, attempts: Optional[int] = None):
+        """`call` for AsyncOpenAI: ``await make(async_client)``."""
+        from .scheduler import default_scheduler
+        while True:
+            ep = self._take()
+            client = self.pool.async_client(ep)
+            t0 = time.perf_counter()
+            try:
+                result = await default_scheduler(ep.name).acall(
+                    lambda: make(client), tokens=tokens, on_retry=on_retry, attempts=attempts,
+                )
+            except Exception as e:
+                self._release(failed=True)
+                if not self._failover(e) or len(self.tried) >= len(self.pool.endpoints):
+                    raise
+                continue
+            self.ms = (time.perf_counter() - t0) * 1000
+            return result
+
+    def __enter__(self) -> "Lease":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._release(failed=exc_type is not None and exc_type is not GeneratorExit, ms=self.ms)
+        return False
+
+    async def __aenter__(self) -> "Lease":
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
@@ -0,0 +1,178 @@
+"""Structured output for `--output jsonl|ndjson-stream` (chat, ask, gem).
+
+A command run with `--output` writes JSON events to stdout instead of text,
+one per line; human-facing messages go to stderr. Events are ``start``,
+``route`` (ask's engine choice), ``delta`` (reply text), ``usage`` (tokens
+and estimated cost), ``timing`` (ttft/total per call), ``error`` and ``end``
+(exit code).
+
+Events are handed to a background writer thread, so a slow consumer never
+stalls the HTTP stream and the producer never flushes per token. Deltas that
+are still queued when the next one arrives are merged into a single event.
+A fast consumer therefore sees small deltas, and a slow one sees fewer,
+larger ones. Memory stays bounded: once `max_bytes` of text is waiting, the
+producer blocks until the writer catches up.
+
+``ndjson-stream`` flushes after each batch, at most once per `FLUSH_INTERVAL`.
+``jsonl`` is for files and batch pipelines. It merges all the text between
+structural events into one delta, and flushes only when it closes.
+"""
+import json
+import sys
+import threading
+import time
+from collections import deque
+from typing import Deque, List, Optional, TextIO
+
+MODES = ("jsonl", "ndjson-stream")
+DEFAULT_MAX_BYTES = 1 * 2**20     # queued text before the producer blocks
+FLUSH_INTERVAL = 0.02             # ndjson-stream: min seconds between flushes
+
+_current: Optional["EventSink"] = None
+
+
+class EventSink:
+    def __init__(
+        self,
+        mode: str = "ndjson-stream",
+        out: Optional[TextIO] = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        flush_interval: float = FLUSH_INTERVAL,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"unknown output mode {mode!r} (expected {' or '.join(MODES)})")
+        self.mode = mode
+        self.out = out or sys.stdout
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.t0 = time.perf_counter()
+        # Each item is [event dict, text parts]; parts is a list only for a delta still open to merging
+        self.queue: Deque[list] = deque()
+        self.pending = 0
+        self.text: List[str] = []      # jsonl: text since the last structural event
+        self.closed = False
+        self.broken = False            # the consumer went away; keep draining so producers never block
+        self.cond = threading.Condition()
+        self.writer = threading.Thread(target=self._run, name="deepgem-events", daemon=True)
+        self.writer.start()
+
+    # ---------------- Producer side ----------------
+    def _t_ms(self) -> float:
+        return round((time.perf_counter() - self.t0) * 1000, 1)
+
+    def emit(self, event: str, **fields):
+        """Queue a structural event (never merged)."""
+        if self.text:
+            self._put_delta("".join(self.text))
+            self.text.clear()
+        rec = {"event": event, "t_ms": self._t_ms()}
+        rec.update({k: v for k, v in fields.items() if v is not None})
+        with self.cond:
+            self.queue.append([rec, None])
+            self.cond.notify()
+
+    def delta(self, text: str):
+        if not text:
+            return
+        if self.mode == "jsonl":
+            self.text.append(text)
+            return
+        self._put_delta(text)
+
+    def _put_delta(self, text: str):
+        with self.cond:
+            while self.pending >= self.max_bytes and not self.closed:
+                self.cond.wait()   # backpressure: the consumer is far behind
+            tail = self.queue[-1] if self.queue else None
+            if tail is not None and tail[1] is not None:
+                tail[1].append(text)
+            else:
+                self.queue.append([{"event": "delta", "t_ms": self._t_ms()}, [text]])
+            self.pending += len(text)
+            self.cond.notify()
+
+    def close(self):
+        """Drain every queued event, flush, and stop the writer."""
+        if self.text:
+            self._put_delta("".join(self.text))
+            self.text.clear()
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.writer.join()
+
+    # ---------------- Writer thread ----------------
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.queue and not self.closed:
+                    self.cond.wait()
+                if not self.queue and self.closed:
+                    break
+                batch = list(self.queue)
+                self.queue.clear()
+                self.pending = 0
+                self.cond.notify_all()
+            if self.broken:
+                continue
+            lines = []
+            for rec, parts in batch:
+                if parts is not None:
+                    rec["text"] = "".join(parts)
+                lines.append(json.dumps(rec, ensure_ascii=False) + "\n")
+            try:
+                self.out.write("".join(lines))
+                if self.mode == "ndjson-stream":
+                    self.out.flush()
+                    # Let a burst of deltas pile up (and merge) rather than flushing each one
+                    if not self.closed:
+                        time.sleep(self.flush_interval)
+            except (BrokenPipeError, ValueError):
+                self.broken = True
+        if not self.broken:
+            try:
+                self.out.flush()
+            except (BrokenPipeError, ValueError):
+                pass
+
+
+class SinkRenderer:
+    """Renderer interface (see render.py) that turns streamed text into delta events."""
+
+    def __init__(self, sink: EventSink):
+        self.sink = sink
+        self.wrote_any = False
+
+    def write(self, text: str):
+        if text:
+            self.wrote_any = True
+            self.sink.delta(text)
+
+    def flush(self):
+        pass
+
+    def close(self, newline: bool = True):
+        pass
+
+
+def current() -> Optional[EventSink]:
+    """The sink of the running command, if it was started with --output."""
+    return _current
+
+
+def emit(event: str, **fields):
+    if _current is not None:
+        _current.emit(event, **fields)
+
+
+def open_sink(mode: str, out: Optional[TextIO] = None) -> EventSink:
+    global _current
+    _current = EventSink(mode, out)
+    return _current
+
+
+def close_sink():
+    global _current
+    sink, _current = _current, None
+    if sink is not None:
+        sink.close()
@@ -0,0 +1,283 @@
+"""Gemini CLI subprocess helpers: command building, capped streaming capture, fan-out."""
+import asyncio
+import codecs
+import os
+import platform
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional
+
+DEFAULT_MAX_BUFFER = 1 << 20    # bytes of stdout/stderr tail kept per process
+KILL_GRACE = 2.0                # seconds between SIGTERM and SIGKILL
+STOP_POLL = 0.05                # seconds between checks of stream_process(stop=...)
+
+
+def build_command(
+    gemini_cmd: str,
+    prompt: Optional[str],
+    model: Optional[str] = None,
+    include_dirs: Optional[str] = None,
+    extra: Optional[List[str]] = None,
+) -> List[str]:
+    cmd: List[str] = [gemini_cmd]
+    if prompt:
+        cmd += ["-p", prompt]
+    if model:
+        cmd += ["-m", model]
+    if include_dirs:
+        cmd += ["--include-directories", include_dirs]
+    if extra:
+        cmd += extra
+    return cmd
+
+
+# ---------------- Streaming capture ----------------
+class TailBuffer:
+    """Keeps only the last `max_bytes` bytes written to it."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.chunks: Deque[bytes] = deque()
+        self.size = 0
+        self.total = 0
+
+    def write(self, data: bytes):
+        self.total += len(data)
+        self.chunks.append(data)
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            first = self.chunks.popleft()
+            excess = self.size - self.max_bytes
+            if len(first) > excess:
+                self.chunks.appendleft(first[excess:])
+                self.size -= excess
+            else:
+                self.size -= len(first)
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > self.size
+
+    def text(self) -> str:
+        return b"".join(self.chunks).decode("utf-8", errors="replace")
+
+
+@dataclass
+class ProcessResult:
+    returncode: int
+    duration: float
+    stdout: str                      # tail, at most max_buffer bytes
+    stderr: str
+    stdout_bytes: int                # everything the process produced
+    stderr_bytes: int
+    timed_out: Optional[str] = None  # "wall", "idle" or "cancelled"
+    truncated: bool = False
+
+
+def _kill_tree(proc: "asyncio.subprocess.Process", sig: int):
+    try:
+        if platform.system() == "Windows":
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)], capture_output=True)
+        else:
+            os.killpg(proc.pid, sig)  # child was started in its own session
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+
+
+async def stream_process(
+    cmd: List[str],
+    on_line: Optional[Callable[[str, str], None]] = None,
+    max_buffer: int = DEFAULT_MAX_BUFFER,
+    timeout: Optional[float] = None,
+    idle_timeout: Optional[float] = None,
+    stop: Optional[Callable[[], bool]] = None,
+) -> ProcessResult:
+    """Run `cmd`, handing each output line to ``on_line(stream, line)`` as it arrives.
+
+    Only a `max_buffer`-byte tail of each stream is retained. If the process runs
+    past `timeout` seconds, or prints nothing for `idle_timeout` seconds, its whole
+    process tree is terminated (SIGTERM, then SIGKILL) and exit code 124 reported.
+    `stop` is polled too; once it returns True the tree is killed the same way.
+    """
+    t0 = time.monotonic()
+    if platform.system() == "Windows":
+        proc = await asyncio.create_subprocess_shell(
+            subprocess.list2cmdline(cmd), stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        )
+    else:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+    buffers = {"stdout": TailBuffer(max_buffer), "stderr": TailBuffer(max_buffer)}
+    last_output = time.monotonic()
+
+    async def pump(name: str, reader: asyncio.StreamReader):
+        nonlocal last_output
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pending = ""
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            last_output = time.monotonic()
+            buffers[name].write(data)
+            if on_line:
+                pending += decoder.decode(data)
+                *lines, pending = pending.split("\n")
+                for line in lines:
+                    on_line(name, line)
+        if on_line:
+            pending += decoder.decode(b"", final=True)
+            if pending:
+                on_line(name, pending)
+
+    pumps = [
+        asyncio.ensure_future(pump("stdout", proc.stdout)),
+        asyncio.ensure_future(pump("stderr", proc.stderr)),
+    ]
+    async def exited() -> int:
+        # Not proc.wait(): that also waits for the pipes, which a grandchild may hold open
+        while proc.returncode is None:
+            await asyncio.sleep(STOP_POLL)
+        return proc.returncode
+
+    waiter = asyncio.ensure_future(exited())
+    timed_out: Optional[str] = None
+    try:
+        while not waiter.done():
+            now = time.monotonic()
+            checks = []
+            if timeout is not None:
+                checks.append((t0 + timeout - now, "wall"))
+            if idle_timeout is not None:
+                checks.append((last_output + idle_timeout - now, "idle"))
+            if stop is not None:
+                checks.append((0.0 if stop() else STOP_POLL, "cancelled"))
+            remaining, reason = min(checks) if checks else (None, None)
+            if remaining is not None and remaining <= 0:
+                timed_out = reason
+                _kill_tree(proc, signal.SIGTERM)
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter), KILL_GRACE)
+                except asyncio.TimeoutError:
+                    _kill_tree(proc, getattr(signal, "SIGKILL", signal.SIGTERM))
+                    await waiter
+                break
+            await asyncio.wait({waiter}, timeout=remaining)
+    except (asyncio.CancelledError, KeyboardInterrupt):
+        # We are going away (Ctrl-C, a cancelled hedge or watch run): take the whole tree
+        # with us at once, since nothing will be left to wait out a graceful shutdown
+        _kill_tree(proc, getattr(signal, "SIGKILL", signal.SIGTERM))
+        try:
+            # Let the pipes close so the transport shuts down cleanly
+            await asyncio.wait(pumps + [waiter], timeout=KILL_GRACE)
+        finally:
+            for task in pumps + [waiter]:
+                task.cancel()
+        raise
+    # Grandchildren may still hold the pipes open; don't wait on them forever
+    drain = KILL_GRACE if timed_out or idle_timeout is None else idle_timeout
+    _, pending = await asyncio.wait(pumps, timeout=drain)
+    if pending:
+        # Leftovers of a finished run still hold the pipes; end them so the pipes close
+        _kill_tree(proc, getattr(signal, "SIGKILL", signal.SIGTERM))
+        await asyncio.wait(pending, timeout=KILL_GRACE)
+    for task in pumps:
+        task.cancel()
+
+    out, err = buffers["stdout"], buffers["stderr"]
+    return ProcessResult(
+        returncode=124 if timed_out else proc.returncode,
+        duration=time.monotonic() - t0,
+        stdout=out.text(),
+        stderr=err.text(),
+        stdout_bytes=out.total,
+        stderr_bytes=err.total,
+        timed_out=timed_out,
+        truncated=out.truncated or err.truncated,
+    )
+
+
+def run_streaming(cmd: List[str], **kwargs) -> ProcessResult:
+    """Blocking wrapper around stream_process() for synchronous callers."""
+    return asyncio.run(stream_process(cmd, **kwargs))
+
+
+# ---------------- Fan-out ----------------
+@dataclass
+class GeminiTask:
+    prompt: str
+    include_dirs: Optional[str] = None
+
+
+@dataclass
+class GeminiResult:
+    index: int
+    prompt: str
+    include_dirs: Optional[str]
+    returncode: int
+    stdout: str
+    stderr: str
+    duration: float
+    timed_out: Optional[str] = None  # "wall" or "idle"
+    stdout_bytes: int = 0
+    stderr_bytes: int = 0
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def _run(index: int, task: GeminiTask, cmd: List[str], **kwargs) -> GeminiResult:
+    try:
+        # Each worker thread drives its own event loop
+        res = run_streaming(cmd, **kwargs)
+    except (FileNotFoundError, OSError) as e:
+        return GeminiResult(index, task.prompt, task.include_dirs, 127, "", str(e), 0.0)
+    return GeminiResult(
+        index, task.prompt, task.include_dirs, res.returncode, res.stdout, res.stderr,
+        res.duration, res.timed_out, res.stdout_bytes, res.stderr_bytes,
+    )
+
+
+def fan_out(
+    tasks: Iterable[GeminiTask],
+    gemini_cmd: str,
+    model: Optional[str] = None,
+    max_workers: int = 4,
+    timeout: Optional[float] = None,
+    idle_timeout: Optional[float] = None,
+    ordered: bool = True,
+    max_buffer: int = DEFAULT_MAX_BUFFER,
+) -> Iterator[GeminiResult]:
+    """Run `gemini -p` for every task with at most `max_workers` processes alive.
+
+    Results are yielded in submission order (`ordered`) or as they complete.
+    A task that exceeds `timeout` (or `idle_timeout`) seconds has its process
+    tree killed and is reported with exit code 124.
+
+    Children run in their own session, so Ctrl-C never reaches them: on
+    KeyboardInterrupt (or the caller closing the generator) queued tasks are
+    dropped and running ones have their process trees killed.
+    """
+    stop = threading.Event()
+    opts = {"timeout": timeout, "idle_timeout": idle_timeout, "max_buffer": max_buffer, "stop": stop.is_set}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = [
+            pool.submit(_run, i, t, build_command(gemini_cmd, t.prompt, model, t.include_dirs), **opts)
+            for i, t in enumerate(tasks)
+        ]
+        try:
+            for fut in (futures if ordered else as_completed(futures)):
+                yield fut.result()
+        except (KeyboardInterrupt, GeneratorExit):
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
@@ -0,0 +1,265 @@
+"""Hedged requests: duplicate or fail over a call that is slow to start.
+
+The primary attempt starts immediately. If it has not produced a first token
+within the hedge deadline (explicit, or the p95 TTFT learned from the metrics
+log), the next attempt in the fallback chain starts alongside it; an attempt
+that fails before streaming starts the next one at once. Whichever attempt
+streams first wins, and every other attempt is cancelled: its HTTP stream is
+closed, or its Gemini process tree killed.
+"""
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+DEFAULT_HEDGE_AFTER = 4.0   # seconds without a first token; DEEPGEM_HEDGE_AFTER overrides
+MIN_SAMPLES = 20            # successful calls needed before the learned p95 is trusted
+LEARN_WINDOW = 200          # most recent calls considered
+
+Emit = Callable[[str], None]
+
+
+class Cancel:
+    """Cancellation token handed to each attempt."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.closers: List[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def on_cancel(self, fn: Callable[[], None]):
+        """Register `fn` to run on cancel (immediately if already cancelled)."""
+        with self.lock:
+            if not self.event.is_set():
+                self.closers.append(fn)
+                return
+        fn()
+
+    def cancel(self):
+        with self.lock:
+            self.event.set()
+            closers, self.closers = self.closers, []
+        for fn in closers:
+            try:
+                fn()
+            except Exception:
+                pass
+
+
+@dataclass
+class Attempt:
+    label: str                                              # e.g. "deepseek-chat", "gemini"
+    run: Callable[[Emit, Cancel], Optional[Dict]]           # streams via emit, returns usage
+
+
+@dataclass
+class HedgeResult:
+    label: str
+    content: str
+    usage: Optional[Dict]
+    started: List[str] = field(default_factory=list)        # labels of every attempt launched
+    errors: Dict[str, str] = field(default_factory=dict)    # "index:label" -> error before winning
+
+
+class HedgeError(RuntimeError):
+    def __init__(self, errors: Dict[str, str]):
+        super().__init__("; ".join(f"{k}: {v}" for k, v in errors.items()) or "no attempts")
+        self.errors = errors
+
+
+def hedged_call(
+    attempts: Iterable[Attempt],
+    hedge_after: float,
+    on_delta: Optional[Emit] = None,
+) -> HedgeResult:
+    """Run `attempts` as a hedged race; see the module docstring.
+
+    Attempts run on daemon threads, so a loser blocked before its first byte
+    never holds up process exit.
+    """
+    pending = list(attempts)
+    events: "queue.Queue" = queue.Queue()
+    running: List[Cancel] = []
+    started: List[str] = []
+    errors: Dict[str, str] = {}
+    alive = 0
+    winner: Optional[int] = None
+    parts: List[str] = []
+    usage: Optional[Dict] = None
+
+    def launch():
+        nonlocal alive
+        idx, attempt = len(started), pending.pop(0)
+        token = Cancel()
+        running.append(token)
+        started.append(attempt.label)
+        alive += 1
+
+        def target():
+            try:
+                events.put((idx, "done", attempt.run(lambda text: events.put((idx, "delta", text)), token)))
+            except Exception as e:
+                events.put((idx, "error", str(e) or type(e).__name__))
+
+        threading.Thread(target=target, daemon=True).start()
+
+    launch()
+    deadline = time.monotonic() + hedge_after
+    while True:
+        timeout = None
+        if winner is None and pending:
+            timeout = max(0.0, deadline - time.monotonic())
+        try:
+            idx, kind, payload = events.get(timeout=timeout)
+        except queue.Empty:
+            launch()  # no first token in time: hedge with the next attempt
+            deadline = time.monotonic() + hedge_after
+            continue
+        if winner is not None and idx != winner:
+            continue  # late output from a cancelled attempt
+        if kind == "delta":
+            if winner is None:
+                winner = idx
+                for i, token in enumerate(running):
+                    if i != idx:
+                        token.cancel()
+            parts.append(payload)
+            if on_delta:
+                on_delta(payload)
+            continue
+        alive -= 1
+        if kind == "done":
+            if winner is None:  # finished without streaming anything: an empty reply still wins
+                winner = idx
+                for i, token in enumerate(running):
+                    if i != idx:
+                        token.cancel()
+            usage = payload
+            break
+        errors[f"{idx}:{started[idx]}"] = payload
+        if winner is not None:
+            raise HedgeError(errors)  # the winner failed mid-stream; output can't be retracted
+        if pending:
+            launch()
+            deadline = time.monotonic() + hedge_after
+        elif not alive:
+            raise HedgeError(errors)
+    return HedgeResult(started[winner], "".join(parts), usage, started, errors)
+
+
+# ---------------- Attempts ----------------
+def deepseek_attempt(pool, model: str, messages: List[Dict], label: Optional[str] = None) -> Attempt:
+    """`pool` is an endpoints.Pool (or a bare client)."""
+    from .endpoints import as_pool
+    pool = as_pool(pool)
+
+    def run(emit: Emit, cancel: Cancel) -> Optional[Dict]:
+        from .scheduler import request_tokens
+        usage = None
+        with pool.lease() as lease:
+            # Rate limits and the breaker still apply; a failure moves on to the next attempt
+            resp = lease.call(lambda client: client.chat.completions.create(
+                model=model, messages=messages, stream=True, stream_options={"include_usage": True},
+            ), tokens=request_tokens(messages), attempts=1)
+            cancel.on_cancel(resp.close)
+            try:
+                for chunk in resp:
+                    if cancel.cancelled:
+                        break
+                    if getattr(chunk, "usage", None):
+                        usage = chunk.usage.model_dump()
+                    delta = chunk.choices[0].delta if chunk.choices else None
+                    if delta and getattr(delta, "content", None):
+                        emit(delta.content)
+            except Exception:
+                # A cancelled loser's stream is closed under it: that's not an endpoint error
+                if not cancel.cancelled:
+                    raise
+            finally:
+                resp.close()
+        return usage
+
+    return Attempt(label or model, run)
+
+
+def gemini_attempt(gemini_cmd: str, prompt: str, model: Optional[str] = None) -> Attempt:
+    def run(emit: Emit, cancel: Cancel) -> Optional[Dict]:
+        from .gemini import build_command, run_streaming
+
+        def on_line(stream: str, line: str):
+            if stream == "stdout" and not cancel.cancelled:
+                emit(line + "\n")
+
+        res = run_streaming(
+            build_command(gemini_cmd, prompt, model), on_line=on_line,
+            stop=lambda: cancel.cancelled,
+        )
+        if res.returncode != 0 and not cancel.cancelled:
+            raise RuntimeError(f"gemini exited {res.returncode}: {res.stderr.strip()[-200:]}")
+        return None
+
+    return Attempt("gemini", run)
+
+
+def fallback_chain(model: str, fallback: Optional[str] = None) -> List[str]:
+    """Engines to try after `model`: a comma-separated `fallback` list, or the default.
+
+    By default deepseek-reasoner falls back to deepseek-chat, and deepseek-chat
+    is hedged with a duplicate request. "same" names the primary model again.
+    """
+    if fallback:
+        return [model if e == "same" else e for e in (p.strip() for p in fallback.split(",")) if e]
+    return ["deepseek-chat"] if model == "deepseek-reasoner" else [model]
+
+
+def chat_attempts(
+    pool,
+    model: str,
+    messages: List[Dict],
+    fallback: Optional[str] = None,
+    gemini_cmd: str = "gemini",
+) -> List[Attempt]:
+    from .endpoints import as_pool
+    pool = as_pool(pool)
+    attempts = [deepseek_attempt(pool, model, messages)]
+    prompt = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+    for engine in fallback_chain(model, fallback):
+        if engine == "gemini":
+            attempts.append(gemini_attempt(gemini_cmd, prompt))
+        else:
+            attempts.append(deepseek_attempt(pool, engine, messages))
+    return attempts
+
+
+def learned_deadline(engine: str, model: Optional[str], records: Iterable[Dict]) -> Optional[float]:
+    """p95 time-to-first-token (seconds) of recent successful calls, if enough are logged."""
+    from .metrics import percentile
+    ttfts = [
+        r["ttft_ms"] for r in records
+        if r.get("engine") == engine and r.get("model") == model and not r.get("exit_code")
+        and r.get("via") in ("direct", "daemon") and r.get("ttft_ms") is not None
+    ][-LEARN_WINDOW:]
+    if len(ttfts) < MIN_SAMPLES:
+        return None
+    return percentile(ttfts, 95) / 1000
+
+
+def hedge_deadline(model: str, explicit: Optional[float] = None) -> float:
+    """--hedge-after if given, else the learned p95 TTFT for `model`, else the default."""
+    if explicit is not None:
+        return explicit
+    from .metrics import RECENT_BYTES, load
+    try:
+        # Only the tail: the log grows with every call, and the window is the last few hundred
+        learned = learned_deadline("deepseek", model, load(tail_bytes=RECENT_BYTES))
+    except OSError:
+        learned = None
+    if learned is not None:
+        return learned
+    from .config import env_number
+    return env_number("DEEPGEM_HEDGE_AFTER", DEFAULT_HEDGE_AFTER, lo=0)
@@ -0,0 +1,298 @@
+"""Local file index for `--include-directories` on the DeepSeek path.
+
+Directories are walked into a SQLite index (``~/.cache/deepgem/index.sqlite3``)
+of line-based chunks with BM25 postings. Each file's mtime, size and content
+hash are stored, so later runs re-read only files whose mtime/size changed and
+re-chunk only those whose hash changed. `select` then returns the best-scoring
+chunks that fit a token budget, ready to inline into the messages.
+"""
+import hashlib
+import math
+import os
+import re
+import sqlite3
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .cache import cache_dir
+
+CHUNK_LINES = 40
+CHUNK_CHARS = 2000
+MAX_FILE_BYTES = 1 << 20
+DEFAULT_CONTEXT_TOKENS = 6000     # DEEPGEM_CONTEXT_TOKENS overrides
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+SKIP_DIRS = {
+    ".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", "venv", ".tox",
+    ".mypy_cache", ".pytest_cache", "dist", "build", ".idea", ".vscode", "target",
+}
+STOPWORDS = frozenset(
+    "a an and are as at be by for from how i in is it me my of on or that the this to was "
+    "what when where which who why will with you your do does can should would".split()
+)
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d{2,}")
+_CAMEL = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+")
+
+
+def terms(text: str) -> List[str]:
+    """Lowercased words; identifiers also contribute their snake/camelCase parts."""
+    out = []
+    for word in _WORD.findall(text):
+        low = word.lower()
+        if low not in STOPWORDS and len(low) > 1:
+            out.append(low)
+        parts = [p.lower() for piece in word.split("_") for p in _CAMEL.findall(piece)]
+        if len(parts) > 1:
+            out.extend(p for p in parts if len(p) > 1 and p not in STOPWORDS)
+    return out
+
+
+def chunk_lines(text: str) -> Iterator[Tuple[int, int, str]]:
+    """(first line, last line, text) pieces of at most CHUNK_LINES lines / CHUNK_CHARS chars."""
+    lines = text.splitlines()
+    start = 0
+    while start < len(lines):
+        end, size = start, 0
+        while end < len(lines) and end - start < CHUNK_LINES and (size < CHUNK_CHARS or end == start):
+            size += len(lines[end]) + 1
+            end += 1
+        body = "\n".join(lines[start:end])
+        if body.strip():
+            yield start + 1, end, body
+        start = end
+
+
+def walk(root: Path) -> Iterator[Path]:
+    """Files under `root`, skipping VCS, dependency, build and hidden directories and hidden files."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS and not d.startswith("."))
+        for name in sorted(filenames):
+            if not name.startswith("."):
+                yield Path(dirpath) / name
+
+
+def _is_text(data: bytes) -> bool:
+    return b"\0" not in data[:8192]
+
+
+@dataclass
+class Chunk:
+    path: str
+    start: int
+    end: int
+    text: str
+    score: float = 0.0
+
+
+class FileIndex:
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else cache_dir() / "index.sqlite3"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path), timeout=5)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                sha256 TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL,
+                start INTEGER NOT NULL,
+                end INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                text TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunks_path ON chunks(path);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                chunk INTEGER NOT NULL,
+                tf INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS postings_term ON postings(term);
+            CREATE INDEX IF NOT EXISTS postings_chunk ON postings(chunk);
+            """
+        )
+
+    def close(self):
+        self.db.close()
+
+    # ---------------- Indexing ----------------
+    def _walk(self, root: Path) -> Iterator[Path]:
+        return walk(root)
+
+    def _drop(self, path: str):
+        self.db.execute(
+            "DELETE FROM postings WHERE chunk IN (SELECT id FROM chunks WHERE path = ?)", (path,)
+        )
+        self.db.execute("DELETE FROM chunks WHERE path = ?", (path,))
+
+    def _add(self, path: str, text: str):
+        for start, end, body in chunk_lines(text):
+            counts = Counter(terms(body))
+            cur = self.db.execute(
+                "INSERT INTO chunks (path, start, end, length, text) VALUES (?, ?, ?, ?, ?)",
+                (path, start, end, sum(counts.values()), body),
+            )
+            self.db.executemany(
+                "INSERT INTO postings (term, chunk, tf) VALUES (?, ?, ?)",
+                [(t, cur.lastrowid, n) for t, n in counts.items()],
+            )
+
+    def refresh(self, roots: Iterable[str]) -> Dict[str, int]:
+        """Bring the index up to date for `roots`; returns counts of scanned/reindexed/removed files."""
+        stats = {"scanned": 0, "reindexed": 0, "removed": 0}
+        with self.db:  # one transaction for the whole refresh
+            for root in roots:
+                root_path = Path(root).expanduser().resolve()
+                prefix = str(root_path) + os.sep
+                known = {
+                    row[0]: row[1:] for row in self.db.execute(
+                        "SELECT path, mtime_ns, size, sha256 FROM files WHERE path LIKE ? ESCAPE '\\'",
+                        (_like_prefix(prefix),),
+                    )
+                }
+                seen = set()
+                for file in self._walk(root_path):
+                    try:
+                        st = file.stat()
+                    except OSError:
+                        continue
+                    if st.st_size > MAX_FILE_BYTES:
+                        continue
+                    key = str(file)
+                    seen.add(key)
+                    stats["scanned"] += 1
+                    old = known.get(key)
+                    if old and old[0] == st.st_mtime_ns and old[1] == st.st_size:
+                        continue  # unchanged: not even read
+                    try:
+                        data = file.read_bytes()
+                    except OSError:
+                        continue
+                    digest = hashlib.sha256(data).hexdigest()
+                    if old and old[2] == digest:
+                        # Touched but identical: just remember the new mtime
+                        self.db.execute(
+                            "UPDATE files SET mtime_ns = ?, size = ? WHERE path = ?",
+                            (st.st_mtime_ns, st.st_size, key),
+                        )
+                        continue
+                    self._drop(key)
+                    if _is_text(data):
+                        self._add(key, data.decode("utf-8", errors="replace"))
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO files (path, mtime_ns, size, sha256) VALUES (?, ?, ?, ?)",
+                        (key, st.st_mtime_ns, st.st_size, digest),
+                    )
+                    stats["reindexed"] += 1
+                for gone in set(known) - seen:
+                    self._drop(gone)
+                    self.db.execute("DELETE FROM files WHERE path = ?", (gone,))
+                    stats["removed"] += 1
+        return stats
+
+    # ---------------- Retrieval ----------------
+    def search(self, query: str, roots: Iterable[str], limit: int = 200) -> List[Chunk]:
+        """Chunks under `roots` ranked by BM25 against `query`."""
+        qterms = sorted(set(terms(query)))
+        if not qterms:
+            return []
+        where = " OR ".join("c.path LIKE ? ESCAPE '\\'" for _ in roots)
+        scope = [_like_prefix(str(Path(r).expanduser().resolve()) + os.sep) for r in roots]
+        n, total_len = self.db.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks c WHERE {where}", scope
+        ).fetchone()
+        if not n:
+            return []
+        avg_len = total_len / n or 1.0
+        marks = ",".join("?" for _ in qterms)
+        rows = self.db.execute(
+            f"""SELECT p.term, p.chunk, p.tf, c.length FROM postings p JOIN chunks c ON c.id = p.chunk
+                WHERE p.term IN ({marks}) AND ({where})""",
+            qterms + scope,
+        ).fetchall()
+        df = Counter(term for term, *_ in rows)
+        scores: Dict[int, float] = {}
+        for term, chunk, tf, length in rows:
+            idf = math.log(1 + (n - df[term] + 0.5) / (df[term] + 0.5))
+            norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len))
+            scores[chunk] = scores.get(chunk, 0.0) + idf * norm
+        best = sorted(scores.items(), key=lambda kv: -kv[1])[:limit]
+        if not best:
+            return []
+        marks = ",".join("?" for _ in best)
+        found = {
+            row[0]: row[1:] for row in self.db.execute(
+                f"SELECT id, path, start, end, text FROM chunks WHERE id IN ({marks})",
+                [cid for cid, _ in best],
+            )
+        }
+        return [Chunk(*found[cid], score=score) for cid, score in best if cid in found]
+
+
+def _like_prefix(prefix: str) -> str:
+    return prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def split_dirs(include: Optional[str]) -> List[str]:
+    return [d.strip() for d in (include or "").split(",") if d.strip()]
+
+
+def context_budget() -> int:
+    from .config import env_number
+    return env_number("DEEPGEM_CONTEXT_TOKENS", DEFAULT_CONTEXT_TOKENS, cast=int, lo=1)
+
+
+def select(chunks: Iterable[Chunk], budget: int) -> List[Chunk]:
+    """Best chunks (in rank order) that fit `budget` tokens, then put back in file order."""
+    from .tokens import estimate
+    picked, used = [], 0
+    for chunk in chunks:
+        cost = estimate(chunk.text) + 12   # header and fence
+        if used + cost > budget:
+            continue
+        picked.append(chunk)
+        used += cost
+    return sorted(picked, key=lambda c: (c.path, c.start))
+
+
+def render(chunks: List[Chunk], roots: Iterable[str]) -> str:
+    """The context block inlined ahead of the prompt."""
+    bases = [str(Path(r).expanduser().resolve()) for r in roots]
+
+    def rel(path: str) -> str:
+        for base in bases:
+            if path.startswith(base + os.sep):
+                return os.path.join(os.path.basename(base), path[len(base) + 1:])
+        return path
+
+    parts = ["Relevant excerpts from the included directories:"]
+    for c in chunks:
+        parts.append(f"### {rel(c.path)} (lines {c.start}-{c.end})\n```\n{c.text}\n```")
+    return "\n\n".join(parts)
+
+
+def build_context(prompt: str, include: str, budget: Optional[int] = None,
+                  index: Optional[FileIndex] = None) -> Tuple[str, Dict[str, int]]:
+    """Refresh the index for `include` (comma-separated dirs) and render the chunks for `prompt`."""
+    roots = [r for r in split_dirs(include) if Path(r).expanduser().is_dir()]
+    if not roots:
+        return "", {"chunks": 0, "files": 0, "scanned": 0, "reindexed": 0, "removed": 0}
+    own = index is None
+    index = index or FileIndex()
+    try:
+        stats = index.refresh(roots)
+        chunks = select(index.search(prompt, roots), budget or context_budget())
+    finally:
+        if own:
+            index.close()
+    stats.update(chunks=len(chunks), files=len({c.path for c in chunks}))
+    return (render(chunks, roots) if chunks else ""), stats
@@ -0,0 +1,234 @@
+"""Learned routing for `deepgem ask --learned`.
+
+Every `ask` appends an outcome to ``~/.cache/deepgem/router.jsonl``: the
+engine used, exit code, latency, tokens, and whether the user overrode the
+router with --force. Prompts aren't stored verbatim, only the 18-bit crc32
+buckets of their words. That is not anonymisation: anyone with the log can
+hash a word list and see which words were likely present, so treat
+router.jsonl like the prompts themselves (DEEPGEM_NO_METRICS=1 turns it off).
+`deepgem router train` fits one logistic model per engine on those outcomes
+and saves it as ``router-model.json``.
+
+Each outcome is turned into a reward in [0, 1]: zero for a failed call, then
+discounted by latency and tokens. An override counts as a strong vote for
+the forced engine and against the engine the router would have picked.
+Scoring adds the keyword router's pick as a prior. With no data every engine
+scores 0.5, so the learned router starts out agreeing with the keyword router.
+It diverges only as evidence builds up. Scoring a prompt hashes at most
+MAX_WORDS words plus a few extra features, then sums one dict lookup per
+feature and engine.
+"""
+import json
+import math
+import os
+import re
+import time
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .cache import cache_dir
+from .router import ENGINES, Route
+
+HASH_BITS = 18               # 262k buckets; collisions are harmless noise at this size
+MAX_WORDS = 128              # distinct words hashed per prompt
+PRIOR_WEIGHT = 0.25          # bonus for the keyword router's pick
+LEARNING_RATE = 0.1
+L2 = 1e-4
+EPOCHS = 5
+LATENCY_SCALE_S = 30.0       # reward halves roughly every 20s of wall time
+TOKEN_SCALE = 20_000         # ... and every ~14k tokens
+OVERRIDE_WEIGHT = 3          # an override counts as this many ordinary outcomes
+
+_WORD = re.compile(r"[a-z0-9_]+")
+
+
+def log_path() -> Path:
+    return Path(os.environ.get("DEEPGEM_ROUTER_LOG") or cache_dir() / "router.jsonl")
+
+
+def model_path() -> Path:
+    return Path(os.environ.get("DEEPGEM_ROUTER_MODEL") or cache_dir() / "router-model.json")
+
+
+def _bucket(name: str) -> int:
+    # crc32, not hash(): ids must be stable across processes
+    return zlib.crc32(name.encode("utf-8")) & ((1 << HASH_BITS) - 1)
+
+
+def feature_names(prompt: str, route: Optional[Route] = None) -> List[str]:
+    """Named features of `prompt`: words, a length bucket, code fences, keyword matches."""
+    low = prompt.lower()
+    words = list(dict.fromkeys(_WORD.findall(low)))[:MAX_WORDS]
+    names = ["bias", f"len:{min(int(math.log2(len(prompt) + 1)), 16)}"]
+    names += [f"w:{w}" for w in words]
+    if "```" in prompt:
+        names.append("fence")
+    if route is not None:
+        names.append(f"rule:{route.engine}")
+        names += [f"kw:{m}" for m in route.matches]
+    return names
+
+
+def featurize(prompt: str, route: Optional[Route] = None) -> List[int]:
+    return sorted({_bucket(n) for n in feature_names(prompt, route)})
+
+
+def reward(ok: bool, latency_ms: Optional[float], tokens: Optional[int]) -> float:
+    if not ok:
+        return 0.0
+    r = math.exp(-(latency_ms or 0.0) / 1000 / LATENCY_SCALE_S)
+    return r * math.exp(-(tokens or 0) / TOKEN_SCALE)
+
+
+# ---------------- Recording ----------------
+def record(
+    prompt: str,
+    engine: str,
+    exit_code: int,
+    latency_ms: float,
+    tokens: Optional[int] = None,
+    predicted: Optional[str] = None,
+    forced: bool = False,
+    path: Optional[Path] = None,
+):
+    """Append one outcome; `predicted` is what the router would have picked without --force."""
+    if os.environ.get("DEEPGEM_NO_METRICS"):
+        return
+    from .router import default_router
+    rec = {
+        "ts": round(time.time(), 3),
+        "features": featurize(prompt, default_router().route(prompt)),
+        "engine": engine,
+        "exit_code": exit_code,
+        "latency_ms": round(latency_ms, 1),
+        "tokens": tokens,
+    }
+    if forced and predicted and predicted != engine:
+        rec["override"] = predicted
+    path = path or log_path()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec) + "\n")
+    except OSError:
+        pass  # like metrics: recording must never break the call
+
+
+def load_outcomes(path: Optional[Path] = None) -> Iterable[Dict]:
+    path = path or log_path()
+    if not path.exists():
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+# ---------------- Model ----------------
+def _sigmoid(z: float) -> float:
+    if z < -30:
+        return 0.0
+    if z > 30:
+        return 1.0
+    return 1 / (1 + math.exp(-z))
+
+
+@dataclass
+class Explanation:
+    engine: str
+    scores: Dict[str, float]                  # final score per engine (probability + prior)
+    top: Dict[str, List[Tuple[str, float]]] = field(default_factory=dict)  # strongest features per engine
+    reason: str = "learned"
+
+
+class LearnedRouter:
+    def __init__(self, weights: Optional[Dict[str, Dict[int, float]]] = None, trained_on: int = 0):
+        self.weights = weights or {e: {} for e in ENGINES}
+        self.trained_on = trained_on
+
+    # Persistence: sparse {bucket: weight} per engine
+    @classmethod
+    def load(cls, path: Optional[Path] = None) -> Optional["LearnedRouter"]:
+        path = path or model_path()
+        try:
+            data = json.loads(path.read_text())
+            weights = {e: {int(k): float(v) for k, v in data["weights"].get(e, {}).items()} for e in ENGINES}
+            return cls(weights, int(data.get("trained_on", 0)))
+        except (OSError, ValueError, TypeError, KeyError, AttributeError):
+            return None
+
+    def save(self, path: Optional[Path] = None):
+        path = path or model_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({
+            "version": 1, "hash_bits": HASH_BITS, "trained_on": self.trained_on,
+            "saved": round(time.time(), 3),
+            "weights": {e: {str(k): round(v, 6) for k, v in w.items() if abs(v) > 1e-6}
+                        for e, w in self.weights.items()},
+        }))
+        os.replace(tmp, path)
+
+    def _prob(self, engine: str, features: List[int]) -> float:
+        w = self.weights[engine]
+        return _sigmoid(sum(w.get(f, 0.0) for f in features))
+
+    def _step(self, engine: str, features: List[int], target: float, weight: float = 1.0):
+        w = self.weights[engine]
+        grad = (self._prob(engine, features) - target) * weight
+        for f in features:
+            old = w.get(f, 0.0)
+            w[f] = old - LEARNING_RATE * (grad + L2 * old)
+
+    def fit(self, outcomes: Iterable[Dict], epochs: int = EPOCHS) -> int:
+        """Train from scratch on logged outcomes; returns how many were used."""
+        rows = [o for o in outcomes if o.get("engine") in ENGINES and o.get("features")]
+        self.weights = {e: {} for e in ENGINES}
+        for _ in range(epochs):
+            for o in rows:
+                feats = o["features"]
+                ok = not o.get("exit_code")
+                self._step(o["engine"], feats, reward(ok, o.get("latency_ms"), o.get("tokens")))
+                if o.get("override") in ENGINES:
+                    # The user chose o["engine"] over the router's pick
+                    self._step(o["engine"], feats, 1.0, OVERRIDE_WEIGHT)
+                    self._step(o["override"], feats, 0.0, OVERRIDE_WEIGHT)
+        self.trained_on = len(rows)
+        return len(rows)
+
+    def route(self, prompt: str, prior: Optional[Route] = None) -> Route:
+        """Pick an engine; `prior` is the keyword router's decision (computed if omitted)."""
+        if prior is None:
+            from .router import default_router
+            prior = default_router().route(prompt)
+        feats = featurize(prompt, prior)
+        scores = {
+            e: self._prob(e, feats) + (PRIOR_WEIGHT if e == prior.engine else 0.0) for e in ENGINES
+        }
+        best = max(ENGINES, key=lambda e: (scores[e], -ENGINES.index(e)))
+        return Route(best, scores, prior.matches, "learned" if best != prior.engine else f"learned ({prior.reason})")
+
+    def explain(self, prompt: str, top: int = 5) -> Explanation:
+        from .router import default_router
+        prior = default_router().route(prompt)
+        r = self.route(prompt, prior)
+        names = {_bucket(n): n for n in feature_names(prompt, prior)}
+        contrib = {
+            e: sorted(
+                ((names[f], self.weights[e].get(f, 0.0)) for f in names if self.weights[e].get(f)),
+                key=lambda kv: -abs(kv[1]),
+            )[:top]
+            for e in ENGINES
+        }
+        return Explanation(r.engine, r.scores, contrib, r.reason)
+
+
+def train(log: Optional[Path] = None, out: Optional[Path] = None, epochs: int = EPOCHS) -> LearnedRouter:
+    model = LearnedRouter()
+    model.fit(load_outcomes(log), epochs)
+    model.save(out)
+    return model
@@ -0,0 +1,204 @@
+"""Map-reduce over inputs larger than the model context (`chat --input`).
+
+Inputs (files or stdin) are read lazily and cut into chunks of about
+`chunk_tokens` (estimated locally, see tokens.py) with a small overlap, so a fact straddling a boundary is seen
+whole at least once. Map calls run on a bounded thread pool that reads ahead at
+most twice its size, so memory stays flat however large the input is; only the
+(short) per-chunk results are kept. If those don't fit one reduce call they are
+reduced in groups, level by level, until one final reduce remains.
+"""
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from .tokens import estimate
+
+DEFAULT_CHUNK_TOKENS = 12_000
+DEFAULT_OVERLAP_TOKENS = 200
+MAX_CHARS_PER_TOKEN = 8   # a line longer than chunk_tokens * this is cut without estimating
+MAX_REDUCE_LEVELS = 4
+
+MAP_TEMPLATE = (
+    "{task}\n\n"
+    "The input is too long to read at once, so you are seeing part {n} of it "
+    "(neighbouring parts overlap slightly). Extract everything in this part that is "
+    "relevant to the task, concisely. If nothing is relevant, reply exactly: NOTHING RELEVANT\n\n"
+    "<part {n}>\n{chunk}\n</part {n}>"
+)
+REDUCE_TEMPLATE = (
+    "{task}\n\n"
+    "The input was split into parts and each part was analysed separately. "
+    "Combine the partial results below into a single answer to the task. "
+    "Parts may repeat each other where they overlapped.\n\n{parts}"
+)
+
+
+def read_lines(sources: Iterable[str]) -> Iterator[str]:
+    """Lines from each source in turn ('-' is stdin), never the whole file at once."""
+    for src in sources:
+        if src == "-":
+            yield from sys.stdin
+            continue
+        with open(src, encoding="utf-8", errors="replace") as f:
+            yield from f
+
+
+def chunk_text(
+    lines: Iterable[str],
+    chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+) -> Iterator[str]:
+    """Group lines into chunks of ~`chunk_tokens`, each starting with the previous one's tail."""
+    limit = max(1, chunk_tokens)
+    overlap = min(max(0, overlap_tokens), limit // 2)
+    cut = limit * MAX_CHARS_PER_TOKEN
+    buf: List[str] = []
+    costs: List[int] = []
+    size = 0
+    fresh = False   # does `buf` hold anything beyond the carried-over overlap?
+
+    def tail():
+        n = k = 0
+        for c in reversed(costs):
+            if n + c > overlap:
+                break
+            n += c
+            k += 1
+        return (buf[len(buf) - k:], costs[len(costs) - k:]) if k else ([], [])
+
+    for line in lines:
+        # A very long line is cut into pieces first, then costed like any other
+        pieces = [line[i:i + cut] for i in range(0, len(line), cut)] or [line]
+        for piece in pieces:
+            cost = estimate(piece)
+            if fresh and size + cost > limit:
+                yield "".join(buf)
+                buf, costs = tail()
+                size = sum(costs)
+            buf.append(piece)
+            costs.append(cost)
+            size += cost
+            fresh = True
+    if fresh:
+        yield "".join(buf)
+
+
+def group_by_budget(texts: List[str], budget_tokens: int) -> List[List[str]]:
+    """Consecutive groups of `texts` that each fit `budget_tokens` (at least one text per group)."""
+    groups: List[List[str]] = []
+    size = 0
+    for text in texts:
+        cost = estimate(text)
+        if not groups or size + cost > budget_tokens:
+            groups.append([])
+            size = 0
+        groups[-1].append(text)
+        size += cost
+    return groups
+
+
+def reduce_prompt(task: str, partials: List[str]) -> str:
+    parts = "\n\n".join(f"<result {i}>\n{p}\n</result {i}>" for i, p in enumerate(partials, 1))
+    return REDUCE_TEMPLATE.format(task=task, parts=parts)
+
+
+@dataclass
+class Partial:
+    index: int          # 0-based chunk number
+    chars: int          # size of the chunk it came from
+    text: str = ""
+    error: Optional[str] = None
+    seconds: float = 0.0
+
+
+def run_map(
+    chunks: Iterable[str],
+    task: str,
+    complete: Callable[[str], str],
+    concurrency: int = 4,
+    on_partial: Optional[Callable[[Partial], None]] = None,
+) -> List[Partial]:
+    """Map every chunk through ``complete(prompt)`` with at most `concurrency` calls in flight.
+
+    Chunks are pulled from the iterator only as slots free up. Results are
+    returned in input order; `on_partial` sees each one as it finishes.
+    """
+    def one(index: int, chunk: str) -> Partial:
+        t0 = time.perf_counter()
+        part = Partial(index, len(chunk))
+        try:
+            part.text = complete(MAP_TEMPLATE.format(task=task, n=index + 1, chunk=chunk))
+        except Exception as e:
+            part.error = str(e) or type(e).__name__
+        part.seconds = time.perf_counter() - t0
+        return part
+
+    results: Dict[int, Partial] = {}
+
+    def collect(futures):
+        for fut in futures:
+            part = fut.result()
+            results[part.index] = part
+            if on_partial:
+                on_partial(part)
+
+    concurrency = max(1, concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        inflight = set()
+        for index, chunk in enumerate(chunks):
+            if len(inflight) >= concurrency * 2:
+                done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                collect(done)
+            inflight.add(pool.submit(one, index, chunk))
+        while inflight:
+            done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+            collect(done)
+    return [results[i] for i in sorted(results)]
+
+
+def reduce_levels(
+    task: str,
+    partials: List[str],
+    complete: Callable[[str], str],
+    budget_tokens: int = DEFAULT_CHUNK_TOKENS,
+    concurrency: int = 4,
+    on_level: Optional[Callable[[int, int], None]] = None,
+    on_error: Optional[Callable[[int, int, str], None]] = None,
+) -> List[str]:
+    """Reduce `partials` in groups until they fit one call; returns what the final reduce gets.
+
+    `on_level(level, groups)` is called before each intermediate round. A group
+    whose reduce call fails keeps its partials unreduced for the next level and
+    is reported to `on_error(level, group, error)`; a level where every call
+    fails ends the reduction, leaving the final call the texts as they are.
+    """
+    texts = [p for p in partials if p.strip() and p.strip() != "NOTHING RELEVANT"] or partials[:1]
+    level = 0
+    while True:
+        groups = group_by_budget(texts, budget_tokens)
+        if len(groups) <= 1 or level >= MAX_REDUCE_LEVELS:
+            return texts
+        level += 1
+        if on_level:
+            on_level(level, len(groups))
+
+        def one(group: List[str]):
+            try:
+                return complete(reduce_prompt(task, group)), None
+            except Exception as e:
+                return None, str(e) or type(e).__name__
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            results = list(pool.map(one, groups))
+        texts = []
+        for i, (group, (text, error)) in enumerate(zip(groups, results)):
+            if error is None:
+                texts.append(text)
+                continue
+            if on_error:
+                on_error(level, i, error)
+            texts.extend(group)
+        if all(error is not None for _, error in results):
+            return texts
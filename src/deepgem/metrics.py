@@ -0,0 +1,219 @@
+"""Latency and token instrumentation for engine calls.
+
+Every DeepSeek/Gemini call appends one JSON record to a local log
+(``~/.cache/deepgem/metrics.jsonl`` or DEEPGEM_METRICS_LOG); `deepgem stats`
+aggregates it. Prompts and responses are never written, only timings and counts.
+Once the log passes its size limit it is renamed to ``metrics.jsonl.1``
+(replacing the previous one) and a fresh log started, so at most two limits'
+worth is kept. Readers see both files, oldest record first.
+"""
+import json
+import os
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .cache import cache_dir
+
+RECENT_BYTES = 256 * 1024          # how much of the log readers that want only recent calls look at
+DEFAULT_MAX_BYTES = 8 * 2**20      # log size that triggers rotation; DEEPGEM_METRICS_MAX_MB overrides
+
+
+def metrics_path() -> Path:
+    return Path(os.environ.get("DEEPGEM_METRICS_LOG") or cache_dir() / "metrics.jsonl")
+
+
+def rotated_path(path: Path) -> Path:
+    return path.with_name(path.name + ".1")
+
+
+def _max_bytes() -> int:
+    from .config import env_number
+    mb = env_number("DEEPGEM_METRICS_MAX_MB", None, lo=0.01)
+    return int(mb * 2**20) if mb is not None else DEFAULT_MAX_BYTES
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """Linear-interpolated percentile (q in 0..100); None for no data."""
+    if not values:
+        return None
+    xs = sorted(values)
+    pos = (len(xs) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (pos - lo)
+
+
+def cached_prompt_tokens(usage: Optional[Dict]) -> Optional[int]:
+    """Prompt tokens served from the provider's context cache, if reported."""
+    if not usage:
+        return None
+    if usage.get("prompt_cache_hit_tokens") is not None:  # DeepSeek
+        return usage["prompt_cache_hit_tokens"]
+    details = usage.get("prompt_tokens_details") or {}   # OpenAI style
+    return details.get("cached_tokens")
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+class CallTimer:
+    """Collects timing for one streamed call; feed it each chunk as it arrives."""
+
+    def __init__(self, engine: str, model: Optional[str]):
+        self.engine = engine
+        self.model = model
+        self.via = "direct"
+        self.usage: Optional[Dict] = None
+        self.extra: Dict = {}
+        self.t0 = time.perf_counter()
+        self.first: Optional[float] = None
+        self.last: Optional[float] = None
+        self.gaps: List[float] = []
+        self.chunks = 0
+        self.chars = 0
+
+    def chunk(self, text: str = ""):
+        now = time.perf_counter()
+        if self.first is None:
+            self.first = now
+        else:
+            self.gaps.append(now - self.last)
+        self.last = now
+        self.chunks += 1
+        self.chars += len(text)
+
+    def finish(self, exit_code: int = 0, error: Optional[str] = None) -> Dict:
+        total = time.perf_counter() - self.t0
+        usage = self.usage or {}
+        completion = usage.get("completion_tokens")
+        # Without usage, one streamed chunk is roughly one token on DeepSeek
+        out_tokens = completion if completion is not None else (self.chunks or None)
+        gen_time = None
+        if self.first is not None and self.last != self.first:
+            gen_time = self.last - self.first
+        rec = {
+            "ts": round(time.time(), 3),
+            "engine": self.engine,
+            "model": self.model,
+            "via": self.via,
+            "exit_code": exit_code,
+            "ttft_ms": _ms(self.first - self.t0) if self.first is not None else None,
+            "total_ms": _ms(total),
+            "chunks": self.chunks,
+            "chars": self.chars,
+            "gap_p50_ms": _ms(percentile(self.gaps, 50)),
+            "gap_max_ms": _ms(max(self.gaps)) if self.gaps else None,
+            "tokens_per_s": round(out_tokens / gen_time, 1) if out_tokens and gen_time else None,
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "completion_tokens": completion,
+            "cached_tokens": cached_prompt_tokens(usage),
+        }
+        if self.engine == "deepseek" and usage:
+            from .tokens import cost
+            usd = cost(self.model, usage.get("prompt_tokens"), completion, rec["cached_tokens"])
+            if usd is not None:
+                rec["cost_usd"] = round(usd, 6)
+        if error:
+            rec["error"] = error[:200]
+        rec.update(self.extra)
+        return rec
+
+
+def append(record: Dict, path: Optional[Path] = None):
+    """Append one record; metrics must never break the call they describe."""
+    if os.environ.get("DEEPGEM_NO_METRICS"):
+        return
+    path = path or metrics_path()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            if f.tell() > _max_bytes():
+                # Only rotate the file we wrote to: another process may have rotated it already
+                if os.path.samestat(os.fstat(f.fileno()), os.stat(path)):
+                    os.replace(path, rotated_path(path))
+    except OSError:
+        pass
+
+
+def load(
+    path: Optional[Path] = None,
+    since: Optional[float] = None,
+    tail_bytes: Optional[int] = None,
+) -> Iterator[Dict]:
+    """Records from the log, optionally only those in its last `tail_bytes` bytes.
+
+    The rotated log is read first; with `tail_bytes` only as much of it as the
+    current log falls short of.
+    """
+    path = path or metrics_path()
+    parts = [(rotated_path(path), tail_bytes), (path, tail_bytes)]
+    if tail_bytes is not None:
+        size = path.stat().st_size if path.exists() else 0
+        parts = [(path, tail_bytes)] if size >= tail_bytes else [(rotated_path(path), tail_bytes - size), (path, None)]
+    for part, tail in parts:
+        if not part.exists():
+            continue
+        with open(part, "rb") as f:
+            if tail is not None and f.seek(0, os.SEEK_END) > tail:
+                f.seek(-tail, os.SEEK_END)
+                f.readline()  # skip the partial first line
+            else:
+                f.seek(0)
+            for raw in f:
+                line = raw.decode("utf-8", errors="replace")
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                if since is None or rec.get("ts", 0) >= since:
+                    yield rec
+
+
+def summary_line(rec: Dict) -> str:
+    """One-line human summary used by --metrics."""
+    parts = [f"{rec['engine']}:{rec.get('model') or '-'}", f"via {rec['via']}"]
+    if rec.get("endpoint") not in (None, "default"):
+        parts[0] += f" @{rec['endpoint']}"
+    if rec.get("ttft_ms") is not None:
+        parts.append(f"ttft {rec['ttft_ms']:.0f} ms")
+    parts.append(f"total {rec['total_ms']:.0f} ms")
+    if rec.get("gap_max_ms") is not None:
+        parts.append(f"gap p50/max {rec['gap_p50_ms']:.0f}/{rec['gap_max_ms']:.0f} ms")
+    if rec.get("tokens_per_s"):
+        parts.append(f"{rec['tokens_per_s']:.0f} tok/s")
+    if rec.get("prompt_tokens") is not None:
+        tok = f"tokens in/out {rec['prompt_tokens']}/{rec.get('completion_tokens')}"
+        if rec.get("cached_tokens"):
+            tok += f" ({rec['cached_tokens']} cached)"
+        parts.append(tok)
+    if rec.get("cost_usd") is not None:
+        parts.append(f"~${rec['cost_usd']:.5f}")
+    if rec.get("bytes") is not None:
+        parts.append(f"{rec['bytes']} bytes")
+    return " · ".join(parts)
+
+
+def aggregate(records: Iterable[Dict], by: Tuple[str, ...] = ("engine", "model")) -> List[Dict]:
+    """p50/p95/p99 of TTFT and total latency, median tok/s and error rate per group."""
+    groups: Dict[Tuple, List[Dict]] = defaultdict(list)
+    for rec in records:
+        groups[tuple(rec.get(k) for k in by)].append(rec)
+    rows = []
+    for key, recs in sorted(groups.items(), key=lambda kv: tuple(str(k) for k in kv[0])):
+        row = dict(zip(by, key))
+        row["calls"] = len(recs)
+        row["errors"] = sum(1 for r in recs if r.get("exit_code"))
+        for field in ("ttft_ms", "total_ms"):
+            vals = [r[field] for r in recs if r.get(field) is not None]
+            for q in (50, 95, 99):
+                row[f"{field[:-3]}_p{q}"] = percentile(vals, q)
+        row["tokens_per_s_p50"] = percentile(
+            [r["tokens_per_s"] for r in recs if r.get("tokens_per_s")], 50
+        )
+        rows.append(row)
+    return rows
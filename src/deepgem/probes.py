@@ -0,0 +1,158 @@
+"""Health and latency probes for `deepgem doctor`.
+
+Checks run concurrently on daemon threads under one deadline, so a hung DNS
+lookup or a stalled endpoint costs at most `timeout` seconds and never holds
+up exit. With ``doctor --bench`` the probes also time each phase of reaching
+DeepSeek (DNS, TCP, TLS, first response byte), the first token of a one-token
+completion per model, and spawning ``gemini --version``.
+"""
+import socket
+import ssl
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+DEFAULT_TIMEOUT = 10.0
+PROBE_MODELS = ("deepseek-chat", "deepseek-reasoner")
+
+# A check returns (detail, timings in ms) or raises
+CheckFn = Callable[[], Tuple[str, Dict[str, Optional[float]]]]
+
+
+@dataclass
+class Check:
+    name: str
+    ok: bool = False
+    ms: Optional[float] = None
+    detail: str = ""
+    error: Optional[str] = None
+    timings: Dict[str, Optional[float]] = field(default_factory=dict)
+
+
+def _ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000, 1)
+
+
+def run_checks(checks: Dict[str, CheckFn], timeout: float = DEFAULT_TIMEOUT) -> Dict[str, Check]:
+    """Run every check at once; any still running after `timeout` seconds is reported as timed out."""
+    results = {name: Check(name) for name in checks}
+    done = {name: threading.Event() for name in checks}
+
+    def run(name: str, fn: CheckFn):
+        check = results[name]
+        t0 = time.perf_counter()
+        try:
+            check.detail, check.timings = fn()
+            check.ok = True
+        except Exception as e:
+            check.error = str(e).strip().splitlines()[0][:160] if str(e).strip() else type(e).__name__
+        check.ms = _ms(t0)
+        done[name].set()
+
+    for name, fn in checks.items():
+        threading.Thread(target=run, args=(name, fn), daemon=True).start()
+    deadline = time.monotonic() + timeout
+    for name in checks:
+        if not done[name].wait(max(0.0, deadline - time.monotonic())):
+            # The thread keeps running in the background; report what we know now
+            results[name] = Check(name, ms=round(timeout * 1000, 1), error=f"timed out after {timeout:g}s")
+    return results
+
+
+# ---------------- Probes ----------------
+def connection_timings(base_url: str, timeout: float = DEFAULT_TIMEOUT) -> CheckFn:
+    """DNS, TCP connect, TLS handshake and time to the first response byte for `base_url`.
+
+    Uses a raw socket, so it measures the direct route even when the SDK goes
+    through HTTPS_PROXY; compare it with the TTFT probes to spot a slow proxy.
+    """
+    def probe():
+        url = urlparse(base_url)
+        https = url.scheme == "https"
+        host, port = url.hostname, url.port or (443 if https else 80)
+        t0 = time.perf_counter()
+        family, kind, proto, _, addr = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+        timings: Dict[str, Optional[float]] = {"dns_ms": _ms(t0)}
+        sock = socket.socket(family, kind, proto)
+        sock.settimeout(timeout)
+        try:
+            t0 = time.perf_counter()
+            sock.connect(addr)
+            timings["tcp_ms"] = _ms(t0)
+            timings["tls_ms"] = None
+            if https:
+                t0 = time.perf_counter()
+                sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+                timings["tls_ms"] = _ms(t0)
+            path = url.path.rstrip("/") + "/models"
+            t0 = time.perf_counter()
+            sock.sendall(
+                f"GET {path} HTTP/1.1\r\nHost: {host}\r\nUser-Agent: deepgem-doctor\r\n"
+                "Connection: close\r\n\r\n".encode("ascii")
+            )
+            status = sock.recv(64).split(b" ", 2)[1:2]
+            timings["rtt_ms"] = _ms(t0)
+        finally:
+            sock.close()
+        code = status[0].decode("ascii", "replace") if status else "?"
+        return f"HTTP {code} from {addr[0]}", timings
+
+    return probe
+
+
+def models_check(client, timeout: float = DEFAULT_TIMEOUT) -> CheckFn:
+    """The original doctor check: an authenticated ``models.list()``."""
+    def probe():
+        t0 = time.perf_counter()
+        models = client.with_options(timeout=timeout).models.list()
+        names = [m.id for m in models.data]
+        return f"{len(names)} model(s)", {"list_ms": _ms(t0)}
+
+    return probe
+
+
+def ttft_check(client, model: str, timeout: float = DEFAULT_TIMEOUT) -> CheckFn:
+    """Time to the first streamed token of a one-token completion on `model`.
+
+    The API sends a role-only chunk first; the clock stops at the first chunk
+    carrying text (or, on the reasoner, reasoning text).
+    """
+    def probe():
+        t0 = time.perf_counter()
+        resp = client.with_options(timeout=timeout).chat.completions.create(
+            model=model, messages=[{"role": "user", "content": "ping"}],
+            max_tokens=1, stream=True,
+        )
+        try:
+            first = None
+            for chunk in resp:
+                delta = chunk.choices[0].delta if chunk.choices else None
+                if delta and (delta.content or getattr(delta, "reasoning_content", None)):
+                    first = _ms(t0)
+                    break
+        finally:
+            resp.close()
+        if first is None:
+            raise RuntimeError("stream ended without a token")
+        return model, {"ttft_ms": first}
+
+    return probe
+
+
+def spawn_check(gemini_path: str, timeout: float = DEFAULT_TIMEOUT) -> CheckFn:
+    """How long `gemini --version` takes to start, print and exit."""
+    def probe():
+        t0 = time.perf_counter()
+        proc = subprocess.run(
+            [gemini_path, "--version"], capture_output=True, text=True,
+            stdin=subprocess.DEVNULL, timeout=timeout,
+        )
+        ms = _ms(t0)
+        if proc.returncode != 0:
+            raise RuntimeError(f"exited {proc.returncode}: {proc.stderr.strip()[-120:]}")
+        return f"v{proc.stdout.strip()}", {"spawn_ms": ms}
+
+    return probe
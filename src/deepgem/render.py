@@ -0,0 +1,135 @@
+"""Output renderers for streamed model text.
+
+`StreamRenderer` replaces one write+flush per token: on a terminal it flushes
+each delta immediately (what a human wants), when piped it buffers and writes
+in large blocks. `MarkdownRenderer` renders markdown live with rich, printing
+finished blocks once and only re-rendering the block still being streamed.
+"""
+import sys
+import time
+from typing import List, Optional, TextIO
+
+PIPE_FLUSH_BYTES = 64 * 1024
+
+
+class StreamRenderer:
+    def __init__(
+        self,
+        out: Optional[TextIO] = None,
+        interactive: Optional[bool] = None,
+        flush_interval: Optional[float] = None,
+        flush_bytes: int = PIPE_FLUSH_BYTES,
+    ):
+        """`flush_interval` (seconds) adds a time threshold to the piped mode, which is
+        otherwise fully buffered; DEEPGEM_FLUSH_INTERVAL sets it from the environment."""
+        self.out = out or sys.stdout
+        if interactive is None:
+            interactive = hasattr(self.out, "isatty") and self.out.isatty()
+        self.interactive = interactive
+        if flush_interval is None:
+            from .config import env_number
+            flush_interval = env_number("DEEPGEM_FLUSH_INTERVAL", None, lo=0)
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.parts: List[str] = []
+        self.size = 0
+        self.last_flush = time.monotonic()
+        self.wrote_any = False
+
+    def write(self, text: str):
+        if not text:
+            return
+        self.wrote_any = True
+        if self.interactive:
+            self.out.write(text)
+            self.out.flush()
+            return
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.flush_bytes or (
+            self.flush_interval is not None
+            and time.monotonic() - self.last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            self.out.write("".join(self.parts))
+            self.parts.clear()
+            self.size = 0
+        self.out.flush()
+        self.last_flush = time.monotonic()
+
+    def close(self, newline: bool = True):
+        if newline:
+            self.write("\n")
+        self.flush()
+
+
+def _open_fences(text: str) -> int:
+    return sum(1 for line in text.splitlines() if line.lstrip().startswith(("```", "~~~")))
+
+
+class MarkdownRenderer:
+    """Live markdown: finished blocks are printed once, only the tail block re-renders."""
+
+    def __init__(self, console, refresh_per_second: float = 8):
+        from rich.live import Live
+
+        self.console = console
+        self.pending = ""
+        self.wrote_any = False
+        self.live = Live(
+            console=console, refresh_per_second=refresh_per_second,
+            transient=True, vertical_overflow="visible",
+        )
+        self.live.start()
+
+    def _markdown(self, text: str):
+        from rich.markdown import Markdown
+        return Markdown(text)
+
+    def write(self, text: str):
+        if not text:
+            return
+        self.wrote_any = True
+        self.pending += text
+        # A blank line outside a code fence ends a block; print it for good
+        start = 0
+        while True:
+            i = self.pending.find("\n\n", start)
+            if i < 0:
+                break
+            block = self.pending[:i]
+            if _open_fences(block) % 2:
+                start = i + 2
+                continue
+            if block.strip():
+                self.live.console.print(self._markdown(block))
+            self.pending = self.pending[i + 2:]
+            start = 0
+        self.live.update(self._markdown(self.pending))
+
+    def flush(self):
+        self.live.refresh()
+
+    def close(self, newline: bool = True):
+        self.live.update("")
+        self.live.stop()
+        if self.pending.strip():
+            self.console.print(self._markdown(self.pending))
+        self.pending = ""
+
+
+def make_renderer(markdown: bool = False, console=None, out: Optional[TextIO] = None):
+    """Markdown renderer on an interactive terminal when asked for, plain text otherwise.
+
+    Under `--output` the text becomes delta events instead (see events.py).
+    """
+    from .events import SinkRenderer, current
+    if current() is not None and out is None:
+        return SinkRenderer(current())
+    out = out or sys.stdout
+    if markdown and console is not None and hasattr(out, "isatty") and out.isatty():
+        return MarkdownRenderer(console)
+    return StreamRenderer(out)
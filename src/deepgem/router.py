@@ -0,0 +1,217 @@
+"""Compiled keyword router behind `pick_engine` and `deepgem ask`.
+
+All rule phrases are compiled once into a single trie-shaped regex with word
+boundaries, so a prompt is scanned in one pass and "class" no longer matches
+inside "classic". Each phrase carries a per-engine weight; user rules from
+``~/.deepgem.rules.json`` (or DEEPGEM_RULES) extend or replace the defaults::
+
+    {
+      "extend": true,
+      "threshold": 1.0,
+      "long_prompt_tokens": 300,
+      "rules": [
+        {"match": "kubernetes", "engine": "gemini", "weight": 2},
+        {"match": "explain", "engine": "gemini", "weight": -0.5}
+      ]
+    }
+
+Prompts over `long_prompt_tokens` (estimated locally, see tokens.py) go to
+the reasoner; a rules file may instead set the older `long_prompt_chars`.
+A rules file that can't be used is reported (file and line) on stderr and
+the built-in rules are used instead.
+"""
+import functools
+import json
+import os
+import re
+import sys
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+ENGINES = ("gemini", "deepseek-chat", "deepseek-reasoner")
+
+CODE_HINTS = (
+    "code", "bug", "test", "compile", "stack trace", "build", "function",
+    "class", "typescript", "python", "node", "react", "docker", "sql",
+    "write a script", "refactor", "fix", "unit test", "terminal", "shell",
+)
+REASONING_HINTS = ("think step by step", "chain-of-thought")
+
+DEFAULT_RULES: Tuple[Tuple[str, str, float], ...] = (
+    tuple((k, "gemini", 1.0) for k in CODE_HINTS)
+    + tuple((k, "deepseek-reasoner", 1.0) for k in REASONING_HINTS)
+)
+DEFAULT_THRESHOLD = 1.0
+DEFAULT_LONG_PROMPT_TOKENS = 300
+
+
+def legacy_pick_engine(prompt: str) -> str:
+    """The original substring heuristic, kept for `deepgem bench router` comparisons."""
+    p = prompt.lower()
+    if any(k in p for k in CODE_HINTS):
+        return "gemini"
+    if len(p) > 1200 or "think step by step" in p or "chain-of-thought" in p:
+        return "deepseek-reasoner"
+    return "deepseek-chat"
+
+
+def _normalize(phrase: str) -> str:
+    return " ".join(phrase.lower().split())
+
+
+def _trie_pattern(phrases: Iterable[str]) -> str:
+    """Regex alternation shaped as a trie, so shared prefixes are matched once."""
+    trie: Dict = {}
+    for phrase in phrases:
+        node = trie
+        for ch in phrase:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node: Dict) -> str:
+        branches = [
+            (r"\s+" if ch == " " else re.escape(ch)) + build(child)
+            for ch, child in sorted((k, v) for k, v in node.items() if k)
+        ]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:  # a phrase ends here; longer ones continue optionally
+            return "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+class RulesError(ValueError):
+    """A rules file that can't be used; the message names the file and line."""
+
+
+def _line_of(text: str, needle: str) -> int:
+    """1-based line of the first occurrence of `needle` in `text` (1 if absent)."""
+    pos = text.find(needle)
+    return text.count("\n", 0, pos) + 1 if pos >= 0 else 1
+
+
+@dataclass
+class Route:
+    engine: str
+    scores: Dict[str, float] = field(default_factory=dict)
+    matches: List[str] = field(default_factory=list)
+    reason: str = ""
+
+
+class Router:
+    def __init__(
+        self,
+        rules: Iterable[Tuple[str, str, float]] = DEFAULT_RULES,
+        threshold: float = DEFAULT_THRESHOLD,
+        long_prompt_tokens: int = DEFAULT_LONG_PROMPT_TOKENS,
+        long_prompt_chars: Optional[int] = None,
+    ):
+        self.threshold = threshold
+        self.long_prompt_tokens = long_prompt_tokens
+        self.long_prompt_chars = long_prompt_chars
+        self.table: Dict[str, List[Tuple[str, float]]] = defaultdict(list)
+        for phrase, engine, weight in rules:
+            if engine not in ENGINES:
+                raise ValueError(f"unknown engine {engine!r} in routing rule {phrase!r}")
+            self.table[_normalize(phrase)].append((engine, float(weight)))
+        # Whole words only; an optional plural suffix keeps "tests"/"classes" matching.
+        # Matched against lowercased text: re.IGNORECASE roughly doubles scan time.
+        pattern = _trie_pattern(sorted(self.table))
+        self.regex = re.compile(r"(?<!\w)(" + pattern + r")(?:e?s)?(?!\w)")
+
+    @classmethod
+    def from_file(cls, path: Path) -> "Router":
+        """Load a rules file; raises RulesError naming the file and line of the first problem."""
+        text = Path(path).read_text(encoding="utf-8")
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise RulesError(f"{path}:{getattr(e, 'lineno', 1)}: invalid JSON ({getattr(e, 'msg', e)})")
+        if not isinstance(data, dict) or not isinstance(data.get("rules", []), list):
+            raise RulesError(f"{path}:1: expected an object with a \"rules\" list")
+        rules = []
+        for i, r in enumerate(data.get("rules", []), 1):
+            where = f"{path}:{_line_of(text, json.dumps(r.get('match'))) if isinstance(r, dict) else 1}"
+            if not isinstance(r, dict) or not isinstance(r.get("match"), str) or not r["match"].strip():
+                raise RulesError(f"{where}: rule {i} needs a non-empty \"match\" string")
+            if r.get("engine") not in ENGINES:
+                raise RulesError(f"{where}: rule {i} has unknown engine {r.get('engine')!r} (expected one of {', '.join(ENGINES)})")
+            try:
+                weight = float(r.get("weight", 1.0))
+            except (TypeError, ValueError):
+                raise RulesError(f"{where}: rule {i} has a non-numeric weight {r.get('weight')!r}")
+            rules.append((r["match"], r["engine"], weight))
+        if data.get("extend", True):
+            rules = list(DEFAULT_RULES) + rules
+        try:
+            chars = data.get("long_prompt_chars")
+            return cls(
+                rules,
+                threshold=float(data.get("threshold", DEFAULT_THRESHOLD)),
+                long_prompt_tokens=int(data.get("long_prompt_tokens", DEFAULT_LONG_PROMPT_TOKENS)),
+                long_prompt_chars=None if chars is None else int(chars),
+            )
+        except (TypeError, ValueError, re.error) as e:
+            raise RulesError(f"{path}:1: {e}")
+
+    def is_long(self, prompt: str) -> bool:
+        if self.long_prompt_chars is not None:
+            return len(prompt) > self.long_prompt_chars
+        # A token spans at least one character, so short prompts skip the estimate
+        if len(prompt) <= self.long_prompt_tokens:
+            return False
+        from .tokens import estimate
+        return estimate(prompt) > self.long_prompt_tokens
+
+    def route(self, prompt: str) -> Route:
+        # Each distinct phrase counts once, so repetition can't swamp the score
+        matches = sorted({_normalize(m) for m in self.regex.findall(prompt.lower())})
+        scores: Dict[str, float] = defaultdict(float)
+        for phrase in matches:
+            for engine, weight in self.table[phrase]:
+                scores[engine] += weight
+        # Ties go to the earlier engine in ENGINES (Gemini first, as before)
+        best = max(ENGINES, key=lambda e: (scores.get(e, 0.0), -ENGINES.index(e)))
+        if scores.get(best, 0.0) >= self.threshold:
+            return Route(best, dict(scores), matches, "keywords")
+        if self.is_long(prompt):
+            return Route("deepseek-reasoner", dict(scores), matches, "long prompt")
+        return Route("deepseek-chat", dict(scores), matches, "default")
+
+
+def rules_path() -> Path:
+    return Path(os.environ.get("DEEPGEM_RULES") or Path.home() / ".deepgem.rules.json")
+
+
+@functools.lru_cache(maxsize=None)
+def default_router() -> Router:
+    """The router for this process: user rules if present and usable, otherwise the built-ins."""
+    path = rules_path()
+    if not path.exists():
+        return Router()
+    try:
+        return Router.from_file(path)
+    except (OSError, RulesError) as e:
+        sys.stderr.write(f"deepgem: ignoring routing rules: {e}\n")
+        return Router()
+
+
+def route_rows(rows: Iterable[Dict], router: Optional[Router] = None) -> Iterable[Dict]:
+    """Classify JSONL rows in one pass, yielding {"id", "engine", "reason", "scores", "matches", "tokens"}."""
+    from .batch import row_error
+    from .tokens import estimate
+    router = router or default_router()
+    for row in rows:
+        error = row_error(row)
+        if error:
+            yield {"id": row.get("id"), "error": error}
+            continue
+        prompt = row.get("prompt") or ""
+        r = router.route(prompt)
+        yield {"id": row.get("id"), "engine": r.engine, "reason": r.reason,
+               "scores": r.scores, "matches": r.matches, "tokens": estimate(prompt)}
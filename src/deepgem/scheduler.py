@@ -0,0 +1,300 @@
+"""Host-wide rate limiting, retry/backoff and circuit breaking for DeepSeek calls.
+
+All deepgem processes on a machine share one state file
+(``~/.cache/deepgem/scheduler.json``, guarded by ``flock``) holding:
+
+* token buckets for requests/minute (DEEPGEM_RPM) and tokens/minute
+  (DEEPGEM_TPM); both unlimited unless set,
+* a shared "blocked until" time, set from ``Retry-After`` on a 429 so every
+  process pauses instead of each discovering the limit on its own,
+* a circuit breaker that opens after DEEPGEM_BREAKER_FAILURES consecutive
+  server/connection failures and lets a single probe through after a cooldown.
+
+Retries use full-jitter exponential backoff, or ``Retry-After`` when the
+server sends it. The OpenAI clients are built with ``max_retries=0`` so the
+SDK doesn't retry on its own behind the scheduler's back.
+
+With no rate limits set, a call that finds nothing blocked and no failures
+recorded only reads the state file (or finds it missing); it is written only
+when something changes.
+"""
+import asyncio
+import email.utils
+import functools
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: state is shared between threads only
+    fcntl = None
+
+from .cache import cache_dir
+
+DEFAULT_MAX_ATTEMPTS = 5
+BACKOFF_BASE = 0.5          # seconds; attempt n waits up to BACKOFF_BASE * 2**n
+BACKOFF_CAP = 30.0
+BREAKER_FAILURES = 5
+BREAKER_COOLDOWN = 30.0
+
+RETRIABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpen(RuntimeError):
+    pass
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds the server asked us to wait (Retry-After / retry-after-ms), if any."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return float(ms) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)  # HTTP-date form
+    except (TypeError, ValueError):
+        return None   # malformed header: fall back to our own backoff
+    return max(0.0, parsed.timestamp() - time.time()) if parsed else None
+
+
+def classify(exc: BaseException) -> Optional[str]:
+    """"rate" for 429, "server" for other retriable failures, None if retrying won't help."""
+    status = getattr(exc, "status_code", None)
+    if status == 429:
+        return "rate"
+    if status in RETRIABLE_STATUS:
+        return "server"
+    if status is None:
+        try:
+            import openai
+        except ImportError:
+            return None
+        if isinstance(exc, openai.APIConnectionError):  # includes timeouts
+            return "server"
+    return None
+
+
+class Scheduler:
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        breaker_failures: Optional[int] = None,
+        breaker_cooldown: Optional[float] = None,
+    ):
+        from .config import env_number
+        self.path = Path(path) if path else cache_dir() / "scheduler.json"
+        self.rpm = rpm if rpm is not None else env_number("DEEPGEM_RPM", None, lo=0)
+        self.tpm = tpm if tpm is not None else env_number("DEEPGEM_TPM", None, lo=0)
+        self.max_attempts = max_attempts
+        self.breaker_failures = breaker_failures or env_number(
+            "DEEPGEM_BREAKER_FAILURES", BREAKER_FAILURES, cast=int, lo=1
+        )
+        self.breaker_cooldown = breaker_cooldown if breaker_cooldown is not None else BREAKER_COOLDOWN
+        self.lock = threading.Lock()
+        self.memory: Dict[str, Any] = {}   # used when the state file can't be opened
+
+    @contextmanager
+    def _state(self) -> Iterator[Dict[str, Any]]:
+        """Read-modify-write the shared state under an exclusive lock."""
+        with self.lock:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            except OSError:
+                yield self.memory
+                return
+            with os.fdopen(fd, "r+", encoding="utf-8") as f:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_EX)  # released when the file closes
+                try:
+                    state = json.loads(f.read() or "{}")
+                except ValueError:
+                    state = {}
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+
+    def _peek(self) -> Dict[str, Any]:
+        """The shared state as it is now, read under a shared lock and never written."""
+        with self.lock:
+            try:
+                f = open(self.path, encoding="utf-8")
+            except OSError:   # not created yet, or unusable and kept in memory instead
+                return self.memory
+            with f:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_SH)
+                try:
+                    return json.loads(f.read() or "{}")
+                except ValueError:
+                    return {}
+
+    def _refill(self, state: Dict, name: str, per_minute: float, now: float) -> float:
+        bucket = state.setdefault(name, {"level": per_minute, "ts": now})
+        bucket["level"] = min(per_minute, bucket["level"] + (now - bucket["ts"]) * per_minute / 60)
+        bucket["ts"] = now
+        return bucket["level"]
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Take one request (and `tokens`) from the buckets; 0.0 if granted, else seconds to wait.
+
+        Raises CircuitOpen while the breaker is open and another caller holds the probe.
+        """
+        now = time.time()
+        if not (self.rpm or (self.tpm and tokens)):
+            # No buckets to draw from: nothing to write unless we're blocked or the breaker is open
+            state = self._peek()
+            if state.get("blocked_until", 0) <= now and not (state.get("breaker") or {}).get("open_until"):
+                return 0.0
+        with self._state() as state:
+            wait = state.get("blocked_until", 0) - now
+            breaker = state.get("breaker") or {}
+            if breaker.get("open_until"):
+                if now < breaker["open_until"]:
+                    raise CircuitOpen(
+                        f"circuit open after {breaker.get('failures', 0)} consecutive failures; "
+                        f"retry in {breaker['open_until'] - now:.0f}s"
+                    )
+                # Half-open: this caller is the probe, everyone else keeps failing fast
+                breaker["open_until"] = now + self.breaker_cooldown
+                state["breaker"] = breaker
+                return 0.0
+            if wait > 0:
+                return wait
+            need = []
+            if self.rpm:
+                need.append(("requests", self.rpm, 1.0))
+            if self.tpm and tokens:
+                need.append(("tokens", self.tpm, float(min(tokens, self.tpm))))
+            for name, per_minute, amount in need:
+                level = self._refill(state, name, per_minute, now)
+                if level < amount:
+                    wait = max(wait, (amount - level) * 60 / per_minute)
+            if wait > 0:
+                return wait
+            for name, _, amount in need:
+                state[name]["level"] -= amount
+            return 0.0
+
+    def settle(self, estimated: int, actual: Optional[int]):
+        """Charge the tokens bucket for the difference between estimated and actual usage."""
+        if not self.tpm or actual is None or actual == estimated:
+            return
+        with self._state() as state:
+            if "tokens" in state:
+                state["tokens"]["level"] -= actual - estimated
+
+    def record(self, outcome: Optional[str], delay: Optional[float] = None):
+        """Feed back one call's result: None = success, "rate" = 429, "server" = 5xx/network."""
+        now = time.time()
+        if outcome is None and not self._peek().get("breaker"):
+            return   # the common case: a success with no failures to forget
+        with self._state() as state:
+            breaker = state.setdefault("breaker", {})
+            if outcome is None:
+                state["breaker"] = {}
+                return
+            if outcome == "rate" and delay:
+                state["blocked_until"] = max(state.get("blocked_until", 0), now + delay)
+            if outcome == "server":
+                breaker["failures"] = breaker.get("failures", 0) + 1
+                if breaker["failures"] >= self.breaker_failures:
+                    breaker["open_until"] = now + self.breaker_cooldown
+
+    def backoff(self, attempt: int, exc: BaseException) -> float:
+        hinted = retry_after(exc)
+        if hinted is not None:
+            return min(hinted, BACKOFF_CAP * 4)
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+    def _failed(self, attempt: int, attempts: int, exc: Exception, on_retry) -> float:
+        kind = classify(exc)
+        if kind is None:
+            if getattr(exc, "status_code", None) is not None:
+                self.record(None)  # the server answered; a 4xx says nothing about its health
+            raise exc
+        delay = self.backoff(attempt, exc)
+        self.record(kind, delay)
+        if attempt + 1 >= attempts:
+            raise exc
+        if on_retry:
+            on_retry(attempt + 1, delay, exc)
+        return delay
+
+    def call(self, fn: Callable[[], Any], tokens: int = 0,
+             on_retry: Optional[Callable[[int, float, BaseException], None]] = None,
+             attempts: Optional[int] = None) -> Any:
+        """Run `fn` inside the rate limits, retrying retriable failures up to `attempts` times.
+
+        `on_retry(attempt, delay, exc)` is called before each retry.
+        """
+        attempts = attempts or self.max_attempts
+        for attempt in range(attempts):
+            while True:
+                wait = self.reserve(tokens)
+                if not wait:
+                    break
+                time.sleep(wait)
+            try:
+                result = fn()
+            except Exception as e:
+                time.sleep(self._failed(attempt, attempts, e, on_retry))
+                continue
+            self.record(None)
+            return result
+
+    async def acall(self, fn: Callable[[], Any], tokens: int = 0,
+                    on_retry: Optional[Callable[[int, float, BaseException], None]] = None,
+                    attempts: Optional[int] = None) -> Any:
+        """`call` for coroutine functions: awaits fn() and sleeps without blocking the loop."""
+        attempts = attempts or self.max_attempts
+        for attempt in range(attempts):
+            while True:
+                wait = self.reserve(tokens)
+                if not wait:
+                    break
+                await asyncio.sleep(wait)
+            try:
+                result = await fn()
+            except Exception as e:
+                await asyncio.sleep(self._failed(attempt, attempts, e, on_retry))
+                continue
+            self.record(None)
+            return result
+
+
+def request_tokens(messages) -> int:
+    """Estimated prompt tokens of a request, charged to the tokens/minute bucket up front."""
+    from .tokens import estimate_messages
+    return estimate_messages(messages)
+
+
+def usage_tokens(usage: Optional[Dict]) -> Optional[int]:
+    return (usage or {}).get("total_tokens")
+
+
+@functools.lru_cache(maxsize=None)
+def default_scheduler(endpoint: str = "default") -> Scheduler:
+    """The scheduler for one endpoint (see endpoints.py); each has its own state file."""
+    name = "scheduler.json" if endpoint == "default" else f"scheduler-{endpoint}.json"
+    return Scheduler(cache_dir() / name)
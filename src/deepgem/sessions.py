@@ -0,0 +1,141 @@
+"""Named multi-turn chat sessions, stored as append-only JSONL.
+
+Each session is one file under ``~/.cache/deepgem/sessions`` (or
+DEEPGEM_SESSION_DIR); every turn appends a line and nothing is ever rewritten.
+
+DeepSeek caches prompt prefixes server-side, so the context sent each turn is
+built to keep its prefix byte-identical for as long as possible: the system
+prompt and the first exchange are pinned, and when the history outgrows the
+token budget the window start jumps forward far enough to leave headroom
+(instead of sliding one turn at a time, which would change the prefix on every
+call). The jump is recorded in the file so later turns reuse the same cut.
+"""
+import json
+import os
+import re
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from .cache import cache_dir
+from .tokens import MESSAGE_OVERHEAD, estimate
+
+DEFAULT_BUDGET = 48_000   # prompt tokens; DEEPGEM_SESSION_TOKENS overrides
+LOW_WATER = 0.6           # after a trim the context fills at most this share of the budget
+PINNED = 2                # messages after the system prompt that are never trimmed
+
+_NAME = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+def sessions_dir() -> Path:
+    return Path(os.environ.get("DEEPGEM_SESSION_DIR") or cache_dir() / "sessions")
+
+
+def _cost(message: Dict) -> int:
+    return estimate(message["content"]) + MESSAGE_OVERHEAD
+
+
+def session_budget() -> int:
+    from .config import env_number
+    return env_number("DEEPGEM_SESSION_TOKENS", DEFAULT_BUDGET, cast=int, lo=1)
+
+
+class Session:
+    def __init__(self, name: str, directory: Optional[Path] = None):
+        if not _NAME.match(name):
+            raise ValueError(f"invalid session name {name!r} (letters, digits, '.', '_', '-')")
+        self.name = name
+        self.path = Path(directory or sessions_dir()) / f"{name}.jsonl"
+        self.system: Optional[str] = None
+        self.messages: List[Dict] = []   # user/assistant turns, usage kept on replies
+        self.start = PINNED              # index in `messages` where the sent window resumes
+        if self.path.exists():
+            self._load()
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # a torn final line from an interrupted write
+                if "trim" in rec:
+                    self.start = rec["trim"]
+                elif rec.get("role") == "system":
+                    self.system = rec["content"]
+                elif rec.get("role") in ("user", "assistant"):
+                    self.messages.append(rec)
+
+    @property
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def _append(self, *records: Dict):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = "".join(
+            json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in records
+        )
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(data)
+
+    def set_system(self, system: str):
+        """Only a new session takes a system prompt; changing it would void the prefix cache."""
+        if self.system is None and not self.messages:
+            self.system = system
+            self._append({"role": "system", "content": system})
+
+    def context(self, prompt: str, budget: Optional[int] = None) -> List[Dict]:
+        """Messages to send for the next turn: system, pinned head, window, `prompt`."""
+        budget = budget or session_budget()
+        head = [{"role": "system", "content": self.system}] if self.system else []
+        head += [_wire(m) for m in self.messages[:PINNED]]
+        new = {"role": "user", "content": prompt}
+        fixed = sum(_cost(m) for m in head) + _cost(new)
+        start = max(self.start, PINNED)
+        window = self.messages[start:]
+        if fixed + sum(_cost(m) for m in window) > budget:
+            # Jump, don't slide: drop enough of the oldest turns to get under the low-water mark
+            total = fixed + sum(_cost(m) for m in window)
+            while window and total > budget * LOW_WATER:
+                total -= _cost(window.pop(0))
+                start += 1
+            while window and window[0]["role"] != "user":
+                window.pop(0)
+                start += 1
+            self.start = start
+            self._append({"trim": start})
+        return head + [_wire(m) for m in window] + [new]
+
+    def record(self, prompt: str, reply: str, usage: Optional[Dict] = None):
+        """Append a completed exchange (both lines in one write)."""
+        user = {"role": "user", "content": prompt}
+        assistant = {"role": "assistant", "content": reply}
+        if usage:
+            assistant["usage"] = usage
+        self._append(user, assistant)
+        self.messages += [user, assistant]
+
+    def remove(self):
+        self.path.unlink()
+
+
+def _wire(message: Dict) -> Dict:
+    return {"role": message["role"], "content": message["content"]}
+
+
+def list_sessions(directory: Optional[Path] = None) -> Iterator[Session]:
+    directory = Path(directory or sessions_dir())
+    if not directory.exists():
+        return
+    for path in sorted(directory.glob("*.jsonl")):
+        yield Session(path.stem, directory)
+
+
+def usage_totals(session: Session) -> Dict[str, int]:
+    """Prompt tokens sent and served from DeepSeek's context cache, summed over replies."""
+    from .metrics import cached_prompt_tokens
+    prompt = cached = 0
+    for m in session.messages:
+        usage = m.get("usage") or {}
+        prompt += usage.get("prompt_tokens") or 0
+        cached += cached_prompt_tokens(usage) or 0
+    return {"prompt_tokens": prompt, "cached_tokens": cached}
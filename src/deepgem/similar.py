@@ -0,0 +1,115 @@
+"""Fingerprints for the near-duplicate response cache (`--similar`).
+
+A prompt is lowercased, whitespace is collapsed, and timestamps, dates,
+UUIDs, long hex ids and long numbers are replaced by placeholders. The result
+is fingerprinted with a 64-bit SimHash over word (and punctuation) unigrams
+and bigrams, so prompts that differ in a few words land a few bits apart. The
+cache stores each fingerprint as four indexed 16-bit bands: a lookup reads
+only the entries sharing a band, then compares whole fingerprints. Any entry
+within 3 bits is always found (pigeonhole); wider distances usually are.
+
+SimHash only finds candidates. Bits can collide: "rm -rf /" and "rm -rf /tmp"
+in an otherwise equal prompt are 0.97 similar by fingerprint. So a candidate
+is served only if the Jaccard similarity of the two normalized prompts'
+unigram+bigram sets also reaches the threshold; that pair scores 0.90. Even
+so, one changed word in a long prompt stays above 0.95. Keep the threshold
+high (0.98) and don't use --similar where a single word changes the answer.
+"""
+import hashlib
+import json
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+BITS = 64
+BANDS = 4
+BAND_BITS = BITS // BANDS
+MEMO_SIZE = 200_000
+MAX_TEXT = 20_000   # normalized chars; longer prompts (usually inlined files) aren't matched
+
+_NORMALIZERS = (
+    (re.compile(r"\b\d{4}-\d{2}-\d{2}[t ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:z|[+-]\d{2}:?\d{2})?\b"), " <ts> "),
+    (re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b"), " <uuid> "),
+    (re.compile(r"\b\d{4}-\d{2}-\d{2}\b|\b\d{1,2}/\d{1,2}/\d{2,4}\b"), " <date> "),
+    (re.compile(r"\b\d{1,2}:\d{2}(?::\d{2})?\b"), " <time> "),
+    (re.compile(r"\b(?=[0-9a-f]*\d)(?=[0-9a-f]*[a-f])[0-9a-f]{8,}\b"), " <hex> "),
+    (re.compile(r"\b\d{5,}\b"), " <num> "),
+)
+_TOKEN = re.compile(r"<\w+>|\w+|[^\w\s]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase, mask volatile values (timestamps, ids, long numbers), collapse whitespace."""
+    text = text.lower()
+    for pattern, placeholder in _NORMALIZERS:
+        text = pattern.sub(placeholder, text)
+    return " ".join(text.split())
+
+
+_bits: Dict[str, str] = {}
+
+
+def _h64(feature: str) -> str:
+    """64-bit hash of `feature` as a string of 0/1 digits (memoised: features repeat a lot)."""
+    bits = _bits.get(feature)
+    if bits is None:
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        bits = format(h, "064b")
+        if len(_bits) < MEMO_SIZE:
+            _bits[feature] = bits
+    return bits
+
+
+def _features(norm: str) -> Counter:
+    words = _TOKEN.findall(norm)
+    feats = Counter(words)
+    feats.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return feats
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash of `normalize(text)` over word unigrams and bigrams."""
+    feats = _features(normalize(text))
+    if not feats:
+        return 0
+    # Lay the hashes end to end; a stride-64 slice is then one bit position, counted in C
+    joined = "".join(_h64(f) * n for f, n in feats.items())
+    half = len(joined) / BITS / 2
+    return int("".join("1" if joined[i::BITS].count("1") > half else "0" for i in range(BITS)), 2)
+
+
+def jaccard(a: str, b: str) -> float:
+    """Jaccard similarity of two normalized texts' unigram+bigram sets."""
+    fa, fb = set(_features(a)), set(_features(b))
+    if not fa and not fb:
+        return 1.0
+    return len(fa & fb) / len(fa | fb)
+
+
+def bands(fp: int) -> Tuple[int, ...]:
+    mask = (1 << BAND_BITS) - 1
+    return tuple((fp >> (i * BAND_BITS)) & mask for i in range(BANDS))
+
+
+def similarity(a: int, b: int) -> float:
+    return 1 - bin(a ^ b).count("1") / BITS
+
+
+def to_signed(fp: int) -> int:
+    """SQLite integers are signed 64-bit."""
+    return fp - (1 << 64) if fp >= 1 << 63 else fp
+
+
+def from_signed(v: int) -> int:
+    return v + (1 << 64) if v < 0 else v
+
+
+def split_request(model: str, messages: List[Dict]) -> Tuple[str, str]:
+    """(scope, text): everything but the final user turn must match exactly; that turn may vary."""
+    last = len(messages) - 1
+    while last >= 0 and messages[last].get("role") != "user":
+        last -= 1
+    head = messages[:last] if last >= 0 else messages
+    text = messages[last].get("content") or "" if last >= 0 else ""
+    blob = json.dumps({"model": model, "head": head}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:32], text
@@ -0,0 +1,212 @@
+"""Local stand-ins for DeepSeek and the Gemini CLI, for tests and benchmarks.
+
+`StubServer` serves ``POST .../chat/completions`` (streaming SSE or plain
+JSON) and ``GET .../models`` with a controllable time to first token, token
+rate and error injection, so hedging and fallback can be exercised without
+the network::
+
+    with StubServer(ttft={"deepseek-reasoner": 2.0}) as stub:
+        client = OpenAI(api_key="x", base_url=stub.url)
+
+`write_fake_gemini` writes an executable to point GEMINI_BIN at.
+"""
+import json
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Union
+
+# Seconds before the first token: a number, a per-model dict, or fn(request_no, model)
+Delay = Union[float, Dict[str, float], Callable[[int, str], float]]
+
+DEFAULT_REPLY = "stub reply from a local OpenAI-compatible server"
+
+
+def _resolve(delay: Delay, n: int, model: str) -> float:
+    if callable(delay):
+        return float(delay(n, model))
+    if isinstance(delay, dict):
+        return float(delay.get(model, delay.get("*", 0.0)))
+    return float(delay)
+
+
+class _QuietServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        pass  # clients hanging up early (cancelled hedges, raw probes) are expected
+
+
+class StubServer:
+    def __init__(
+        self,
+        ttft: Delay = 0.0,
+        tokens_per_s: float = 0.0,           # 0 = no pacing between tokens
+        reply: str = DEFAULT_REPLY,
+        fail: Optional[Callable[[int, str], Optional[int]]] = None,  # -> HTTP status to fail with
+        retry_after: Optional[float] = None,
+        error_rate: float = 0.0,             # share of requests answered with a 503
+        seed: Optional[int] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.ttft = ttft
+        self.tokens_per_s = tokens_per_s
+        self.reply = reply
+        self.fail = fail
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests: List[Dict] = []       # {"n", "model", "status", "cancelled"} per completion
+        self.lock = threading.Lock()
+        self.server = _QuietServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubServer":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, status: int, body: Dict, headers: Optional[Dict] = None):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    self._json(200, {"object": "list", "data": [
+                        {"id": m, "object": "model", "owned_by": "stub"}
+                        for m in ("deepseek-chat", "deepseek-reasoner")
+                    ]})
+                else:
+                    self._json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._json(404, {"error": {"message": "not found"}})
+                    return
+                stub._complete(self, body)
+
+        return Handler
+
+    def _complete(self, h: BaseHTTPRequestHandler, body: Dict):
+        model = body.get("model", "")
+        with self.lock:
+            n = len(self.requests)
+            rec = {"n": n, "model": model, "status": 200, "cancelled": False}
+            self.requests.append(rec)
+        status = self.fail(n, model) if self.fail else None
+        if status is None and self.error_rate:
+            with self.lock:
+                status = 503 if self.random.random() < self.error_rate else None
+        ttft = _resolve(self.ttft, n, model)
+        if status or not body.get("stream"):
+            time.sleep(ttft)
+        if status:
+            rec["status"] = status
+            headers = {"Retry-After": f"{self.retry_after:g}"} if self.retry_after is not None else None
+            h._json(status, {"error": {"message": f"stub error {status}", "type": "stub"}}, headers)
+            return
+
+        tokens = [w + " " for w in self.reply.split(" ")]
+        tokens[-1] = tokens[-1].rstrip()
+        prompt_tokens = sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4 + 1
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                 "total_tokens": prompt_tokens + len(tokens), "prompt_cache_hit_tokens": 0}
+        base = {"id": f"stub-{n}", "created": int(time.time()), "model": model}
+        if not body.get("stream"):
+            h._json(200, dict(base, object="chat.completion", usage=usage, choices=[{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": self.reply},
+            }]))
+            return
+
+        h.send_response(200)
+        h.send_header("Content-Type", "text/event-stream")
+        h.send_header("Cache-Control", "no-cache")
+        h.send_header("Connection", "close")
+        h.end_headers()
+        h.close_connection = True
+
+        def event(payload: Dict):
+            h.wfile.write(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+            h.wfile.flush()
+
+        chunk = dict(base, object="chat.completion.chunk")
+        try:
+            # Like the real API: a role-only chunk right away, the first token after `ttft`
+            event(dict(chunk, choices=[{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]))
+            time.sleep(ttft)
+            for i, tok in enumerate(tokens):
+                if i and self.tokens_per_s:
+                    time.sleep(1 / self.tokens_per_s)
+                event(dict(chunk, choices=[{"index": 0, "delta": {"content": tok}, "finish_reason": None}]))
+            event(dict(chunk, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                event(dict(chunk, choices=[], usage=usage))
+            h.wfile.write(b"data: [DONE]\n\n")
+            h.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            rec["cancelled"] = True  # the client hung up mid-stream
+
+
+FAKE_GEMINI = """#!{python}
+import sys, time
+args = sys.argv[1:]
+if "--version" in args:
+    print("0.0.0-stub")
+    sys.exit(0)
+prompt = args[args.index("-p") + 1] if "-p" in args else sys.stdin.read()
+time.sleep({ttft!r})
+for word in {reply!r}.split():
+    if {tokens_per_s!r}:
+        time.sleep(1 / {tokens_per_s!r})
+    sys.stdout.write(word + " ")
+    sys.stdout.flush()
+sys.stdout.write("\\n")
+"""
+
+
+def write_fake_gemini(
+    path: Path,
+    ttft: float = 0.0,
+    tokens_per_s: float = 0.0,
+    reply: str = DEFAULT_REPLY,
+) -> Path:
+    """Write an executable that behaves like `gemini -p` (and `gemini --version`)."""
+    path = Path(path)
+    path.write_text(FAKE_GEMINI.format(python=sys.executable, ttft=ttft, tokens_per_s=tokens_per_s, reply=reply))
+    path.chmod(0o755)
+    return path
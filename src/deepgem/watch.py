@@ -0,0 +1,243 @@
+"""Watch mode for `deepgem watch`: re-run a prompt as files change.
+
+The included directories are polled with stat only, using the index's skip
+rules. A burst of saves is debounced: a run starts once nothing has changed
+for `debounce` seconds. Files whose content hash didn't change, such as a
+touch or a save without edits, don't count. The first run gets the full
+--include-directories context. Later runs get the prompt plus unified diffs
+of what changed since the last completed run, which is far less to send and
+read. A run made obsolete by newer edits is cancelled and its process tree
+killed. When the files return to a state that already has a result (an undo,
+switching back to a branch), that result is replayed instead of asking again.
+"""
+import difflib
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .index import MAX_FILE_BYTES, _is_text, walk
+
+POLL_INTERVAL = 0.5      # seconds between stat scans
+DEBOUNCE = 0.3           # quiet time after the last change before a run starts
+DIFF_TOKENS = 6000       # diff budget per run; keeps the prompt within Windows' command-line limit
+DIFF_CONTEXT_LINES = 3
+
+Stat = Tuple[int, int]   # (mtime_ns, size)
+
+
+def scan(roots: Iterable[str]) -> Dict[str, Stat]:
+    """Stat every watched file (no reads)."""
+    stats = {}
+    for root in roots:
+        for file in walk(Path(root)):
+            try:
+                st = file.stat()
+            except OSError:
+                continue
+            if st.st_size <= MAX_FILE_BYTES:
+                stats[str(file)] = (st.st_mtime_ns, st.st_size)
+    return stats
+
+
+class Tree:
+    """Contents of the watched files; only files whose stat changed are re-read."""
+
+    def __init__(self, roots: Iterable[str]):
+        self.roots = [str(Path(r).expanduser().resolve()) for r in roots]
+        self.stats: Dict[str, Stat] = {}
+        self.digests: Dict[str, str] = {}
+        self.texts: Dict[str, Optional[str]] = {}   # None for binary files
+        self.refresh(scan(self.roots))
+
+    def refresh(self, stats: Dict[str, Stat]) -> List[str]:
+        """Take in a new scan; returns the paths whose content was added, edited or removed."""
+        changed = []
+        for path, st in stats.items():
+            if self.stats.get(path) == st:
+                continue
+            try:
+                data = Path(path).read_bytes()
+            except OSError:
+                continue
+            digest = hashlib.sha256(data).hexdigest()
+            if self.digests.get(path) != digest:
+                changed.append(path)
+                self.digests[path] = digest
+                self.texts[path] = data.decode("utf-8", errors="replace") if _is_text(data) else None
+        for path in set(self.digests) - set(stats):
+            changed.append(path)
+            del self.digests[path]
+            del self.texts[path]
+        self.stats = stats
+        return sorted(changed)
+
+    def state(self) -> str:
+        """Hash of every file's path and content: equal states have equal inputs."""
+        h = hashlib.sha256()
+        for path in sorted(self.digests):
+            h.update(f"{path}\0{self.digests[path]}\n".encode("utf-8", errors="replace"))
+        return h.hexdigest()
+
+    def rel(self, path: str) -> str:
+        for base in self.roots:
+            if path.startswith(base + os.sep):
+                return os.path.join(os.path.basename(base), path[len(base) + 1:])
+        return path
+
+
+class Watcher:
+    def __init__(self, roots: Iterable[str], interval: float = POLL_INTERVAL, debounce: float = DEBOUNCE):
+        self.tree = Tree(roots)
+        self.interval = interval
+        self.debounce = debounce
+        self.last_scan = self.tree.stats
+        self.settle_at: Optional[float] = None
+
+    def poll(self) -> List[str]:
+        """One scan; returns the changed paths once a burst of edits has settled, else []."""
+        now = time.monotonic()
+        stats = scan(self.tree.roots)
+        if stats != self.last_scan:
+            self.last_scan = stats
+            self.settle_at = now + self.debounce
+            return []
+        if self.settle_at is None or now < self.settle_at:
+            return []
+        self.settle_at = None
+        return self.tree.refresh(stats)
+
+
+# ---------------- Incremental context ----------------
+def render_diffs(tree: Tree, baseline: Dict[str, Optional[str]], budget: int = DIFF_TOKENS) -> str:
+    """Unified diffs from `baseline` (path -> text) to the tree's current contents."""
+    from .tokens import estimate
+    parts, omitted, used = [], [], 0
+    for path in sorted(set(baseline) | set(tree.texts)):
+        old, new = baseline.get(path), tree.texts.get(path)
+        if path in baseline and path in tree.texts and old == new:
+            continue
+        name = tree.rel(path)
+        if (path in baseline and old is None) or (path in tree.texts and new is None):
+            omitted.append(f"{name} (binary)")
+            continue
+        diff = "".join(difflib.unified_diff(
+            (old or "").splitlines(keepends=True), (new or "").splitlines(keepends=True),
+            f"a/{name}" if path in baseline else "/dev/null",
+            f"b/{name}" if path in tree.texts else "/dev/null",
+            n=DIFF_CONTEXT_LINES,
+        ))
+        if not diff:
+            continue
+        if not diff.endswith("\n"):
+            diff += "\n"
+        cost = estimate(diff)
+        if used + cost > budget:
+            omitted.append(name)
+            continue
+        parts.append(diff)
+        used += cost
+    text = f"```diff\n{''.join(parts)}```" if parts else ""
+    if omitted:
+        text += f"\nAlso changed (diff omitted): {', '.join(omitted)}"
+    return text
+
+
+def incremental_prompt(prompt: str, diffs: str) -> str:
+    return f"{prompt}\n\nFiles changed since the previous run:\n\n{diffs}"
+
+
+# ---------------- Runs ----------------
+class Run:
+    """One child `deepgem` process, streamed through `echo` and cancellable."""
+
+    def __init__(self, cmd: List[str], state: str, texts: Dict[str, Optional[str]],
+                 echo: Callable[[str, str], None]):
+        self.cmd = cmd
+        self.state = state
+        self.texts = texts
+        self.echo = echo
+        self.output: List[str] = []
+        self.result = None
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        from .gemini import run_streaming
+
+        def line(stream: str, text: str):
+            if self.cancelled.is_set():
+                return
+            if stream == "stdout":
+                self.output.append(text)
+            self.echo(stream, text)
+
+        self.result = run_streaming(self.cmd, on_line=line, stop=self.cancelled.is_set)
+
+    def done(self) -> bool:
+        return not self.thread.is_alive()
+
+    def cancel(self):
+        self.cancelled.set()
+        self.thread.join()
+
+
+def run_loop(
+    watcher: Watcher,
+    prompt: str,
+    build_cmd: Callable[[str, bool], List[str]],
+    notify: Callable[[str], None],
+    echo: Callable[[str, str], None],
+    full: bool = False,
+    stop: Optional[Callable[[], bool]] = None,
+) -> Dict[str, List[str]]:
+    """Run `prompt` now and again after every settled change until `stop()` (or Ctrl-C).
+
+    `build_cmd(text, with_context)` returns the child command; `with_context`
+    is True when the run should get the full directory context (the first
+    run, or every run with `full`). Returns the results kept for reuse.
+    """
+    results: Dict[str, List[str]] = {}                    # tree state -> stdout of a successful run
+    baseline: Optional[Dict[str, Optional[str]]] = None   # what the last completed run saw
+
+    def start() -> Optional[Run]:
+        state = watcher.tree.state()
+        if state in results:
+            notify("inputs match an earlier run; replaying its result")
+            for text in results[state]:
+                echo("stdout", text)
+            return None
+        if baseline is None or full:
+            return Run(build_cmd(prompt, True), state, dict(watcher.tree.texts), echo)
+        diffs = render_diffs(watcher.tree, baseline)
+        return Run(build_cmd(incremental_prompt(prompt, diffs), False), state, dict(watcher.tree.texts), echo)
+
+    run = start()
+    try:
+        while not (stop and stop()):
+            time.sleep(watcher.interval)
+            if run is not None and run.done():
+                code = run.result.returncode if run.result else 1
+                if code == 0:
+                    results[run.state] = run.output
+                    baseline = run.texts
+                notify(f"run finished (exit {code}) in {run.result.duration:.1f}s; watching for changes"
+                       if run.result else "run failed; watching for changes")
+                run = None
+            changed = watcher.poll()
+            if not changed:
+                continue
+            names = ", ".join(watcher.tree.rel(p) for p in changed[:5])
+            more = f" and {len(changed) - 5} more" if len(changed) > 5 else ""
+            notify(f"changed: {names}{more}")
+            if run is not None:
+                run.cancel()
+                notify("cancelled the previous run (its inputs are out of date)")
+            run = start()
+    finally:
+        if run is not None:
+            run.cancel()
+    return results
@@ -0,0 +1,82 @@
+import asyncio
+import io
+import json
+import types
+
+from deepgem.batch import completed_ids, read_rows, run_batch, trim_torn_line
+
+
+class FakeCompletions:
+    async def create(self, model, messages, stream):
+        await asyncio.sleep(0.01)
+        if messages[-1]["content"] == "boom":
+            raise RuntimeError("boom")
+        msg = types.SimpleNamespace(content=f"{model}:{messages[-1]['content']}")
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=msg)], usage=None)
+
+
+def fake_client():
+    return types.SimpleNamespace(chat=types.SimpleNamespace(completions=FakeCompletions()))
+
+
+def test_batch_routes_and_captures_errors(tmp_path):
+    src = tmp_path / "in.jsonl"
+    src.write_text(
+        "\n".join([
+            json.dumps({"id": "a", "prompt": "hi"}),
+            json.dumps({"id": "b", "prompt": "hi", "model": "deepseek-reasoner"}),
+            json.dumps({"id": "c", "prompt": "boom"}),
+        ])
+    )
+    out = io.StringIO()
+    counts = asyncio.run(
+        run_batch(read_rows(str(src)), out, fake_client(), lambda p, f: "deepseek-chat", concurrency=2)
+    )
+    assert counts == {"ok": 2, "error": 1}
+    recs = {r["id"]: r for r in map(json.loads, out.getvalue().splitlines())}
+    assert recs["a"]["content"] == "deepseek-chat:hi"
+    assert recs["b"]["content"] == "deepseek-reasoner:hi"
+    assert recs["c"]["error"] == "boom"
+
+
+def test_resume_skips_only_successful_ids(tmp_path):
+    out = tmp_path / "out.jsonl"
+    out.write_text('{"id": 1, "content": "x"}\n{"id": 2, "error": "429"}\n{"id": 3, "con')
+    assert completed_ids(str(out)) == {"1"}
+
+
+def test_bad_lines_become_row_errors(tmp_path):
+    src = tmp_path / "in.jsonl"
+    src.write_text(
+        '{"id": "a", "prompt": "hi"}\n{"id": "b", "pro\n[1, 2]\n"just a prompt"\n'
+        '{"id": "n", "prompt": 5}\n{"id": "m", "prompt": "hi", "model": ["x"]}\n'
+    )
+    out = io.StringIO()
+    counts = asyncio.run(
+        run_batch(read_rows(str(src)), out, fake_client(), lambda p, f: "deepseek-chat", concurrency=1)
+    )
+    assert counts == {"ok": 2, "error": 4}
+    recs = {r["id"]: r for r in map(json.loads, out.getvalue().splitlines())}
+    assert recs[2]["error"].startswith("line 2: invalid JSON")
+    assert recs[3]["error"] == "line 3: expected an object or a string, got list"
+    assert recs[4]["content"] == "deepseek-chat:just a prompt"
+    assert recs["n"]["error"] == "prompt must be a string, got int"
+    assert recs["m"]["error"] == "model must be a string, got list"
+
+
+def test_missing_input_fails_up_front(tmp_path):
+    import pytest
+    with pytest.raises(OSError):
+        read_rows(str(tmp_path / "nope.jsonl"))
+
+
+def test_trim_torn_line(tmp_path):
+    out = tmp_path / "out.jsonl"
+    out.write_text('{"id": 1, "content": "x"}\n{"id": 3, "con')
+    trim_torn_line(str(out))
+    assert out.read_text() == '{"id": 1, "content": "x"}\n'
+    trim_torn_line(str(out))
+    assert out.read_text() == '{"id": 1, "content": "x"}\n'
+    out.write_text('{"id": 3, "con')
+    trim_torn_line(str(out))
+    assert out.read_text() == ""
@@ -0,0 +1,32 @@
+from deepgem.bench import compare, suite
+from deepgem.stubs import StubServer
+
+
+def test_compare_flags_regressions_in_each_direction():
+    old = {"metrics": {"chat.wall_p50_ms": 100, "batch.rows_per_s": 50, "gem.failed": 0, "router.us_per_prompt": 2}}
+    new = {"metrics": {"chat.wall_p50_ms": 130, "batch.rows_per_s": 60, "gem.failed": 1, "router.us_per_prompt": 2.1}}
+    rows = {r["metric"]: r for r in compare(old, new, threshold=0.1)}
+    assert rows["chat.wall_p50_ms"]["regressed"]
+    assert not rows["batch.rows_per_s"]["regressed"]     # higher is better
+    assert rows["gem.failed"]["regressed"]
+    assert not rows["router.us_per_prompt"]["regressed"]  # within the threshold
+
+
+def test_stub_error_rate_fails_a_share_of_requests():
+    from openai import OpenAI
+    with StubServer(error_rate=0.5, seed=1) as stub:
+        client = OpenAI(api_key="x", base_url=stub.url, max_retries=0)
+        for _ in range(20):
+            try:
+                client.chat.completions.create(model="deepseek-chat", messages=[{"role": "user", "content": "hi"}])
+            except Exception:
+                pass
+    statuses = [r["status"] for r in stub.requests]
+    assert 0 < statuses.count(503) < 20
+
+
+def test_suite_runs_gem_offline():
+    res = suite(runs=1, only=["gem"])
+    m = res["metrics"]
+    assert m["gem.failed"] == 0 and m["gem.ttft_p50_ms"] is not None
+    assert set(res["meta"]) >= {"deepgem", "python", "platform"}
@@ -0,0 +1,60 @@
+import time
+
+from deepgem.cache import ResponseCache, cache_key
+
+
+def test_key_covers_model_and_messages():
+    msgs = [{"role": "user", "content": "hi"}]
+    assert cache_key("deepseek-chat", msgs) == cache_key("deepseek-chat", [dict(msgs[0])])
+    assert cache_key("deepseek-chat", msgs) != cache_key("deepseek-reasoner", msgs)
+    assert cache_key("deepseek-chat", msgs) != cache_key(
+        "deepseek-chat", [{"role": "system", "content": "x"}] + msgs
+    )
+
+
+def test_ttl_expiry(tmp_path):
+    store = ResponseCache(tmp_path / "c.db", ttl=60)
+    store.put("k", "deepseek-chat", "answer", {"total_tokens": 3})
+    assert store.get("k")["content"] == "answer"
+    store.db.execute("UPDATE responses SET created = ?", (time.time() - 120,))
+    assert store.get("k") is None
+    assert store.stats()["entries"] == 0
+
+
+def test_lru_eviction_keeps_recently_used(tmp_path):
+    store = ResponseCache(tmp_path / "c.db", ttl=0, max_bytes=3000)
+    for i in range(3):
+        store.put(f"k{i}", "m", "x" * 900)
+        store.db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (i, f"k{i}"))
+    store.get("k0")  # k0 becomes most recently used
+    store.put("k3", "m", "x" * 900)
+    assert store.get("k1") is None
+    assert store.get("k0") is not None and store.get("k3") is not None
+
+
+def test_running_size_matches_table(tmp_path):
+    store = ResponseCache(tmp_path / "c.db", ttl=0, max_bytes=5000)
+    for i in range(10):
+        store.put(f"k{i % 6}", "m", "x" * (300 + i * 50))
+    store.db.execute("DELETE FROM responses WHERE key = 'k1'")
+    total = store.db.execute("SELECT value FROM counters WHERE name = 'bytes'").fetchone()[0]
+    assert total == store.stats()["bytes"] <= 5000
+
+
+def test_recent_hit_writes_nothing(tmp_path):
+    store = ResponseCache(tmp_path / "c.db", ttl=0)
+    store.put("k", "m", "answer")
+    before = store.db.total_changes
+    for _ in range(5):
+        assert store.get("k")["content"] == "answer"
+    assert store.db.total_changes == before
+    assert store.stats()["hits"] == 5
+
+
+def test_bad_env_falls_back_to_defaults(tmp_path, monkeypatch, capsys):
+    from deepgem.cache import DEFAULT_MAX_BYTES, DEFAULT_TTL
+    monkeypatch.setenv("DEEPGEM_CACHE_TTL", "1d")
+    monkeypatch.setenv("DEEPGEM_CACHE_MAX_MB", "-5")
+    store = ResponseCache(tmp_path / "c.db")
+    assert (store.ttl, store.max_bytes) == (DEFAULT_TTL, DEFAULT_MAX_BYTES)
+    assert "ignoring DEEPGEM_CACHE_TTL='1d'" in capsys.readouterr().err
@@ -0,0 +1,118 @@
+import threading
+import time
+import types
+
+import pytest
+
+from deepgem.daemon import Daemon, daemon_chat, supported
+
+pytestmark = pytest.mark.skipif(not supported(), reason="needs Unix domain sockets")
+
+
+def fake_client(calls):
+    def create(model, messages, stream, stream_options=None):
+        calls.append(model)
+
+        def chunks():
+            for word in ["hel", "lo"]:
+                time.sleep(0.05)
+                delta = types.SimpleNamespace(content=word)
+                yield types.SimpleNamespace(usage=None, choices=[types.SimpleNamespace(delta=delta)])
+
+        return chunks()
+
+    return types.SimpleNamespace(
+        chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create)),
+        models=types.SimpleNamespace(list=lambda: None),
+    )
+
+
+def test_identical_requests_share_one_upstream_call(tmp_path, monkeypatch):
+    sock = tmp_path / "d.sock"
+    monkeypatch.setenv("DEEPGEM_SOCKET", str(sock))
+    calls = []
+    threading.Thread(
+        target=Daemon(fake_client(calls), sock, log=lambda m: None).serve_forever,
+        kwargs={"keepalive": 0}, daemon=True,
+    ).start()
+    for _ in range(50):
+        if sock.exists():
+            break
+        time.sleep(0.01)
+
+    msgs = [{"role": "user", "content": "hi"}]
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(daemon_chat("m", msgs))) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert [r["content"] for r in results] == ["hello"] * 3
+    assert calls == ["m"]
+
+
+def test_falls_back_when_no_daemon(tmp_path, monkeypatch):
+    monkeypatch.setenv("DEEPGEM_SOCKET", str(tmp_path / "missing.sock"))
+    assert daemon_chat("m", [{"role": "user", "content": "hi"}]) is None
+
+
+def start_daemon(sock, client, **kwargs):
+    threading.Thread(
+        target=Daemon(client, sock, log=lambda m: None, **kwargs).serve_forever,
+        kwargs={"keepalive": 0}, daemon=True,
+    ).start()
+    for _ in range(50):
+        if sock.exists():
+            break
+        time.sleep(0.01)
+
+
+def test_malformed_requests_get_an_error_reply(tmp_path):
+    import json
+    import socket
+    sock = tmp_path / "d.sock"
+    start_daemon(sock, fake_client([]))
+    for line in (b"not json\n", b"[1, 2]\n", b'{"model": "m"}\n'):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(5)
+            s.connect(str(sock))
+            s.sendall(line)
+            assert json.loads(s.makefile().readline())["error"].startswith("bad request")
+
+
+def test_other_credentials_and_silence_fall_back_to_direct(tmp_path, monkeypatch):
+    import socket
+    msgs = [{"role": "user", "content": "hi"}]
+    sock = tmp_path / "d.sock"
+    monkeypatch.setenv("DEEPGEM_SOCKET", str(sock))
+    start_daemon(sock, fake_client([]), config="someone-else")
+    assert daemon_chat("m", msgs) is None
+
+    # A socket that accepts but never answers: give up instead of hanging
+    silent = tmp_path / "silent.sock"
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(str(silent))
+    server.listen()
+    monkeypatch.setenv("DEEPGEM_SOCKET", str(silent))
+    t0 = time.monotonic()
+    assert daemon_chat("m", msgs, read_timeout=0.3) is None
+    assert time.monotonic() - t0 < 5
+    server.close()
+
+
+def test_heartbeats_keep_a_slow_start_alive(tmp_path, monkeypatch):
+    from deepgem import daemon
+    monkeypatch.setattr(daemon, "HEARTBEAT", 0.05)
+    client = fake_client([])
+    create = client.chat.completions.create
+
+    def slow(**kwargs):
+        time.sleep(0.5)   # longer than the client's read timeout
+        return create(**kwargs)
+
+    client.chat.completions.create = slow
+    sock = tmp_path / "d.sock"
+    monkeypatch.setenv("DEEPGEM_SOCKET", str(sock))
+    start_daemon(sock, client)
+    res = daemon_chat("m", [{"role": "user", "content": "hi"}], read_timeout=0.2)
+    assert res is not None and res["content"] == "hello" and res["error"] is None
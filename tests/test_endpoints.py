@@ -0,0 +1,59 @@
+import pytest
+
+from deepgem.endpoints import EJECT_AFTER, Endpoint, Pool, load_endpoints
+from deepgem.stubs import StubServer
+
+MSGS = [{"role": "user", "content": "hi"}]
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(tmp_path, monkeypatch):
+    from deepgem.scheduler import default_scheduler
+    monkeypatch.setenv("DEEPGEM_CACHE_DIR", str(tmp_path))
+    default_scheduler.cache_clear()
+    yield
+    default_scheduler.cache_clear()
+
+
+def create(client):
+    return client.chat.completions.create(model="deepseek-chat", messages=MSGS)
+
+
+def test_config_from_inline_json(monkeypatch):
+    monkeypatch.setenv("TEAM_KEY", "sk-team")
+    conf = load_endpoints(
+        '{"strategy": "least", "endpoints": [{"name": "a", "api_key": "sk-a", "weight": 2},'
+        ' {"name": "b", "api_key_env": "TEAM_KEY", "base_url": "http://mirror/v1"}]}',
+        None, "https://api.deepseek.com",
+    )
+    assert conf["strategy"] == "least"
+    assert [(e.name, e.api_key, e.base_url, e.weight) for e in conf["endpoints"]] == [
+        ("a", "sk-a", "https://api.deepseek.com", 2.0), ("b", "sk-team", "http://mirror/v1", 1.0),
+    ]
+
+
+def test_selection_prefers_idle_and_fast_endpoints():
+    a, b = Endpoint("a", "k"), Endpoint("b", "k")
+    pool = Pool([a, b], "least")
+    a.outstanding = 2
+    assert pool.pick() is b
+    pool.strategy = "ewma"
+    a.outstanding = 0
+    pool.seed([{"endpoint": "a", "ttft_ms": 900.0}, {"endpoint": "b", "ttft_ms": 150.0},
+               {"endpoint": "b", "ttft_ms": 5000.0, "exit_code": 1}])
+    assert pool.pick() is b
+
+
+def test_failover_and_ejection():
+    with StubServer(fail=lambda n, m: 503) as bad, StubServer() as good:
+        pool = Pool([Endpoint("bad", "k", bad.url, weight=10_000), Endpoint("good", "k", good.url)])
+        for _ in range(EJECT_AFTER):
+            with pool.lease() as lease:
+                resp = lease.call(create, attempts=1)
+            assert lease.name == "good" and resp.choices[0].message.content
+        assert pool.endpoints[0].ejected_until > 0
+        tried = len(bad.requests)
+        with pool.lease() as lease:
+            lease.call(create, attempts=1)
+        assert lease.name == "good" and len(bad.requests) == tried   # ejected: not even tried
+        assert all(ep.outstanding == 0 for ep in pool.endpoints)
@@ -0,0 +1,71 @@
+import io
+import json
+import threading
+import time
+
+from deepgem.events import EventSink
+
+
+class SlowOut(io.StringIO):
+    """A consumer that takes `delay` seconds per write."""
+
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+
+    def write(self, s):
+        time.sleep(self.delay)
+        return super().write(s)
+
+
+def _events(out):
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_slow_consumer_gets_merged_deltas_without_stalling_the_producer():
+    out = SlowOut(0.05)
+    sink = EventSink("ndjson-stream", out, flush_interval=0)
+    t0 = time.perf_counter()
+    for i in range(500):
+        sink.delta(f"t{i} ")
+    produced = time.perf_counter() - t0
+    sink.emit("usage", prompt_tokens=3)
+    sink.close()
+    events = _events(out)
+    deltas = [e for e in events if e["event"] == "delta"]
+    assert produced < 0.05                      # never waited on the consumer
+    assert len(deltas) < 10                     # 500 tokens arrived in a few merged events
+    assert "".join(d["text"] for d in deltas) == "".join(f"t{i} " for i in range(500))
+    assert events[-1]["event"] == "usage"
+
+
+def test_backpressure_bounds_queued_text():
+    out = SlowOut(0.02)
+    sink = EventSink("ndjson-stream", out, max_bytes=100, flush_interval=0)
+    peak = []
+
+    def produce():
+        for _ in range(50):
+            sink.delta("x" * 20)
+            peak.append(sink.pending)
+
+    t = threading.Thread(target=produce)
+    t.start()
+    t.join(5)
+    sink.close()
+    assert not t.is_alive()
+    assert max(peak) <= 100 + 20
+    assert sum(len(e["text"]) for e in _events(out) if e["event"] == "delta") == 1000
+
+
+def test_jsonl_merges_text_between_structural_events():
+    out = io.StringIO()
+    sink = EventSink("jsonl", out)
+    sink.emit("start", command="chat")
+    for part in ("a", "b", "c"):
+        sink.delta(part)
+    sink.emit("end", exit_code=0)
+    sink.close()
+    assert [(e["event"], e.get("text")) for e in _events(out)] == [
+        ("start", None), ("delta", "abc"), ("end", None),
+    ]
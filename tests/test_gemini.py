@@ -0,0 +1,127 @@
+import sys
+import textwrap
+import time
+
+import pytest
+
+from deepgem.gemini import GeminiTask, fan_out, run_streaming
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="fake gemini is a shebang script")
+
+FAKE_GEMINI = textwrap.dedent(
+    f"""\
+    #!{sys.executable}
+    import sys, time
+    args = sys.argv[1:]
+    prompt = args[args.index("-p") + 1]
+    if prompt.startswith("sleep "):
+        time.sleep(float(prompt.split()[1]))
+    print("args:", " ".join(args))
+    if prompt == "fail":
+        print("boom", file=sys.stderr)
+        sys.exit(3)
+    """
+)
+
+
+@pytest.fixture
+def fake_gemini(tmp_path):
+    path = tmp_path / "gemini"
+    path.write_text(FAKE_GEMINI)
+    path.chmod(0o755)
+    return str(path)
+
+
+def test_fan_out_runs_concurrently_in_order(fake_gemini):
+    tasks = [GeminiTask("sleep 0.4"), GeminiTask("sleep 0.1", "src"), GeminiTask("fail")]
+    t0 = time.perf_counter()
+    results = list(fan_out(tasks, fake_gemini, model="m", max_workers=3))
+    assert time.perf_counter() - t0 < 0.9
+    assert [r.index for r in results] == [0, 1, 2]
+    assert results[1].stdout.strip() == "args: -p sleep 0.1 -m m --include-directories src"
+    assert results[2].returncode == 3 and "boom" in results[2].stderr
+
+
+def test_fan_out_as_completed_and_timeout(fake_gemini):
+    tasks = [GeminiTask("sleep 5"), GeminiTask("hi")]
+    results = list(fan_out(tasks, fake_gemini, max_workers=2, timeout=0.5, ordered=False))
+    assert [r.index for r in results] == [1, 0]
+    assert results[1].timed_out and results[1].returncode == 124
+
+
+def test_closing_fan_out_kills_running_and_drops_queued(fake_gemini):
+    tasks = [GeminiTask("hi"), GeminiTask("sleep 30"), GeminiTask("sleep 30"), GeminiTask("sleep 30")]
+    t0 = time.perf_counter()
+    gen = fan_out(tasks, fake_gemini, max_workers=2, ordered=False)
+    assert next(gen).index == 0
+    gen.close()
+    assert time.perf_counter() - t0 < 10
+
+
+def test_stream_process_lines_and_tail_cap():
+    code = "import sys\nfor i in range(200): print('line', i)\nprint('err', file=sys.stderr)"
+    lines = []
+    res = run_streaming(
+        [sys.executable, "-c", code], max_buffer=64,
+        on_line=lambda stream, line: lines.append((stream, line)),
+    )
+    assert res.returncode == 0 and res.timed_out is None
+    assert ("stdout", "line 199") in lines and ("stderr", "err") in lines
+    assert res.truncated and len(res.stdout.encode()) == 64 and res.stdout.endswith("line 199\n")
+    assert res.stdout_bytes == sum(len(line) + 1 for stream, line in lines if stream == "stdout")
+
+
+def test_idle_timeout_kills_process_tree(tmp_path):
+    marker = tmp_path / "grandchild-alive"
+    grandchild = f"import time; time.sleep(1.5); open({str(marker)!r}, 'w').close()"
+    code = (
+        "import subprocess, sys, time\n"
+        f"subprocess.Popen([sys.executable, '-c', {grandchild!r}])\n"
+        "print('started', flush=True)\n"
+        "time.sleep(30)\n"
+    )
+    res = run_streaming([sys.executable, "-c", code], idle_timeout=0.5, timeout=10)
+    assert res.timed_out == "idle" and res.returncode == 124
+    assert res.stdout == "started\n"
+    time.sleep(1.5)
+    assert not marker.exists()
+
+
+def test_cancelling_kills_process_tree(tmp_path):
+    import asyncio
+    from deepgem.gemini import stream_process
+
+    marker = tmp_path / "grandchild-alive"
+    grandchild = f"import time; time.sleep(1.5); open({str(marker)!r}, 'w').close()"
+    code = (
+        "import subprocess, sys, time\n"
+        f"subprocess.Popen([sys.executable, '-c', {grandchild!r}])\n"
+        "print('started', flush=True)\n"
+        "time.sleep(30)\n"
+    )
+
+    async def main():
+        task = asyncio.ensure_future(stream_process([sys.executable, "-c", code]))
+        await asyncio.sleep(0.5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    t0 = time.monotonic()
+    asyncio.run(main())
+    assert time.monotonic() - t0 < 5
+    time.sleep(1.5)
+    assert not marker.exists()
+
+
+def test_grandchild_holding_pipes_does_not_block_exit():
+    # The child exits at once; a grandchild keeps stdout open for 30s
+    code = (
+        "import subprocess, sys\n"
+        "subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])\n"
+        "print('done', flush=True)\n"
+    )
+    t0 = time.monotonic()
+    res = run_streaming([sys.executable, "-c", code])
+    assert res.returncode == 0 and res.stdout == "done\n"
+    assert time.monotonic() - t0 < 10
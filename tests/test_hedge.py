@@ -0,0 +1,106 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+from openai import OpenAI
+
+from deepgem.hedge import chat_attempts, hedged_call, learned_deadline
+from deepgem.stubs import DEFAULT_REPLY, StubServer
+
+MSGS = [{"role": "user", "content": "hi"}]
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(tmp_path, monkeypatch):
+    from deepgem.scheduler import default_scheduler
+    monkeypatch.setenv("DEEPGEM_CACHE_DIR", str(tmp_path))
+    default_scheduler.cache_clear()
+    yield
+    default_scheduler.cache_clear()
+
+
+def client(stub):
+    return OpenAI(api_key="x", base_url=stub.url, max_retries=0)
+
+
+def test_slow_reasoner_fails_over_to_chat():
+    with StubServer(ttft={"deepseek-reasoner": 3.0}) as stub:
+        t0 = time.monotonic()
+        res = hedged_call(chat_attempts(client(stub), "deepseek-reasoner", MSGS), 0.2)
+        assert time.monotonic() - t0 < 2.0
+    assert res.label == "deepseek-chat"
+    assert res.started == ["deepseek-reasoner", "deepseek-chat"]
+    assert res.content == DEFAULT_REPLY and res.usage["completion_tokens"] > 0
+
+
+def test_duplicate_request_wins_and_fast_calls_are_not_hedged():
+    with StubServer(ttft=lambda n, model: 3.0 if n == 0 else 0.0) as stub:
+        res = hedged_call(chat_attempts(client(stub), "deepseek-chat", MSGS), 0.2)
+        assert res.started == ["deepseek-chat", "deepseek-chat"]
+        res = hedged_call(chat_attempts(client(stub), "deepseek-chat", MSGS), 1.0)
+        assert res.started == ["deepseek-chat"]
+
+
+def test_error_before_first_token_starts_fallback_immediately():
+    with StubServer(fail=lambda n, model: 503 if n == 0 else None) as stub:
+        t0 = time.monotonic()
+        res = hedged_call(chat_attempts(client(stub), "deepseek-chat", MSGS), 30)
+        assert time.monotonic() - t0 < 5
+    assert res.content == DEFAULT_REPLY
+    assert list(res.errors) == ["0:deepseek-chat"]
+
+
+def test_cancelled_losers_do_not_eject_their_endpoint():
+    from deepgem.endpoints import Endpoint, Pool
+    with StubServer(ttft=lambda n, model: 3.0 if n % 2 == 0 else 0.0) as stub:
+        ep = Endpoint("a", "x", stub.url)
+        pool = Pool([ep])
+        for _ in range(4):
+            res = hedged_call(chat_attempts(pool, "deepseek-chat", MSGS), 0.2)
+            assert res.started == ["deepseek-chat", "deepseek-chat"]
+        t0 = time.monotonic()
+        while ep.outstanding and time.monotonic() - t0 < 5:
+            time.sleep(0.05)
+    assert ep.outstanding == 0
+    assert ep.stats["errors"] == 0 and ep.ejected_until == 0.0
+
+
+def test_learned_deadline_needs_enough_samples():
+    recs = [{"engine": "deepseek", "model": "m", "via": "direct", "exit_code": 0, "ttft_ms": float(i)}
+            for i in range(1, 101)]
+    assert learned_deadline("deepseek", "m", recs[:5]) is None
+    assert abs(learned_deadline("deepseek", "m", recs) - 0.09505) < 1e-6
+
+
+def test_chat_cli_hedges_against_stub(tmp_path):
+    log = tmp_path / "metrics.jsonl"
+    with StubServer(ttft={"deepseek-reasoner": 3.0}) as stub:
+        env = dict(
+            os.environ, DEEPSEEK_API_KEY="x", DEEPSEEK_BASE_URL=stub.url, DEEPGEM_NO_BANNER="1",
+            DEEPGEM_NO_DAEMON="1", DEEPGEM_NO_CACHE="1", DEEPGEM_METRICS_LOG=str(log), DEEPGEM_CACHE_DIR=str(tmp_path),
+        )
+        proc = subprocess.run(
+            [sys.executable, "-m", "deepgem", "chat", "-m", "deepseek-reasoner", "--hedge-after", "0.2", "hi"],
+            capture_output=True, text=True, env=env, timeout=30,
+        )
+    assert proc.returncode == 0, proc.stderr
+    assert DEFAULT_REPLY in proc.stdout
+    rec = json.loads(log.read_text().splitlines()[-1])
+    assert rec["via"] == "hedged" and rec["winner"] == "deepseek-chat"
+
+
+def test_deadline_reads_only_the_log_tail(monkeypatch):
+    from deepgem import metrics
+    from deepgem.hedge import hedge_deadline
+    seen = {}
+
+    def load(**kwargs):
+        seen.update(kwargs)
+        return iter([{"engine": "deepseek", "model": "m", "via": "direct", "exit_code": 0, "ttft_ms": 500.0}] * 50)
+
+    monkeypatch.setattr(metrics, "load", load)
+    assert abs(hedge_deadline("m") - 0.5) < 1e-6
+    assert seen == {"tail_bytes": metrics.RECENT_BYTES}
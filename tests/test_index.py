@@ -0,0 +1,43 @@
+import os
+
+from deepgem.index import FileIndex, build_context, terms
+from deepgem.tokens import estimate
+
+
+def test_terms_split_identifiers():
+    assert terms("def parseEnvFile(path)") == ["def", "parseenvfile", "parse", "env", "file", "path"]
+    assert "deepseek" in terms("deepseek_chat()")
+
+
+def test_refresh_rereads_only_changed_files(tmp_path):
+    root = tmp_path / "repo"
+    (root / "pkg").mkdir(parents=True)
+    (root / "node_modules").mkdir()
+    (root / "pkg" / "auth.py").write_text("def refresh_token(session):\n    return session.renew()\n")
+    (root / "pkg" / "math.py").write_text("def add(a, b):\n    return a + b\n")
+    (root / "node_modules" / "dep.js").write_text("refresh token everywhere")
+    (root / "blob.bin").write_bytes(b"\0\1refresh")
+    index = FileIndex(tmp_path / "idx.db")
+
+    assert index.refresh([str(root)]) == {"scanned": 3, "reindexed": 3, "removed": 0}
+    assert index.refresh([str(root)])["reindexed"] == 0
+    # Touched but identical content: hash matches, nothing re-chunked
+    st = (root / "pkg" / "math.py").stat()
+    os.utime(root / "pkg" / "math.py", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert index.refresh([str(root)])["reindexed"] == 0
+    (root / "pkg" / "math.py").unlink()
+    assert index.refresh([str(root)])["removed"] == 1
+
+    hits = index.search("how do I refresh the token?", [str(root)])
+    assert [os.path.basename(h.path) for h in hits] == ["auth.py"]
+
+
+def test_context_respects_budget(tmp_path):
+    root = tmp_path / "repo"
+    root.mkdir()
+    for i in range(20):
+        (root / f"f{i}.txt").write_text(f"cache eviction policy number {i}\n" + "filler words " * 200)
+    context, st = build_context("cache eviction", str(root), budget=1500, index=FileIndex(tmp_path / "i.db"))
+    assert 0 < st["chunks"] < 20
+    assert estimate(context) <= 1500
+    assert context.count("### repo/") == st["chunks"]
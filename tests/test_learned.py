@@ -0,0 +1,50 @@
+from deepgem.learned import LearnedRouter, featurize, load_outcomes, record, reward
+from deepgem.router import Router
+
+PROMPT = "summarise this incident report for the on-call channel"
+
+
+def test_untrained_model_agrees_with_keyword_router():
+    model, rules = LearnedRouter(), Router()
+    for p in ("fix the failing unit test", "hello there", "think step by step about it", "x" * 2000):
+        assert model.route(p, rules.route(p)).engine == rules.route(p).engine
+
+
+def test_overrides_and_failures_move_the_decision(tmp_path):
+    log = tmp_path / "router.jsonl"
+    for _ in range(10):
+        # The user keeps forcing the reasoner for incident summaries...
+        record(PROMPT, "deepseek-reasoner", 0, 4000, 900, predicted="deepseek-chat", forced=True, path=log)
+        # ...and the chat model keeps failing on them
+        record(PROMPT, "deepseek-chat", 1, 800, None, path=log)
+    assert "override" in next(iter(load_outcomes(log)))
+    model = LearnedRouter()
+    model.fit(load_outcomes(log))
+    model.save(tmp_path / "model.json")
+    loaded = LearnedRouter.load(tmp_path / "model.json")
+    assert loaded.route(PROMPT).engine == "deepseek-reasoner"
+    assert loaded.route("fix the failing unit test").engine == "gemini"   # unrelated prompts keep the rules
+    top = loaded.explain(PROMPT).top["deepseek-reasoner"]
+    assert top and all(isinstance(name, str) for name, _ in top)
+
+
+def test_wrong_shaped_model_file_is_ignored(tmp_path):
+    path = tmp_path / "model.json"
+    for text in ("[]", "{}", '{"weights": []}', '{"weights": {"gemini": {"x": 1.0}}}'):
+        path.write_text(text)
+        assert LearnedRouter.load(path) is None
+
+
+def test_reward_and_features():
+    assert reward(False, 10, 10) == 0.0
+    assert reward(True, 100, 100) > reward(True, 30_000, 100) > 0
+    assert featurize(PROMPT) == featurize(PROMPT)          # stable hashing
+
+
+def test_scoring_work_is_bounded_by_max_words():
+    from deepgem.learned import MAX_WORDS
+    huge = " ".join(f"word{i}" for i in range(10 * MAX_WORDS))
+    prior = Router().route(huge)
+    # bias, length bucket, rule pick (no fence, no keyword matches) on top of the capped words
+    assert len(featurize(huge, prior)) <= MAX_WORDS + 3
+    assert LearnedRouter().route(huge, prior).engine == prior.engine
@@ -0,0 +1,112 @@
+import os
+import subprocess
+import sys
+import threading
+
+from deepgem.mapreduce import chunk_text, reduce_levels, run_map
+from deepgem.stubs import DEFAULT_REPLY, StubServer
+from deepgem.tokens import estimate
+
+
+def test_chunks_fit_budget_and_overlap():
+    lines = [f"line {i:04d} " + "x" * 30 + "\n" for i in range(200)]
+    chunks = list(chunk_text(iter(lines), chunk_tokens=100, overlap_tokens=20))
+    assert len(chunks) > 10
+    assert all(estimate(c) <= 100 for c in chunks)
+    for a, b in zip(chunks, chunks[1:]):
+        assert a.splitlines()[-1] in b.splitlines()[:3]   # tail of one chunk opens the next
+    assert "line 0000" in chunks[0] and "line 0199" in chunks[-1]
+
+
+def test_map_reads_ahead_only_a_bounded_amount():
+    pulled = []
+    release = threading.Event()
+
+    def chunks():
+        for i in range(50):
+            pulled.append(i)
+            yield f"chunk {i}"
+
+    def complete(prompt):
+        release.wait(5)
+        return "ok"
+
+    t = threading.Thread(target=lambda: results.extend(run_map(chunks(), "task", complete, concurrency=2)))
+    results = []
+    t.start()
+    t.join(0.3)
+    assert len(pulled) <= 5   # 2 workers x 2 read-ahead, plus the one waiting for a slot
+    release.set()
+    t.join(5)
+    assert [p.index for p in results] == list(range(50))
+
+
+def test_reduce_groups_until_one_call_fits():
+    calls = []
+
+    def complete(prompt):
+        calls.append(prompt)
+        return "summary"
+
+    texts = reduce_levels("task", ["y" * 300] * 8, complete, budget_tokens=100)   # 50 tokens each
+    assert texts == ["summary"] * 4 and len(calls) == 4
+
+
+def test_chat_input_map_reduces_against_stub(tmp_path):
+    log = tmp_path / "big.log"
+    log.write_text("".join(f"event {i} " + "z" * 60 + "\n" for i in range(100)))
+    with StubServer() as stub:
+        env = dict(
+            os.environ, DEEPSEEK_API_KEY="x", DEEPSEEK_BASE_URL=stub.url, DEEPGEM_NO_BANNER="1",
+            DEEPGEM_NO_DAEMON="1", DEEPGEM_CACHE_DIR=str(tmp_path),
+        )
+        proc = subprocess.run(
+            [sys.executable, "-m", "deepgem", "chat", "-i", str(log), "--chunk-tokens", "500", "count events"],
+            capture_output=True, text=True, env=env, timeout=60,
+        )
+        parts = proc.stderr.count("map: part")
+        assert proc.returncode == 0, proc.stderr
+        assert DEFAULT_REPLY in proc.stdout
+        assert parts > 2 and len(stub.requests) == parts + 1
+
+
+def test_unreadable_later_input_fails_before_any_call(tmp_path):
+    log = tmp_path / "big.log"
+    log.write_text("".join(f"event {i} " + "z" * 60 + "\n" for i in range(100)))
+    with StubServer() as stub:
+        env = dict(
+            os.environ, DEEPSEEK_API_KEY="x", DEEPSEEK_BASE_URL=stub.url, DEEPGEM_NO_BANNER="1",
+            DEEPGEM_NO_DAEMON="1", DEEPGEM_CACHE_DIR=str(tmp_path),
+        )
+        proc = subprocess.run(
+            [sys.executable, "-m", "deepgem", "chat", "-i", str(log), "-i", str(tmp_path / "nope.log"),
+             "--chunk-tokens", "500", "count events"],
+            capture_output=True, text=True, env=env, timeout=60,
+        )
+        assert proc.returncode == 2
+        assert "Can't read input" in proc.stdout + proc.stderr and "nope.log" in proc.stdout + proc.stderr
+        assert not stub.requests
+
+
+def test_failed_reduce_keeps_its_group_unreduced():
+    errors = []
+
+    def complete(prompt):
+        if "<result 1>\nbad" in prompt:
+            raise RuntimeError("503 busy")
+        return "summary"
+
+    texts = reduce_levels(
+        "task", ["bad" + "y" * 297] + ["y" * 300] * 7, complete, budget_tokens=100,
+        on_error=lambda level, group, error: errors.append((level, group, error)),
+    )
+    assert errors and errors[0] == (1, 0, "503 busy")
+    assert any(t.startswith("bad") for t in texts)
+
+
+def test_reduce_stops_when_every_call_fails():
+    def complete(prompt):
+        raise RuntimeError("down")
+
+    partials = ["y" * 300] * 8
+    assert reduce_levels("task", partials, complete, budget_tokens=100) == partials
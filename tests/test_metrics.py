@@ -0,0 +1,44 @@
+from deepgem.metrics import CallTimer, aggregate, percentile
+
+
+def test_percentile_interpolates():
+    assert percentile([], 50) is None
+    assert percentile([10], 99) == 10
+    assert percentile([1, 2, 3, 4], 50) == 2.5
+    assert percentile(list(range(101)), 95) == 95
+
+
+def test_call_timer_record_uses_usage():
+    timer = CallTimer("deepseek", "deepseek-chat")
+    for text in ("a", "b", "c"):
+        timer.chunk(text)
+    timer.usage = {"prompt_tokens": 9, "completion_tokens": 3, "prompt_cache_hit_tokens": 6}
+    rec = timer.finish()
+    assert rec["chunks"] == 3 and rec["chars"] == 3
+    assert rec["ttft_ms"] <= rec["total_ms"]
+    assert (rec["prompt_tokens"], rec["completion_tokens"], rec["cached_tokens"]) == (9, 3, 6)
+
+
+def test_aggregate_groups_by_engine_and_model():
+    recs = [
+        {"engine": "deepseek", "model": "deepseek-chat", "ttft_ms": t, "total_ms": 2 * t, "exit_code": 0}
+        for t in (100, 200, 300)
+    ] + [{"engine": "gemini", "model": None, "ttft_ms": None, "total_ms": 50, "exit_code": 1}]
+    rows = {(r["engine"], r["model"]): r for r in aggregate(recs)}
+    ds = rows[("deepseek", "deepseek-chat")]
+    assert ds["calls"] == 3 and ds["ttft_p50"] == 200 and ds["total_p50"] == 400
+    assert rows[("gemini", None)]["errors"] == 1 and rows[("gemini", None)]["ttft_p50"] is None
+
+
+def test_log_rotates_and_readers_see_both_files(tmp_path, monkeypatch):
+    from deepgem.metrics import append, load, rotated_path
+    log = tmp_path / "metrics.jsonl"
+    monkeypatch.setenv("DEEPGEM_METRICS_MAX_MB", str(20_000 / 2**20))
+    for i in range(400):
+        append({"i": i, "pad": "x" * 100}, log)
+    assert log.stat().st_size <= 20_000 + 200 and rotated_path(log).exists()
+    seen = [r["i"] for r in load(log)]
+    assert seen == sorted(seen) and seen[-1] == 399 and len(seen) < 400
+    current = [r["i"] for r in load(log, tail_bytes=log.stat().st_size)]
+    tail = [r["i"] for r in load(log, tail_bytes=log.stat().st_size + 1200)]   # reaches into the rotated log
+    assert tail[-len(current):] == current and tail == sorted(tail) and len(tail) > len(current)
@@ -0,0 +1,36 @@
+import time
+
+from openai import OpenAI
+
+from deepgem.probes import connection_timings, run_checks, spawn_check, ttft_check
+from deepgem.stubs import StubServer, write_fake_gemini
+
+
+def test_checks_run_concurrently_with_a_shared_timeout():
+    def slow():
+        time.sleep(5)
+        return "never", {}
+
+    def boom():
+        raise RuntimeError("refused")
+
+    t0 = time.monotonic()
+    res = run_checks({"a": lambda: ("ok", {"x_ms": 1.0}), "slow": slow, "boom": boom}, timeout=0.3)
+    assert time.monotonic() - t0 < 1
+    assert res["a"].ok and res["a"].timings == {"x_ms": 1.0}
+    assert not res["slow"].ok and "timed out" in res["slow"].error
+    assert res["boom"].error == "refused"
+
+
+def test_latency_probes_against_stubs(tmp_path):
+    fake = write_fake_gemini(tmp_path / "gemini")
+    with StubServer(ttft={"deepseek-chat": 0.2}) as stub:
+        client = OpenAI(api_key="x", base_url=stub.url, max_retries=0)
+        res = run_checks({
+            "net": connection_timings(stub.url),
+            "ttft": ttft_check(client, "deepseek-chat"),
+            "spawn": spawn_check(str(fake)),
+        }, timeout=10)
+    assert res["net"].detail.startswith("HTTP 200") and res["net"].timings["tls_ms"] is None
+    assert res["ttft"].timings["ttft_ms"] >= 200
+    assert res["spawn"].detail == "v0.0.0-stub"
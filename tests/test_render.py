@@ -0,0 +1,52 @@
+import io
+
+from deepgem.render import MarkdownRenderer, StreamRenderer
+
+
+class CountingIO(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+        self.flushes = 0
+
+    def write(self, s):
+        self.writes += 1
+        return super().write(s)
+
+    def flush(self):
+        self.flushes += 1
+
+
+def test_piped_output_is_coalesced():
+    out = CountingIO()
+    r = StreamRenderer(out, interactive=False, flush_bytes=1000)
+    for _ in range(600):
+        r.write("tok ")
+    r.close()
+    assert out.getvalue() == "tok " * 600 + "\n"
+    assert out.writes == 3 and out.flushes == 3
+
+
+def test_interactive_output_is_immediate():
+    out = CountingIO()
+    r = StreamRenderer(out, interactive=True)
+    r.write("a")
+    assert out.getvalue() == "a" and out.flushes == 1
+
+
+def test_bad_flush_interval_env_is_ignored(monkeypatch):
+    monkeypatch.setenv("DEEPGEM_FLUSH_INTERVAL", "fast")
+    assert StreamRenderer(CountingIO(), interactive=False).flush_interval is None
+    monkeypatch.setenv("DEEPGEM_FLUSH_INTERVAL", "0.05")
+    assert StreamRenderer(CountingIO(), interactive=False).flush_interval == 0.05
+
+
+def test_markdown_blocks_commit_outside_fences():
+    from rich.console import Console
+
+    r = MarkdownRenderer(Console(file=io.StringIO(), force_terminal=True))
+    r.write("para one\n\n```\ncode\n\nmore code\n")
+    assert r.pending == "```\ncode\n\nmore code\n"  # blank line inside the fence didn't split
+    r.write("```\n\nafter")
+    assert r.pending == "after"
+    r.close()
@@ -0,0 +1,72 @@
+import json
+
+from deepgem.router import Router, legacy_pick_engine, route_rows
+
+
+def test_whole_words_only():
+    r = Router()
+    assert r.route("Tell me about classic literature").engine == "deepseek-chat"
+    assert r.route("Why does this Python class fail?").engine == "gemini"
+    assert r.route("add unit tests for the parser").matches == ["unit test"]
+
+
+def test_matches_legacy_on_plain_prompts():
+    for prompt in [
+        "fix the bug in my react app",
+        "Please think step by step about tax policy",
+        "hello there",
+        "lorem ipsum dolor sit amet " * 70,
+    ]:
+        assert Router().route(prompt).engine == legacy_pick_engine(prompt)
+
+
+def test_long_prompt_threshold_counts_tokens():
+    r = Router()
+    assert r.route("x" * 1300).engine == "deepseek-chat"       # long, but only ~200 tokens
+    assert r.route("lorem ipsum dolor sit amet " * 70).engine == "deepseek-reasoner"
+    assert Router(long_prompt_chars=1200).route("x" * 1300).engine == "deepseek-reasoner"
+
+
+def test_user_rules_file_weights(tmp_path):
+    rules = tmp_path / "rules.json"
+    rules.write_text(json.dumps({
+        "threshold": 2,
+        "rules": [
+            {"match": "kubernetes", "engine": "gemini", "weight": 2},
+            {"match": "explain", "engine": "gemini", "weight": -1},
+        ],
+    }))
+    r = Router.from_file(rules)
+    assert r.route("kubernetes ingress").engine == "gemini"
+    assert r.route("explain kubernetes ingress").engine == "deepseek-chat"
+    assert r.route("python code").engine == "gemini"
+
+
+def test_route_rows():
+    out = list(route_rows([{"id": 1, "prompt": "write a script"}, {"id": 2, "prompt": "hi"}]))
+    assert [(o["id"], o["engine"]) for o in out] == [(1, "gemini"), (2, "deepseek-chat")]
+    bad = list(route_rows([{"id": 3, "prompt": ["hi"]}]))
+    assert bad == [{"id": 3, "error": "prompt must be a string, got list"}]
+
+
+def test_bad_rules_file_falls_back_with_file_and_line(tmp_path, monkeypatch, capsys):
+    import pytest
+    from deepgem.router import RulesError, default_router
+    rules = tmp_path / "rules.json"
+    rules.write_text('{\n  "rules": [\n    {"match": "k8s", "engine": "gemni"}\n  ]\n}\n')
+    with pytest.raises(RulesError, match=r"rules.json:3: rule 1 has unknown engine 'gemni'"):
+        Router.from_file(rules)
+    rules.write_text('{\n  "rules": [\n    {"match": "k8s",}\n  ]\n}\n')
+    with pytest.raises(RulesError, match=r"rules.json:3: invalid JSON"):
+        Router.from_file(rules)
+    rules.write_text('{"long_prompt_chars": "lots"}\n')
+    with pytest.raises(RulesError, match=r"rules.json:1: invalid literal"):
+        Router.from_file(rules)
+
+    monkeypatch.setenv("DEEPGEM_RULES", str(rules))
+    default_router.cache_clear()
+    try:
+        assert default_router().route("python code").engine == "gemini"
+        assert "ignoring routing rules" in capsys.readouterr().err
+    finally:
+        default_router.cache_clear()
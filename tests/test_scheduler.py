@@ -0,0 +1,68 @@
+import time
+
+import pytest
+from openai import OpenAI
+
+from deepgem.scheduler import CircuitOpen, Scheduler
+from deepgem.stubs import StubServer
+
+MSGS = [{"role": "user", "content": "hi"}]
+
+
+def test_buckets_are_shared_through_the_state_file(tmp_path):
+    a = Scheduler(tmp_path / "s.json", rpm=2, tpm=1000)
+    b = Scheduler(tmp_path / "s.json", rpm=2, tpm=1000)   # stands in for another process
+    assert a.reserve(10) == 0 and b.reserve(10) == 0
+    assert 25 < a.reserve(10) <= 30                        # third request waits for a refill
+    assert b.reserve(0) > 0
+
+
+def test_429_honours_retry_after(tmp_path):
+    with StubServer(fail=lambda n, model: 429 if n < 2 else None, retry_after=0.2) as stub:
+        client = OpenAI(api_key="x", base_url=stub.url, max_retries=0)
+        sched = Scheduler(tmp_path / "s.json")
+        retries = []
+        t0 = time.monotonic()
+        resp = sched.call(
+            lambda: client.chat.completions.create(model="deepseek-chat", messages=MSGS),
+            on_retry=lambda attempt, delay, exc: retries.append(delay),
+        )
+        assert resp.choices[0].message.content
+        assert retries == [0.2, 0.2]
+        assert time.monotonic() - t0 >= 0.4
+        assert len(stub.requests) == 3
+
+
+def test_breaker_opens_and_fails_fast(tmp_path):
+    with StubServer(fail=lambda n, model: 503) as stub:
+        client = OpenAI(api_key="x", base_url=stub.url, max_retries=0)
+        sched = Scheduler(tmp_path / "s.json", max_attempts=2, breaker_failures=2)
+        sched.backoff = lambda attempt, exc: 0.0
+
+        def create():
+            return client.chat.completions.create(model="deepseek-chat", messages=MSGS)
+
+        with pytest.raises(Exception):
+            sched.call(create)
+        with pytest.raises(CircuitOpen):
+            sched.call(create)
+        assert len(stub.requests) == 2
+
+
+def test_unlimited_calls_never_write_state(tmp_path):
+    path = tmp_path / "s.json"
+    sched = Scheduler(path)
+    assert sched.call(lambda: "ok") == "ok" and not path.exists()
+    sched.record("rate", 60)                  # a 429 elsewhere blocks everyone
+    assert sched.reserve() > 50
+    path.write_text('{"breaker": {}}')
+    mtime = path.stat().st_mtime_ns
+    assert sched.reserve() == 0 and path.stat().st_mtime_ns == mtime
+
+
+def test_malformed_retry_after_is_ignored():
+    import types
+    from deepgem.scheduler import retry_after
+    for value in ("soon", "Mon, 99 Foo 2025 25:61:00 GMT", "12abc"):
+        exc = types.SimpleNamespace(response=types.SimpleNamespace(headers={"retry-after": value}))
+        assert retry_after(exc) is None
@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+
+from deepgem.sessions import Session, list_sessions, usage_totals
+
+
+def test_append_only_round_trip(tmp_path):
+    sess = Session("work", tmp_path)
+    sess.set_system("be brief")
+    sess.record("hi", "hello", {"prompt_tokens": 10, "prompt_cache_hit_tokens": 0})
+    size = sess.path.stat().st_size
+    sess.record("again", "sure", {"prompt_tokens": 20, "prompt_cache_hit_tokens": 8})
+    with open(sess.path, "rb") as f:
+        assert len(f.read()) > size
+    loaded = Session("work", tmp_path)
+    assert loaded.system == "be brief"
+    assert [m["content"] for m in loaded.messages] == ["hi", "hello", "again", "sure"]
+    assert usage_totals(loaded) == {"prompt_tokens": 30, "cached_tokens": 8}
+    assert [s.name for s in list_sessions(tmp_path)] == ["work"]
+
+
+def test_trim_keeps_prefix_stable(tmp_path):
+    sess = Session("long", tmp_path)
+    sess.set_system("sys")
+    for i in range(40):
+        sess.record(f"question {i} " + "x" * 400, f"answer {i} " + "y" * 400)
+    budget = 2000
+    first = sess.context("next", budget)
+    # System prompt and the first exchange are pinned, newest turns kept
+    assert first[0] == {"role": "system", "content": "sys"}
+    assert first[1]["content"].startswith("question 0 ")
+    assert first[2]["content"].startswith("answer 0 ")
+    assert first[3]["role"] == "user"
+    assert first[-2]["content"].startswith("answer 39 ")
+    # The next turns reuse the same cut, so everything already sent stays a prefix
+    sess.record("next", "ok")
+    second = sess.context("more", budget)
+    assert second[:len(first) - 1] == first[:-1]
+    # The cut is persisted for later processes
+    lines = sess.path.read_text().splitlines()
+    trims = [json.loads(line) for line in lines if '"trim"' in line]
+    assert len(trims) == 1
+    assert Session("long", tmp_path).start == trims[0]["trim"]
+
+
+def test_cli_rejects_bad_names_and_cache_flags(tmp_path):
+    env = dict(os.environ, DEEPGEM_SESSION_DIR=str(tmp_path), DEEPGEM_NO_BANNER="1", HOME=str(tmp_path))
+
+    def run(*args):
+        return subprocess.run([sys.executable, "-m", "deepgem", *args], capture_output=True, text=True, env=env, timeout=30)
+
+    for args in (("session", "show", "../etc"), ("session", "rm", "a b"), ("chat", "-S", "ok", "--refresh", "hi"),
+                 ("chat", "-S", "ok", "--similar", "0.98", "hi")):
+        proc = run(*args)
+        assert proc.returncode == 2 and "Traceback" not in proc.stderr, args
@@ -0,0 +1,24 @@
+import os
+import subprocess
+import sys
+
+from deepgem.stubs import StubServer, write_fake_gemini
+
+
+def test_setup_runs_end_to_end_into_doctor(tmp_path):
+    gemini = write_fake_gemini(tmp_path / "gemini", ttft=0, tokens_per_s=1000, reply="ok")
+    with StubServer() as stub:
+        env = dict(
+            os.environ, HOME=str(tmp_path), DEEPSEEK_API_KEY="sk-test", DEEPSEEK_BASE_URL=stub.url,
+            GEMINI_BIN=str(gemini), GEMINI_API_KEY="test", DEEPGEM_CACHE_DIR=str(tmp_path / "cache"),
+            DEEPGEM_NO_BANNER="1",
+        )
+        env.pop("DEEPGEM_ENDPOINTS", None)
+        proc = subprocess.run(
+            [sys.executable, "-m", "deepgem", "setup"], input="N\n", env=env,
+            capture_output=True, text=True, timeout=60, cwd=tmp_path,
+        )
+    assert proc.returncode == 0, proc.stderr
+    assert "Traceback" not in proc.stderr
+    assert "deepgem doctor" in proc.stdout
+    assert "DeepSeek API: connected successfully" in proc.stdout
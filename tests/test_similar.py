@@ -0,0 +1,60 @@
+import random
+import time
+
+from deepgem.cache import ResponseCache
+from deepgem.similar import bands, normalize, simhash, split_request, to_signed
+
+PROMPT = (
+    "Summarize the incident for order 1234567 at 2025-03-04T10:22:33Z, request id "
+    "3f2a9c1e-1b2c-4d5e-8f90-a1b2c3d4e5f6. The customer said the checkout page timed out twice."
+)
+
+
+def test_normalize_masks_volatile_values():
+    assert normalize("At  10:22:33\n\tID 3F2A9C1E77 ") == "at <time> id <hex>"
+    assert "what is 2+2" in normalize("What is 2+2")  # short numbers are content, not ids
+
+
+def test_near_duplicates_hit_and_different_prompts_miss(tmp_path):
+    store = ResponseCache(tmp_path / "c.db", ttl=0)
+    msgs = [{"role": "system", "content": "be brief"}, {"role": "user", "content": PROMPT}]
+    scope, text = split_request("deepseek-chat", msgs)
+    store.put("k", "deepseek-chat", "answer")
+    store.put_similar("k", scope, simhash(text), normalize(text))
+
+    def find(prompt, scope=scope):
+        return store.find_similar(scope, simhash(prompt), normalize(prompt), 0.95)
+
+    variant = PROMPT.replace("1234567", "7654321").replace("10:22:33", "11:01:02") + "  "
+    entry, sim = find(variant)
+    assert entry["content"] == "answer" and sim >= 0.95
+    assert find("Summarize the refund flow. The customer said the payment page crashed.") is None
+    # A different system prompt is a different scope
+    other_scope, _ = split_request("deepseek-chat", [{"role": "user", "content": PROMPT}])
+    assert find(PROMPT, other_scope) is None
+    assert store.stats()["similar_hits"] == 1
+
+
+def test_fingerprint_collision_is_not_served(tmp_path):
+    store = ResponseCache(tmp_path / "c.db", ttl=0)
+    safe = "rm -rf /tmp --no-preserve-root to clean up the build box, then reboot it"
+    risky = "rm -rf / --no-preserve-root to clean up the build box, then reboot it"
+    store.put("k", "deepseek-chat", "sure, run it")
+    store.put_similar("k", "s", simhash(safe), normalize(safe))
+    assert store.find_similar("s", simhash(risky), normalize(risky), 0.95) is None
+
+
+def test_lookup_stays_fast_with_many_entries(tmp_path):
+    store = ResponseCache(tmp_path / "c.db", ttl=0)
+    rnd = random.Random(0)
+    rows = []
+    for i in range(100_000):
+        fp = rnd.getrandbits(64)
+        rows.append((f"k{i}", "s", to_signed(fp), *bands(fp)))
+    store.db.execute("BEGIN")
+    store.db.executemany("INSERT INTO near (key, scope, fp, b0, b1, b2, b3) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    store.db.execute("COMMIT")
+    t0 = time.perf_counter()
+    for _ in range(200):
+        store.find_similar("s", rnd.getrandbits(64), "text", 0.95)
+    assert (time.perf_counter() - t0) / 200 < 0.005
@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+
+from deepgem.bench import parse_importtime, startup_profile
+
+# Generous default so slow CI hosts pass; tighten locally with DEEPGEM_STARTUP_BUDGET_MS
+BUDGET_MS = float(os.environ.get("DEEPGEM_STARTUP_BUDGET_MS", "400"))
+
+
+def test_cli_import_defers_heavy_sdks():
+    code = "import sys, deepgem.cli; print(sorted(m for m in ('openai', 'rich') if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
+
+
+def test_cold_start_within_budget():
+    prof = startup_profile(runs=3)
+    assert 0 < prof["import_ms"] < BUDGET_MS, prof["modules"][:10]
+
+
+def test_parse_importtime():
+    stderr = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   json.decoder\n"
+        "import time:       300 |        420 | json\n"
+    )
+    assert parse_importtime(stderr) == [("json.decoder", 120, 120), ("json", 300, 420)]
+
+
+def test_bad_timeouts_warn_instead_of_raising(monkeypatch, capsys):
+    from deepgem.config import reload_config
+    monkeypatch.setenv("DEEPGEM_GEMINI_TIMEOUT", "30s")
+    monkeypatch.setenv("DEEPGEM_GEMINI_IDLE_TIMEOUT", "15")
+    try:
+        cfg = reload_config()
+        assert (cfg.gemini_timeout, cfg.gemini_idle_timeout) == (None, 15.0)
+        assert "ignoring DEEPGEM_GEMINI_TIMEOUT='30s'" in capsys.readouterr().err
+    finally:
+        monkeypatch.undo()
+        reload_config()
@@ -0,0 +1,95 @@
+import os
+import subprocess
+import sys
+
+from deepgem.stubs import StubServer
+from deepgem.tokens import cost, estimate, estimate_many, fit_messages, truncate_middle
+
+
+# Fixed mix of prose, markdown and code, so the ratio check doesn't drift with the docs
+CORPUS = """\
+## Response cache
+Replies are cached on disk, keyed on the model and the full message list. Entries
+expire after a day and the least recently used ones are evicted past 100 MB.
+
+```bash
+deepgem chat --no-cache "what changed in the last release?"
+deepgem cache stats             # location, size, hit rate
+```
+
+def percentile(values, q):
+    \"\"\"Linear-interpolated percentile (q in 0..100); None for no data.\"\"\"
+    if not values:
+        return None
+    xs = sorted(values)
+    pos = (len(xs) - 1) * q / 100
+    return xs[int(pos)]
+
+The scheduler retries 429s and transient 5xx errors with jittered exponential
+backoff, or after the Retry-After the server asks for, and opens a circuit
+breaker after five consecutive failures so calls fail fast for thirty seconds.
+"""
+
+
+def test_estimates_are_in_a_sane_range():
+    assert estimate("") == 0
+    assert estimate("Hello, how are you today?") == 7
+    assert 3.0 < len(CORPUS) / estimate(CORPUS) < 4.5      # typical BPE chars/token
+    assert estimate("你好世界") >= 2
+    assert estimate_many(["a b c", "getUserName"]) == [3, 3]
+
+
+def test_fit_messages_and_truncation(monkeypatch):
+    monkeypatch.setenv("DEEPGEM_CONTEXT_LIMIT", str(5_000 + 4_096))
+    small = [{"role": "user", "content": "hi"}]
+    assert fit_messages(small, "deepseek-chat")[1]["status"] == "ok"
+    big = [{"role": "system", "content": "be brief"}, {"role": "user", "content": "word " * 8000}]
+    assert fit_messages(big, "deepseek-chat")[1]["status"] == "over"
+    fitted, info = fit_messages(big, "deepseek-chat", truncate=True)
+    assert info["status"] == "truncated" and info["tokens"] <= 5_000
+    assert fitted[0] == big[0] and "truncated" in fitted[1]["content"]
+    assert len(truncate_middle("x " * 100, 500)) == 200
+    # Cutting the longest message isn't enough: the others are cut too, and if even that fails it says so
+    many = [{"role": "user", "content": "word " * 3000} for _ in range(3)]
+    assert fit_messages(many, "deepseek-chat", truncate=True)[1]["status"] == "truncated"
+    monkeypatch.setenv("DEEPGEM_CONTEXT_LIMIT", str(40 + 4_096))
+    assert fit_messages(many * 4, "deepseek-chat", truncate=True)[1]["status"] == "still_over"
+
+
+def test_cost_uses_cache_hits():
+    full = cost("deepseek-chat", 1_000_000, 0)
+    assert cost("deepseek-chat", 1_000_000, 0, cached_tokens=1_000_000) < full
+    assert cost("gemini", 10) is None
+
+
+def test_malformed_price_overrides_are_skipped(monkeypatch, capsys):
+    monkeypatch.setenv("DEEPGEM_PRICES", '{"deepseek-chat": [1, 2], "mine": [1.0, 0.1, 2.0]}')
+    assert cost("deepseek-chat", 1_000_000) == 0.28 and cost("mine", 1_000_000) == 1.0
+    assert "ignoring DEEPGEM_PRICES entry 'deepseek-chat'" in capsys.readouterr().err
+
+
+def test_bad_context_limit_falls_back(monkeypatch, capsys):
+    from deepgem.tokens import DEFAULT_CONTEXT_LIMIT, context_limit
+    monkeypatch.setenv("DEEPGEM_CONTEXT_LIMIT", "128k")
+    assert context_limit("deepseek-chat") == DEFAULT_CONTEXT_LIMIT - 4_096
+    assert "ignoring DEEPGEM_CONTEXT_LIMIT" in capsys.readouterr().err
+
+
+def test_oversized_prompt_is_refused_before_sending(tmp_path):
+    prompt = "word " * 8000
+    with StubServer() as stub:
+        env = dict(
+            os.environ, DEEPSEEK_API_KEY="x", DEEPSEEK_BASE_URL=stub.url, DEEPGEM_NO_BANNER="1",
+            DEEPGEM_NO_DAEMON="1", DEEPGEM_CACHE_DIR=str(tmp_path), DEEPGEM_CONTEXT_LIMIT="9000",
+        )
+
+        def run(*extra):
+            return subprocess.run(
+                [sys.executable, "-m", "deepgem", "chat", "--no-cache", *extra, prompt],
+                capture_output=True, text=True, env=env, timeout=60,
+            )
+
+        refused = run()
+        assert refused.returncode == 2 and "not sent" in refused.stderr and not stub.requests
+        sent = run("--truncate")
+        assert sent.returncode == 0 and len(stub.requests) == 1
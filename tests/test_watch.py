@@ -0,0 +1,67 @@
+import os
+import sys
+import threading
+import time
+
+from deepgem.watch import Tree, Watcher, render_diffs, run_loop, scan
+
+
+def test_tree_tracks_content_not_mtime(tmp_path):
+    f = tmp_path / "a.py"
+    f.write_text("x = 1\n")
+    tree = Tree([str(tmp_path)])
+    start = tree.state()
+    os.utime(f, ns=(1, 1))
+    assert tree.refresh({str(f): (1, f.stat().st_size)}) == []       # touched, same content
+    f.write_text("x = 2\n")
+    st = f.stat()
+    assert tree.refresh({str(f): (st.st_mtime_ns, st.st_size)}) == [str(f)]
+    assert tree.state() != start
+    f.write_text("x = 1\n")
+    tree.refresh({str(f): (st.st_mtime_ns + 1, st.st_size)})
+    assert tree.state() == start
+
+
+def test_render_diffs_covers_edits_additions_and_budget(tmp_path):
+    (tmp_path / "a.py").write_text("x = 1\ny = 2\n")
+    tree = Tree([str(tmp_path)])
+    baseline = dict(tree.texts)
+    (tmp_path / "a.py").write_text("x = 1\ny = 3\n")
+    (tmp_path / "b.py").write_text("z = 0\n")
+    tree.refresh(scan(tree.roots))
+    diff = render_diffs(tree, baseline)
+    assert "-y = 2\n+y = 3" in diff and "--- /dev/null" in diff and "+z = 0" in diff
+    assert "diff omitted" in render_diffs(tree, baseline, budget=5)
+
+
+def test_loop_cancels_obsolete_runs_and_replays_unchanged_inputs(tmp_path):
+    f = tmp_path / "a.txt"
+    f.write_text("one\n")
+    started, notes, out = [], [], []
+
+    def build_cmd(text, with_context):
+        started.append((text, with_context))
+        return [sys.executable, "-c", "import time; time.sleep(0.6); print('reply')"]
+
+    def edits():
+        time.sleep(1.2)                 # first run done
+        f.write_text("two\n")
+        time.sleep(0.4)                 # its run is in flight...
+        f.write_text("three\n")         # ...and now obsolete
+        time.sleep(1.5)
+        f.write_text("one\n")           # back to the first inputs
+        time.sleep(0.6)
+        done.set()
+
+    done = threading.Event()
+    threading.Thread(target=edits, daemon=True).start()
+    run_loop(
+        Watcher([str(tmp_path)], interval=0.05, debounce=0.1), "review", build_cmd,
+        notes.append, lambda stream, line: out.append(line), stop=done.is_set,
+    )
+    assert started[0] == ("review", True)
+    assert not any(ctx for _, ctx in started[1:])       # later runs get diffs, not the directories
+    assert "-one\n+three" in started[2][0]                # diffed against the last completed run
+    assert any("cancelled" in n for n in notes)
+    assert any("replaying" in n for n in notes)
+    assert len(started) == 3            # the revert was served without a run